@@ -2,8 +2,8 @@
 import requests
 import ambi_logger
 import utils
-import ast
 from mysql_database.python_database_modules import mysql_auth_controller as mac
+from ThingsBoard_REST_API import tb_http_client
 
 
 # --------------------------------------------------------------------- CUSTOM CLASSES -------------------------------------------------------------------------
@@ -90,14 +90,14 @@ def getSecuritySettings():
     service_dict = utils.build_service_calling_info(mac.get_auth_token(user_type='sys_admin'), service_endpoint)
 
     try:
-        response = requests.get(url=service_dict["url"], headers=service_dict["headers"])
-    except (requests.exceptions.ConnectionError, requests.exceptions.ConnectTimeout) as ce:
+        response = tb_http_client.get(url=service_dict["url"], headers=service_dict["headers"])
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as ce:
         error_msg = "Could not get a response from {0}...".format(str(service_dict['url']))
         security_set_log.error(error_msg)
         raise ce
 
     # There's a possibility that a non-admin authorization token can be used at this point. If that's the case, the request will return the appropriate response
-    if response.status_code == 403 and ast.literal_eval(response.text)["errorCode"] == 20:
+    if response.status_code == 403 and utils.decode_json_response(response.text)["errorCode"] == 20:
         # Throw the relevant exception if that is the case
         error_msg = "The authorization token provided does not have admin privileges!"
         security_set_log.error(error_msg)
@@ -121,8 +121,8 @@ def checkUpdates():
     service_dict = utils.build_service_calling_info(mac.get_auth_token(user_type='sys_admin'), service_endpoint)
 
     try:
-        response = requests.get(url=service_dict["url"], headers=service_dict["headers"])
-    except (requests.exceptions.ConnectionError, requests.exceptions.ConnectTimeout) as ce:
+        response = tb_http_client.get(url=service_dict["url"], headers=service_dict["headers"])
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as ce:
         error_msg = "Could not get a response from {0}...".format(str(service_dict['url']))
         check_updates_log.error(error_msg)
         raise ce
@@ -5,6 +5,7 @@ import ambi_logger
 import utils
 import urllib.parse
 from mysql_database.python_database_modules import mysql_auth_controller as mac
+from ThingsBoard_REST_API import tb_http_client
 
 
 def getAssetTypes():
@@ -35,15 +36,15 @@ def getAssetTypes():
     service_dict = utils.build_service_calling_info(mac.get_auth_token(user_type='tenant_admin'), service_endpoint)
 
     try:
-        response = requests.get(url=service_dict['url'], headers=service_dict['headers'])
-    except (requests.exceptions.ConnectionError, requests.exceptions.ConnectTimeout) as ce:
+        response = tb_http_client.get(url=service_dict['url'], headers=service_dict['headers'])
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as ce:
         error_msg = "Could not get a request from {0}...".format(str(service_dict['url']))
         asset_types_log.error(error_msg)
         raise ce
 
     # Check the status code of the HTTP response before moving forward
     if response.status_code != 200:
-        error_msg = "Request unsuccessful: Received an HTTP {0} with message {1}.".format(str(eval(response.text)['status']), str(eval(response.text)['message']))
+        error_msg = "Request unsuccessful: Received an HTTP {0} with message {1}.".format(str(utils.decode_json_response(response.text)['status']), str(utils.decode_json_response(response.text)['message']))
         asset_types_log.error(error_msg)
         raise utils.ServiceEndpointException(message=error_msg)
     else:
@@ -51,7 +52,7 @@ def getAssetTypes():
         return response
 
 
-def getTenantAssets(type=None, textSearch=None, idOffset=None, textOffset=None, limit=10):
+def getTenantAssets(type=None, textSearch=None, idOffset=None, textOffset=None, limit=10, warn_on_next=True):
     """This is the standard method to retrieve all ASSETs currently in the ThingsBoard installation database (regardless which database is implemented). As with all services of this type so far, this is the ThingsBoard side of the whole process,
     the one that places a request in the expected format to the ThingsBoard API.
     @:param type (str): OPTIONAL Use this argument to filter the results for a specific asset type (eg. 'building', 'room', 'floor', etc...) This is a free text field from the ThingsBoard side, which means any string can be set in this field. If you
@@ -64,6 +65,7 @@ def getTenantAssets(type=None, textSearch=None, idOffset=None, textOffset=None,
     @:param textOffset (str): OPTIONAL So far, still no idea of what this does. Other than determining that it only accepts strings, I still have no clue to what is the actual purpose of this element.
     @:param limit (int): Use this field to limit the number of results returned from this service. If the argument in this field prevents the full scope of results to be returned, a specific set of structures, namely a 'nextPageLink' and
     'hasNext' are also returned. In this event, the method warn the caller that are results left to return but in the end is up to the caller to specify an higher limit value to return them.
+    @:param warn_on_next (bool) - Set this flag to False to skip the warning about the results left to return in the remote API (when 'hasNext' comes back True). The tb_pagination iterators, which request the next pages themselves, do just that
     @:return result (list of dict): If the API call was successful, this method returns an HTTP response object back with the following dictionary in its 'text' field:
     "data": [
     # ASSET 1 data
@@ -187,21 +189,21 @@ def getTenantAssets(type=None, textSearch=None, idOffset=None, textOffset=None,
 
     # And try to get a response from the remote API
     try:
-        response = requests.get(url=service_dict['url'], headers=service_dict['headers'])
-    except (requests.exceptions.ConnectionError, requests.exceptions.ConnectTimeout) as ce:
+        response = tb_http_client.get(url=service_dict['url'], headers=service_dict['headers'])
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as ce:
         error_msg = "Could not get a response from {0}...".format(str(service_dict['url']))
         asset_control_log.error(error_msg)
         raise ce
 
     # Check the HTTP response code first
     if response.status_code != 200:
-        error_msg = "Request unsuccessful: Received an HTTP " + str(eval(response.text)['status']) + " with message: " + str(eval(response.text)['message'])
+        error_msg = "Request unsuccessful: Received an HTTP " + str(utils.decode_json_response(response.text)['status']) + " with message: " + str(utils.decode_json_response(response.text)['message'])
         asset_control_log.error(error_msg)
         raise utils.ServiceEndpointException(message=error_msg)
     else:
         # Check if the 'hasNext' flag is set, i.e., if there are still results to return from the ThingsBoard side of things. In any case, the result structure has that flag set to either 'true' or 'false', which are not recognized as proper
         # boolean values by Python (those are boolean natives from Postgres/Cassandra). As such, I need to 'translate' the returned text to Python-esque first using the method built for that purpose
-        if eval(utils.translate_postgres_to_python(response.text))['hasNext']:
+        if warn_on_next and utils.decode_json_response(response.text)['hasNext']:
             asset_control_log.warning("Only {0} results returned. There are still more results to return from the remote API side. Increase the 'limit' argument to obtain them.".format(str(limit)))
 
         # But return the response nonetheless
@@ -6,6 +6,7 @@ import user_config
 import ambi_logger
 import proj_config
 from mysql_database.python_database_modules import mysql_utils
+from ThingsBoard_REST_API import tb_http_client
 
 
 def get_session_tokens(sys_admin=True, tenant_admin=True, customer_user=True):
@@ -62,8 +63,8 @@ def get_session_tokens(sys_admin=True, tenant_admin=True, customer_user=True):
             data = '{"username": "' + str(user_config.access_info[user_type]['username']) + '", "password": "' + str(user_config.access_info[user_type]['password']) + '"}'
 
             try:
-                response = requests.post(url=url, headers=headers, data=data)
-            except (requests.exceptions.ConnectionError, requests.exceptions.ConnectTimeout):
+                response = tb_http_client.post(url=url, headers=headers, data=data)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
                 error_msg = "Unable to establish connection with {0}. Exiting...".format(str(user_config.access_info['host'] + ": " + str(user_config.access_info['port'])))
                 session_tokens_log.error(error_msg)
                 raise utils.ServiceEndpointException(message=error_msg)
@@ -76,7 +77,7 @@ def get_session_tokens(sys_admin=True, tenant_admin=True, customer_user=True):
 
             # Otherwise, fill out the corresponding auth_dict entry
             else:
-                auth_dict[user_type] = eval(response.text)
+                auth_dict[user_type] = utils.decode_json_response(response.text)
 
     # Done. Return the authentication structures
     return auth_dict
@@ -199,8 +200,8 @@ def refresh_session_token(sys_admin=False, tenant_admin=False, customer_user=Fal
 
             # And call the remote API with the refresh request
             try:
-                api_response = requests.post(url=con_dict['url'], headers=con_dict['headers'], data=data)
-            except (requests.exceptions.ConnectionError, requests.exceptions.ConnectTimeout):
+                api_response = tb_http_client.post(url=con_dict['url'], headers=con_dict['headers'], data=data)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
                 error_msg = "Unable to establish a connection with {0}:{1}. Exiting...".format(str(user_config.thingsboard_host), str(user_config.thingsboard_port))
                 refresh_token_log.error(error_msg)
                 select_cursor.close()
@@ -210,7 +211,7 @@ def refresh_session_token(sys_admin=False, tenant_admin=False, customer_user=Fal
             # If a non-HTTP 200 status code was returned, its probably a credential issue. Raise an exception with the proper information in it
             if api_response.status_code != 200:
                 # Check first if the status code is HTTP 401 and if the sub-errorCode is 11, which means that the refresh token for this user_type is also expired. In this case I can always request a new pair instead of raising an Exception
-                if api_response.status_code == 401 and eval(api_response.text)['errorCode'] == 11:
+                if api_response.status_code == 401 and utils.decode_json_response(api_response.text)['errorCode'] == 11:
                     user_type = result[column_list.index('user_type')]
                     refresh_token_log.warning("The refresh token for user_type '{0}' is also expired. Requesting a new pair...".format(str(user_type)))
 
@@ -229,7 +230,7 @@ def refresh_session_token(sys_admin=False, tenant_admin=False, customer_user=Fal
 
             # Got a pair of valid tokens back. Update the structures then
             else:
-                auth_dict[result[column_list.index('user_type')]] = eval(api_response.text)
+                auth_dict[result[column_list.index('user_type')]] = utils.decode_json_response(api_response.text)
 
             # And grab the next result for another iteration of this
             result = select_cursor.fetchone()
@@ -278,6 +279,6 @@ def getUser(auth_token):
     service_dict = utils.build_service_calling_info(auth_token=auth_token, service_endpoint=service_endpoint)
 
     # And execute the damn thing
-    response = requests.get(url=service_dict['url'], headers=service_dict['headers'])
+    response = tb_http_client.get(url=service_dict['url'], headers=service_dict['headers'])
 
     return response
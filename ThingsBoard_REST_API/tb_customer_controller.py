@@ -5,9 +5,10 @@ import ambi_logger
 import utils
 import urllib.parse
 from mysql_database.python_database_modules import mysql_auth_controller as mac
+from ThingsBoard_REST_API import tb_http_client
 
 
-def getCustomers(textSearch=None, idOffset=None, textOffset=None, limit=10):
+def getCustomers(textSearch=None, idOffset=None, textOffset=None, limit=10, warn_on_next=True):
     """This in one of the simplest GET methods in the customer-controller section of the ThingsBoard API. With it I only need to provide a valid limit number and I can request a list of all registered customers in the platform so far,
     so that I can then populate my own MySQL database table with them.
     All parameters initialized to None in the method signature are OPTIONAL (textSearch, idOffset and textOffset). Those that were set to specific values and data types are MANDATORY (limit)
@@ -20,6 +21,7 @@ def getCustomers(textSearch=None, idOffset=None, textOffset=None, limit=10):
     waiting for a test that can shed any light on what this... thing... really does. Leave it empty or write your favorite poem in it: its all the same for the remote API really...
     @:param limit (int) - Use this field to limit the number of results returned, regardless of other limiters around. If the limit field did truncates the set of returned results, the result dictionary is returned with its 'nextPageLink' key set
     to another dictionary describing just that and the 'hasNext' key is set to True. Otherwise, if all records were returned, 'nextPageLink' is set to NULL and 'hasNext' is returned set to False.
+    @:param warn_on_next (bool) - Set this flag to False to skip the warning about the results left to return in the remote API (when 'hasNext' comes back True). The tb_pagination iterators, which request the next pages themselves, do just that
     @:raise utils.InputValidationException - For errors during the validation of inputs
     @:raise utils.ServiceEndpointException - For errors occurring during the interface with the remote API
     @:raise Exception - For any other types of errors
@@ -109,20 +111,20 @@ def getCustomers(textSearch=None, idOffset=None, textOffset=None, limit=10):
 
     # Query the remote API
     try:
-        response = requests.get(url=service_dict['url'], headers=service_dict['headers'])
-    except (requests.exceptions.ConnectionError, requests.exceptions.ConnectTimeout) as ce:
+        response = tb_http_client.get(url=service_dict['url'], headers=service_dict['headers'])
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as ce:
         error_msg = "Could not get a request from {0}...".format(str(service_dict['url']))
         customer_log.error(error_msg)
         raise ce
 
     # Check the status code of the HTTP response before moving forward
     if response.status_code != 200:
-        error_msg = "Request unsuccessful: Received an HTTP {0} with message {1}.".format(str(eval(response.text)['status']), str(eval(response.text)['message']))
+        error_msg = "Request unsuccessful: Received an HTTP {0} with message {1}.".format(str(utils.decode_json_response(response.text)['status']), str(utils.decode_json_response(response.text)['message']))
         customer_log.error(error_msg)
         raise utils.ServiceEndpointException(message=error_msg)
     else:
         # Check the status of the 'hasNext' parameter returned
-        if eval(utils.translate_postgres_to_python(response.text))['hasNext']:
+        if warn_on_next and utils.decode_json_response(response.text)['hasNext']:
             customer_log.warning("Only {0} results returned. There are still more results to return from the remote API side. Increase the 'limit' argument to obtain them.".format(str(limit)))
 
         return response
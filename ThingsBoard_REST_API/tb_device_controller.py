@@ -6,6 +6,7 @@ import proj_config
 import user_config
 import urllib.parse
 from mysql_database.python_database_modules import mysql_utils, mysql_auth_controller as mac
+from ThingsBoard_REST_API import tb_http_client
 
 
 def getDeviceTypes():
@@ -21,8 +22,8 @@ def getDeviceTypes():
 
     # Execute the service call
     try:
-        response = requests.get(url=service_dict["url"], headers=service_dict["headers"])
-    except (requests.exceptions.ConnectionError, requests.exceptions.ConnectTimeout) as ce:
+        response = tb_http_client.get(url=service_dict["url"], headers=service_dict["headers"])
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as ce:
         error_msg = "Could not get a response from {0}...".format(str(service_dict['url']))
         device_types_log.error(error_msg)
         raise ce
@@ -31,7 +32,7 @@ def getDeviceTypes():
 
 
 #def getTenantDevices(type=None, textSearch=None, idOffset=None, textOffset=None, limit=10):
-def getTenantDevices(type=None, textSearch=None, sortProperty=None, sortOrder=None, pageSize=10, page=10):
+def getTenantDevices(type=None, textSearch=None, sortProperty=None, sortOrder=None, pageSize=10, page=10, warn_on_next=True):
     """GET method to retrieve the list of devices with their associations, namely Tenants and Customers. The indexer of the returned list is the DEVICE (or its id to be more precise).
     @:type user_types allowed for this service: CUSTOMER_USER
     @:param type (str) - Use this field to narrow down the type of device to return. The type referred in this field is the custom device type defined by the user upon its creation (e.g., 'Thermometer', 'Water meter' and so on) and this field is
@@ -47,6 +48,7 @@ def getTenantDevices(type=None, textSearch=None, sortProperty=None, sortOrder=No
     @:param textOffset (str) - Still no clue what this field does... Leave it empty or write your whole life story in it and it always returns the full result set... (If none of the other fields are filled)
     @:param limit (int) - Use this field to limit the number of results returned, regardless of other limiters around (the other fields of the method). If the limit field did truncated the results returned, the result dictionary is returned with
     the 'nextPageLink' key set to another dictionary describing just that and the 'hasNext' key is set to True. Otherwise, if all record were returned, 'nextPageLink' is set to NULL and 'hasNext' comes back set to False.
+    @:param warn_on_next (bool) - Set this flag to False to skip the warning about the results left to return in the remote API (when 'hasNext' comes back True). The tb_pagination iterators, which request the next pages themselves, do just that
     @:raise utils.InputValidationException - For errors during the validation of inputs
     @:raise utils.ServiceEndpointException - For errors during the API operation
     @:raise Exception - For any other types of errors
@@ -163,26 +165,26 @@ def getTenantDevices(type=None, textSearch=None, sortProperty=None, sortOrder=No
 
     # Try to get a response from the remote API
     try:
-        response = requests.get(url=service_dict['url'], headers=service_dict['headers'])
-    except (requests.exceptions.ConnectionError, requests.exceptions.ConnectTimeout) as ce:
+        response = tb_http_client.get(url=service_dict['url'], headers=service_dict['headers'])
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as ce:
         error_msg = "Could not get a response from {0}...".format(str(service_dict['url']))
         tenant_device_log.error(error_msg)
         raise ce
 
     # If I got a response, check first if it was the expected HTTP 200 OK
     if response.status_code != 200:
-        error_msg = "Request unsuccessful: Received an HTTP " + str(eval(response.text)['status']) + " with message: " + str(eval(response.text)['message'])
+        error_msg = "Request unsuccessful: Received an HTTP " + str(utils.decode_json_response(response.text)['status']) + " with message: " + str(utils.decode_json_response(response.text)['message'])
         tenant_device_log.error(error_msg)
         raise utils.ServiceEndpointException(message=error_msg)
     else:
         # Before sending the result back, check first the status of the 'hasNext' key in the result dictionary and inform the user that, if it is True, there are results still left to return in the remote API server
-        if eval(utils.translate_postgres_to_python(response.text))['hasNext']:
-            tenant_device_log.warning("Only {0} results returned. There are still more results to return from the remote API side. Increase the 'limit' argument to obtain them.".format(str(limit)))
+        if warn_on_next and utils.decode_json_response(response.text)['hasNext']:
+            tenant_device_log.warning("Only {0} results returned. There are still more results to return from the remote API side. Request the next page to obtain them.".format(str(pageSize)))
 
         return response
 
 
-def getCustomerDevices(customer_name, type=None, textSearch=None, idOffset=None, textOffset=None, limit=50):
+def getCustomerDevices(customer_name, type=None, textSearch=None, idOffset=None, textOffset=None, limit=50, warn_on_next=True):
     """Method that executes a GET request to the device-controller.getCustomerDevice service to the remote API in order to obtain a list of devices associated with the customer identified by 'customer_name'. For now, this method then sends that
     information to be used to update the ambiosensing_thingsboard.thingsboard_devices_tables. This method is but a subset of the getTenantDevices method from this own module in the sense that, by specifying a user during the method call,
     the list of devices returned is limited to just the devices assigned to this customer while the getTenantDevices returns the list of all devices, as long as they are assigned to a tenant, regardless of whom that tenant may be.
@@ -198,6 +200,7 @@ def getCustomerDevices(customer_name, type=None, textSearch=None, idOffset=None,
     @:param textOffset (str) - Still no clue on what this might be used for...
     @:param limit (int) - Use this field to truncate the number of returned results. If the result set returned from the remote API was truncated for whatever reason, the result dictionary is returned with another dictionary under the
     'nextPageLink' key detailing the results still to be returned and the 'hasNext' key set to True. Otherwise 'nextPageLink' is set to NULL and 'hasNext' to False
+    @:param warn_on_next (bool) - Set this flag to False to skip the warning about the results left to return in the remote API (when 'hasNext' comes back True). The tb_pagination iterators, which request the next pages themselves, do just that
     @:raise utils.InputValidationException - For errors during the validation of inputs
     @:raise utils.ServiceEndpoointException - For error during the remote API access
     @:raise Exception - For any other errors
@@ -340,21 +343,21 @@ def getCustomerDevices(customer_name, type=None, textSearch=None, idOffset=None,
 
     # Query the remote API
     try:
-        response = requests.get(url=service_dict['url'], headers=service_dict['headers'])
-    except (requests.exceptions.ConnectionError, requests.exceptions.ConnectTimeout) as ce:
+        response = tb_http_client.get(url=service_dict['url'], headers=service_dict['headers'])
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as ce:
         error_msg = "Could not get a response from {0}...".format(str(service_dict['url']))
         customer_device_log.error(error_msg)
         raise utils.ServiceEndpointException(message=ce)
 
     # If I got a response, check first if it was the expected HTTP 200 OK
     if response.status_code != 200:
-        error_msg = "Request unsuccessful: Received an HTTP " + str(eval(response.text)['status']) + " with message: " + str(eval(response.text)['message'])
+        error_msg = "Request unsuccessful: Received an HTTP " + str(utils.decode_json_response(response.text)['status']) + " with message: " + str(utils.decode_json_response(response.text)['message'])
         customer_device_log.error(error_msg)
         raise utils.ServiceEndpointException(message=error_msg)
     else:
         # I got a valid results, it appears. Check if the number of results returned was truncated by the limit parameter. If so, warn the user only (there's no need to raise Exceptions on this matter)
         # Translate the results to Python-speak first before going for the comparison given that this result set was returned from a MySQL backend
-        if eval(utils.translate_postgres_to_python(response.text))['hasNext']:
+        if warn_on_next and utils.decode_json_response(response.text)['hasNext']:
             customer_device_log.warning("Only {0} results returned. There are still results to return from the remote API side. Increase the 'limit' argument to obtain them.".format(str(limit)))
 
     # I'm good then. Return the result set back
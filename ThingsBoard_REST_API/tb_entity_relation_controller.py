@@ -5,6 +5,7 @@ import ambi_logger
 import utils
 import proj_config
 from mysql_database.python_database_modules import mysql_auth_controller as mac
+from ThingsBoard_REST_API import tb_http_client
 
 
 def findByQuery(entityType, entityId, direction, relationTypeGroup):
@@ -22,7 +23,7 @@ def findByQuery(entityType, entityId, direction, relationTypeGroup):
     @:raise utils.InputValidationException - If the input arguments fail initial validation
     @:raise utils.ServiceEndpointException - If the call to the remote API was not successful
     @:raise utils.AuthenticationException - For errors related with the authentication token exchange with the remote API calls
-    @:return result (list of dicts) - A list of dictionaries with the following structure (use eval(result.text) to retrieve the element in the dictionary format from the str format in which it is returned):
+    @:return result (list of dicts) - A list of dictionaries with the following structure (use utils.decode_json_response(result.text) to retrieve the element in the dictionary format from the str format in which it is returned):
     [
       {
         "from": {
@@ -114,15 +115,15 @@ def findByQuery(entityType, entityId, direction, relationTypeGroup):
 
     # Done. I'm ready to call the service then
     try:
-        response = requests.post(url=service_dict['url'], headers=service_dict['headers'], data=data_payload)
-    except (requests.exceptions.ConnectionError, requests.exceptions.ConnectTimeout) as ce:
+        response = tb_http_client.post(url=service_dict['url'], headers=service_dict['headers'], data=data_payload)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as ce:
         error_msg = "Could not get a response from {0}...".format(str(service_dict['url']))
         entity_relation_log.error(error_msg)
         raise ce
 
     # Check if the response code came back a nice HTTP 200
     if response.status_code != 200:
-        error_msg = "Request unsuccessful: Received an HTTP " + str(eval(response.text)['status']) + " with message: " + str(eval(response.text)['message'])
+        error_msg = "Request unsuccessful: Received an HTTP " + str(utils.decode_json_response(response.text)['status']) + " with message: " + str(utils.decode_json_response(response.text)['message'])
         entity_relation_log.error(error_msg)
         raise utils.ServiceEndpointException(message=error_msg)
     else:
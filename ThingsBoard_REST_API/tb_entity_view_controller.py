@@ -4,6 +4,7 @@ import utils
 import requests
 import ambi_logger
 from mysql_database.python_database_modules import mysql_auth_controller as mac
+from ThingsBoard_REST_API import tb_http_client
 
 
 def getEntityViewTypes():
@@ -25,8 +26,8 @@ def getEntityViewTypes():
     service_dict = utils.build_service_calling_info(mac.get_auth_token(user_type='tenant_admin'), service_endpoint)
 
     try:
-        response = requests.get(url=service_dict["url"], headers=service_dict["headers"])
-    except (requests.exceptions.ConnectionError, requests.exceptions.ConnectTimeout) as ce:
+        response = tb_http_client.get(url=service_dict["url"], headers=service_dict["headers"])
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as ce:
         error_msg = "Could not get a response from {0}...".format(str(service_dict['url']))
         get_entity_view_log.error(error_msg)
         raise ce
@@ -0,0 +1,92 @@
+""" Place holder for the HTTP client shared by all the ThingsBoard REST API controllers. Instead of firing bare requests.get/post calls, which open (and close) a brand new TCP (and TLS) connection for every single request and wait forever for a
+response, all the controllers go through a single requests.Session with a pool of keep-alive connections to the ThingsBoard server and proper connect/read timeouts. The pool size, the timeouts and the keep-alive behaviour are set in
+proj_config.py """
+
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+import proj_config
+import ambi_logger
+
+# The shared session is only created when the first request is placed, and only once, even if several threads try to do it at the same time
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    This method returns the shared requests.Session, creating it first if needed. The session mounts an HTTPAdapter with a pool of up to proj_config.tb_http_pool_maxsize connections per host, so that multiple threads (the concurrent device data
+    collection, for instance) can each reuse an open connection instead of setting up a new one per request.
+    @:return session (requests.Session) - The session shared by all the ThingsBoard REST API calls
+    """
+    global _session
+
+    # Double checked locking: the lock is only taken if the session doesn't exist yet
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                log = ambi_logger.get_logger(__name__)
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=proj_config.tb_http_pool_connections, pool_maxsize=proj_config.tb_http_pool_maxsize)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+
+                if not proj_config.tb_http_keep_alive:
+                    # Ask the server to drop the connection after each response instead
+                    session.headers['Connection'] = 'close'
+
+                log.info("Created a new HTTP session for the ThingsBoard REST API (pool size = {0}, timeouts = {1}, keep-alive = {2})".format(str(proj_config.tb_http_pool_maxsize), str(get_timeout()),
+                                                                                                                                              str(proj_config.tb_http_keep_alive)))
+                _session = session
+
+    return _session
+
+
+def get_timeout():
+    """
+    Simple method to return the (connect, read) timeout tuple, in seconds, that is set in every request
+    @:return timeout (tuple) - A (connect timeout, read timeout) tuple, as expected by the requests package
+    """
+    return proj_config.tb_http_connect_timeout, proj_config.tb_http_read_timeout
+
+
+def get(url, headers=None, **kwargs):
+    """
+    The pooled equivalent to requests.get. Use it exactly like this one, with the url and headers returned by utils.build_service_calling_info.
+    @:param url (str) - The url of the service to call
+    @:param headers (dict) - The headers of the request
+    @:param kwargs - Any other arguments accepted by requests.get (a specific timeout, for instance)
+    @:raise requests.exceptions.ConnectionError - If the connection to the server fails
+    @:raise requests.exceptions.Timeout - If the server takes longer than the timeouts set to connect or to respond
+    @:return response (requests.Response) - The response from the remote server
+    """
+    kwargs.setdefault('timeout', get_timeout())
+    return get_session().get(url=url, headers=headers, **kwargs)
+
+
+def post(url, headers=None, data=None, **kwargs):
+    """
+    The pooled equivalent to requests.post. Use it exactly like this one, with the url and headers returned by utils.build_service_calling_info.
+    @:param url (str) - The url of the service to call
+    @:param headers (dict) - The headers of the request
+    @:param data (str) - The body of the request
+    @:param kwargs - Any other arguments accepted by requests.post (a specific timeout, for instance)
+    @:raise requests.exceptions.ConnectionError - If the connection to the server fails
+    @:raise requests.exceptions.Timeout - If the server takes longer than the timeouts set to connect or to respond
+    @:return response (requests.Response) - The response from the remote server
+    """
+    kwargs.setdefault('timeout', get_timeout())
+    return get_session().post(url=url, headers=headers, data=data, **kwargs)
+
+
+def close_session():
+    """
+    This method closes all the pooled connections and drops the shared session. The next request creates a new one.
+    """
+    global _session
+
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
@@ -0,0 +1,159 @@
+""" Place holder for generic methods to go through all the pages of results returned by the ThingsBoard REST API list services (getTenantDevices, getCustomerDevices, getTenantAssets, getCustomers and getTenants) """
+
+import concurrent.futures
+import ambi_logger
+import utils
+import proj_config
+from ThingsBoard_REST_API import tb_device_controller, tb_asset_controller, tb_customer_controller, tb_tenant_controller
+
+
+def iterate_page_number_records(page_method, page_size=None, **kwargs):
+    """
+    Generic iterator for the list services that are paginated with a page size and a page number (pageSize=n&page=i, as in tb_device_controller.getTenantDevices). The iterator yields the records from the 'data' list of each page, one by one,
+    and keeps requesting the next page while the remote API reports 'hasNext' as True. The next page is requested in the background as soon as the current one arrives, so that it is already on its way (or even here) while the records of
+    the current page are being processed by the caller.
+    @:param page_method (function) - The tb_*_controller method that requests a single page. It has to accept 'pageSize' and 'page' arguments and return the HTTP response object
+    @:param page_size (int) - The number of records to request per page. Uses proj_config.tb_page_size if omitted
+    @:param kwargs - Any other arguments to pass to the page_method in every call (type, textSearch, etc.)
+    @:raise utils.InputValidationException - If any of the inputs fails validation
+    @:raise utils.ServiceEndpointException - For errors during the remote API access
+    @:return record (dict) - Each one of the records returned, across all pages
+    """
+    if page_size is None:
+        page_size = proj_config.tb_page_size
+
+    utils.validate_input_type(page_size, int)
+
+    def next_page_kwargs(response_dict, page_kwargs):
+        return {'pageSize': page_kwargs['pageSize'], 'page': page_kwargs['page'] + 1}
+
+    return _iterate_records(page_method=page_method, method_kwargs=kwargs, first_page_kwargs={'pageSize': page_size, 'page': 0}, get_next_page_kwargs=next_page_kwargs)
+
+
+def iterate_page_link_records(page_method, limit=None, **kwargs):
+    """
+    Generic iterator for the list services that are paginated with a limit and a 'nextPageLink' dictionary (limit=n&idOffset=...&textOffset=..., as in tb_asset_controller.getTenantAssets). The iterator yields the records from the 'data' list
+    of each page, one by one, and keeps requesting the next page, using the idOffset and textOffset from the 'nextPageLink' of the previous one, while the remote API reports 'hasNext' as True. As with iterate_page_number_records, the next page
+    is requested in the background while the current one is being processed by the caller.
+    @:param page_method (function) - The tb_*_controller method that requests a single page. It has to accept 'limit', 'idOffset' and 'textOffset' arguments and return the HTTP response object
+    @:param limit (int) - The number of records to request per page. Uses proj_config.tb_page_size if omitted
+    @:param kwargs - Any other arguments to pass to the page_method in every call (type, textSearch, etc.)
+    @:raise utils.InputValidationException - If any of the inputs fails validation
+    @:raise utils.ServiceEndpointException - For errors during the remote API access
+    @:return record (dict) - Each one of the records returned, across all pages
+    """
+    log = ambi_logger.get_logger(__name__)
+
+    if limit is None:
+        limit = proj_config.tb_page_size
+
+    utils.validate_input_type(limit, int)
+
+    def next_page_kwargs(response_dict, page_kwargs):
+        next_page_link = response_dict.get('nextPageLink', None)
+
+        if not next_page_link:
+            log.warning("The remote API reported more results to return but didn't send a 'nextPageLink' to get them with. Stopping at this page.")
+            return None
+
+        next_kwargs = {'limit': page_kwargs['limit'], 'idOffset': next_page_link.get('idOffset', None), 'textOffset': next_page_link.get('textOffset', None)}
+
+        # Make sure the offsets did move. Otherwise this would request the same page forever
+        if next_kwargs['idOffset'] == page_kwargs['idOffset'] and next_kwargs['textOffset'] == page_kwargs['textOffset']:
+            log.warning("The 'nextPageLink' returned by the remote API points to the same page that was just retrieved. Stopping at this page.")
+            return None
+
+        return next_kwargs
+
+    return _iterate_records(page_method=page_method, method_kwargs=kwargs, first_page_kwargs={'limit': limit, 'idOffset': None, 'textOffset': None}, get_next_page_kwargs=next_page_kwargs)
+
+
+def iterate_tenant_devices(type=None, textSearch=None, sortProperty=None, sortOrder=None, page_size=None):
+    """
+    Iterates through all the devices returned by tb_device_controller.getTenantDevices, page by page (check that method for details on the arguments and the format of each device record)
+    @:param page_size (int) - The number of devices to request per page. Uses proj_config.tb_page_size if omitted
+    @:return device (dict) - Each device record returned by the remote API
+    """
+    return iterate_page_number_records(page_method=tb_device_controller.getTenantDevices, page_size=page_size, warn_on_next=False, type=type, textSearch=textSearch, sortProperty=sortProperty, sortOrder=sortOrder)
+
+
+def iterate_customer_devices(customer_name, type=None, textSearch=None, page_size=None):
+    """
+    Iterates through all the devices returned by tb_device_controller.getCustomerDevices for the customer provided, page by page (check that method for details on the arguments and the format of each device record)
+    @:param page_size (int) - The number of devices to request per page. Uses proj_config.tb_page_size if omitted
+    @:return device (dict) - Each device record returned by the remote API
+    """
+    return iterate_page_link_records(page_method=tb_device_controller.getCustomerDevices, limit=page_size, warn_on_next=False, customer_name=customer_name, type=type, textSearch=textSearch)
+
+
+def iterate_tenant_assets(type=None, textSearch=None, page_size=None):
+    """
+    Iterates through all the assets returned by tb_asset_controller.getTenantAssets, page by page (check that method for details on the arguments and the format of each asset record)
+    @:param page_size (int) - The number of assets to request per page. Uses proj_config.tb_page_size if omitted
+    @:return asset (dict) - Each asset record returned by the remote API
+    """
+    return iterate_page_link_records(page_method=tb_asset_controller.getTenantAssets, limit=page_size, warn_on_next=False, type=type, textSearch=textSearch)
+
+
+def iterate_customers(textSearch=None, page_size=None):
+    """
+    Iterates through all the customers returned by tb_customer_controller.getCustomers, page by page (check that method for details on the arguments and the format of each customer record)
+    @:param page_size (int) - The number of customers to request per page. Uses proj_config.tb_page_size if omitted
+    @:return customer (dict) - Each customer record returned by the remote API
+    """
+    return iterate_page_link_records(page_method=tb_customer_controller.getCustomers, limit=page_size, warn_on_next=False, textSearch=textSearch)
+
+
+def iterate_tenants(textSearch=None, page_size=None):
+    """
+    Iterates through all the tenants returned by tb_tenant_controller.getTenants, page by page (check that method for details on the arguments and the format of each tenant record)
+    @:param page_size (int) - The number of tenants to request per page. Uses proj_config.tb_page_size if omitted
+    @:return tenant (dict) - Each tenant record returned by the remote API
+    """
+    return iterate_page_link_records(page_method=tb_tenant_controller.getTenants, limit=page_size, warn_on_next=False, textSearch=textSearch)
+
+
+def _request_page(page_method, page_kwargs):
+    """
+    Requests a single page of results and decodes it.
+    @:param page_method (function) - The tb_*_controller method that requests a single page
+    @:param page_kwargs (dict) - The arguments to call it with
+    @:return response_dict (dict) - The decoded page, i.e., a dictionary with (at least) the 'data' and 'hasNext' keys
+    """
+    response = page_method(**page_kwargs)
+
+    return utils.decode_json_response(response.text)
+
+
+def _iterate_records(page_method, method_kwargs, first_page_kwargs, get_next_page_kwargs):
+    """
+    The actual generator behind the iterate_* methods. It keeps a single background worker that requests the next page while the records of the current one are being yielded, which means that there's at most one page being requested and
+    one being processed at any given time.
+    @:param page_method (function) - The tb_*_controller method that requests a single page
+    @:param method_kwargs (dict) - The arguments to pass to every page_method call
+    @:param first_page_kwargs (dict) - The pagination arguments for the first page
+    @:param get_next_page_kwargs (function) - Function that receives the decoded current page and its pagination arguments and returns the pagination arguments for the next page (or None if there's no way to get it)
+    @:return record (dict) - Each one of the records returned, across all pages
+    """
+    page_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    try:
+        page_kwargs = first_page_kwargs
+        page_future = page_executor.submit(_request_page, page_method, dict(method_kwargs, **page_kwargs))
+
+        while page_future is not None:
+            response_dict = page_future.result()
+
+            # Get the next page on its way before handing out the records from the current one
+            page_future = None
+            if response_dict.get('hasNext', False):
+                page_kwargs = get_next_page_kwargs(response_dict, page_kwargs)
+
+                if page_kwargs is not None:
+                    page_future = page_executor.submit(_request_page, page_method, dict(method_kwargs, **page_kwargs))
+
+            for record in response_dict['data']:
+                yield record
+    finally:
+        # If the caller stops the iteration halfway, there's no need to wait for a page that is never going to be used
+        page_executor.shutdown(wait=False)
@@ -5,6 +5,7 @@ import ambi_logger
 import utils
 import json
 from mysql_database.python_database_modules import mysql_auth_controller as mac
+from ThingsBoard_REST_API import tb_http_client
 
 
 def handleOneWayDeviceRPCRequests(deviceId, remote_method, param_dict=None):
@@ -60,8 +61,8 @@ def handleOneWayDeviceRPCRequests(deviceId, remote_method, param_dict=None):
 
     # Done. Set things in motion then
     try:
-        response = requests.post(url=service_dict["url"], headers=service_dict["headers"], data=json.dumps(data))
-    except (requests.exceptions.ConnectionError, requests.exceptions.ConnectTimeout) as ce:
+        response = tb_http_client.post(url=service_dict["url"], headers=service_dict["headers"], data=json.dumps(data))
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as ce:
         error_msg = "Could not get a response from {0}...".format(str(service_dict['url']))
         one_way_log.error(error_msg)
         raise ce
@@ -109,8 +110,8 @@ def handleTwoWayDeviceRPCRequest(deviceId, remote_method, param_dict=None):
 
     # Send the request to the server. The response, if obtained, contains the response data
     try:
-        response = requests.post(url=service_dict['url'], headers=service_dict['headers'], data=json.dumps(data))
-    except (requests.exceptions.ConnectionError, requests.exceptions.ConnectTimeout) as ce:
+        response = tb_http_client.post(url=service_dict['url'], headers=service_dict['headers'], data=json.dumps(data))
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as ce:
         error_msg = "Could not get a response from {0}...".format(str(service_dict['url']))
         two_way_log.error(error_msg)
         raise ce
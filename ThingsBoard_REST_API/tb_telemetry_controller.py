@@ -7,6 +7,7 @@ import ambi_logger
 import datetime
 from mysql_database.python_database_modules import mysql_utils, mysql_auth_controller as mac
 from mysql_database.python_database_modules import mysql_device_controller
+from ThingsBoard_REST_API import tb_http_client
 
 
 def getTimeseriesKeys(entityType, entityId):
@@ -68,22 +69,22 @@ def getTimeseriesKeys(entityType, entityId):
     service_dict = utils.build_service_calling_info(mac.get_auth_token(user_type='tenant_admin'), service_endpoint)
 
     try:
-        response = requests.get(url=service_dict['url'], headers=service_dict['headers'])
-    except (requests.exceptions.ConnectionError, requests.exceptions.ConnectTimeout) as ce:
+        response = tb_http_client.get(url=service_dict['url'], headers=service_dict['headers'])
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as ce:
         error_msg = "Could not get a response from {0}...".format(str(service_dict['url']))
         timeseries_key_log.error(error_msg)
         raise ce
 
     # Test the HTTP status code in the response (I'm only continuing if it is a 200 and, in this particular case, a single str element was returned)
     if response.status_code != 200:
-        error_msg = "Request unsuccessful: Received an HTTP {0} with message: {1}".format(str(eval(response.text)['status']), str(eval(response.text)['message']))
+        error_msg = "Request unsuccessful: Received an HTTP {0} with message: {1}".format(str(utils.decode_json_response(response.text)['status']), str(utils.decode_json_response(response.text)['message']))
         timeseries_key_log.error(error_msg)
         raise utils.ServiceEndpointException(message=error_msg)
     else:
         # The objective here is to return the string with the key that I need to call another endpoint service to get actual data from the device. If the data is correct and there's a key associated to that, I should get a single list with a
         # string as its only element back. If the device exists but it still doesn't have a timeSeries associated to it, I would get an empty list back
         # Start to cast the response.text to a list
-        result = eval(response.text)
+        result = utils.decode_json_response(response.text)
 
         try:
             # Raise an Exception if the data type obtained is different from the expected
@@ -275,15 +276,15 @@ def getTimeseries(device_name, end_date, start_date=None, time_interval=None, in
     service_dict = utils.build_service_calling_info(mac.get_auth_token(user_type='tenant_admin'), service_endpoint)
 
     try:
-        response = requests.get(url=service_dict['url'], headers=service_dict['headers'])
-    except (requests.exceptions.ConnectionError, requests.exceptions.ConnectTimeout):
+        response = tb_http_client.get(url=service_dict['url'], headers=service_dict['headers'])
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
         error_msg = "Unable to establish a connection with {0}...".format(str(service_dict['url']))
         timeseries_log.error(error_msg)
         raise utils.ServiceEndpointException(message=error_msg)
 
     # Check first if the response came back with a HTTP 200
     if response.status_code != 200:
-        error_msg = "Request unsuccessful: Received HTTP {0} with message: {1}".format(str(response.status_code), str(eval(response.text)['message']))
+        error_msg = "Request unsuccessful: Received HTTP {0} with message: {1}".format(str(response.status_code), str(utils.decode_json_response(response.text)['message']))
         timeseries_log.error(error_msg)
         raise utils.ServiceEndpointException(message=error_msg)
     else:
@@ -312,8 +313,8 @@ def getTimeseries(device_name, end_date, start_date=None, time_interval=None, in
         # Use this as a reference for when another method needs to consume data from this response. Its a over complicated structure, honestly, and its not hard to create a simple method to call after this to simplify it greatly. But there's no
         # point in doing that until we know exactly what is the format that need to be returned.
 
-        # Apply the 'eval' base method just to transform the str that is returned into a dict
-        result_dict = eval(response.text)
+        # Decode the str that is returned into a dict
+        result_dict = utils.decode_json_response(response.text)
 
         # Finally, check if any of the entries in the returned dictionary matches the 'limit' parameter and warn the user of potential missing results if so
         for result_key in list(result_dict.keys()):
@@ -324,6 +325,122 @@ def getTimeseries(device_name, end_date, start_date=None, time_interval=None, in
         return result_dict
 
 
+def getTimeseriesStream(device_name, end_date, start_date, limit=None, timeseries_keys_filter=None, initial_window=None, min_window=None, max_window=None):
+    """
+    This method is the generator version of getTimeseries, intended for large time windows (multi-month backfills and such). Instead of requesting the whole [start_date, end_date] window in a single call, with a huge limit and the whole response
+    held in memory (and silently truncated if the limit is reached anyway), the window is split into consecutive sub-windows that are requested one at a time, from the oldest to the most recent one, and yielded as soon as they arrive. The size of
+    these sub-windows adapts to the data density:
+    1. If any timeseries key comes back with as many data points as the limit, the sub-window was truncated by the remote API. Its results are discarded and the sub-window is halved and requested again.
+    2. If the sub-window is already at its minimum size and is still truncated, the limit is doubled for that sub-window instead, until all its data comes back. Data is never dropped because of the limit.
+    3. If all timeseries keys come back with less than proj_config.timeseries_stream_sparse_ratio of the limit, the next sub-window doubles in size, up to its maximum size.
+    Consecutive sub-windows share their boundary timestamp, i.e., the next one starts exactly where the previous one ended. This avoids any gaps regardless of the remote API treating the window ends as inclusive or exclusive, and any data point
+    that falls exactly on that boundary and was already yielded is removed from the next sub-window's results.
+    @:param device_name (str) - The name of the device to retrieve data from
+    @:param end_date (datetime.datetime) - The end of the overall time window
+    @:param start_date (datetime.datetime) - The start of the overall time window
+    @:param limit (int) - The number of results to request per timeseries key in each sub-window. Defaults to proj_config.timeseries_stream_limit
+    @:param timeseries_keys_filter (list of str) - A list with the keys to be returned from the remote API. Same as in getTimeseries
+    @:param initial_window (datetime.timedelta) - The size of the first sub-window. Defaults to proj_config.timeseries_stream_initial_window
+    @:param min_window (datetime.timedelta) - The smallest sub-window allowed. Defaults to proj_config.timeseries_stream_min_window
+    @:param max_window (datetime.timedelta) - The largest sub-window allowed. Defaults to proj_config.timeseries_stream_max_window
+    @:raise utils.InputValidationException - If any of the inputs provided fails validation
+    @:raise utils.ServiceEndpointException - If something goes wrong with any of the external service calls to the remote API
+    @:raise mysql_utils.MySQLDatabaseException - For errors derived from the MySQL database accesses
+    @:yield (window_start, window_end, result_dict) (tuple) - The limits of each sub-window (datetime.datetime) and the data retrieved for it, in the same {timeseries_key: [{'ts': int, 'value': str}, ...]} format returned by getTimeseries
+    """
+    timeseries_log = ambi_logger.get_logger(__name__)
+
+    # Validate the inputs that are used directly in here. The remaining ones are validated by getTimeseries at each call
+    utils.validate_input_type(device_name, str)
+    utils.validate_input_type(end_date, datetime.datetime)
+    utils.validate_input_type(start_date, datetime.datetime)
+
+    if limit is None:
+        limit = proj_config.timeseries_stream_limit
+    else:
+        utils.validate_input_type(limit, int)
+
+    if initial_window is None:
+        initial_window = proj_config.timeseries_stream_initial_window
+    else:
+        utils.validate_input_type(initial_window, datetime.timedelta)
+
+    if min_window is None:
+        min_window = proj_config.timeseries_stream_min_window
+    else:
+        utils.validate_input_type(min_window, datetime.timedelta)
+
+    if max_window is None:
+        max_window = proj_config.timeseries_stream_max_window
+    else:
+        utils.validate_input_type(max_window, datetime.timedelta)
+
+    error_msg = None
+    if limit <= 0:
+        error_msg = "Invalid limit value: {0}. Please provide a greater than zero integer for this argument.".format(str(limit))
+    elif start_date >= end_date:
+        error_msg = "Invalid start_date date! The start_date provided ({0}) is newer/equal than/to the end_date date ({1}): invalid time window defined!".format(str(start_date), str(end_date))
+    elif min_window <= datetime.timedelta(0) or min_window > max_window:
+        error_msg = "Invalid sub-window limits provided: the minimum ({0}) has to be positive and no larger than the maximum ({1}).".format(str(min_window), str(max_window))
+
+    if error_msg:
+        timeseries_log.error(error_msg)
+        raise utils.InputValidationException(message=error_msg)
+
+    # Keep the initial window within bounds
+    window = min(max(initial_window, min_window), max_window)
+
+    window_start = start_date
+    # The (timeseries_key, ts) pairs of the data points yielded exactly at the end of the previous sub-window, i.e., the ones that may come back again at the start of the next one
+    boundary_point_set = set()
+
+    while window_start < end_date:
+        window_end = min(window_start + window, end_date)
+        window_limit = limit
+
+        while True:
+            result_dict = getTimeseries(device_name=device_name, end_date=window_end, start_date=window_start, limit=window_limit, timeseries_keys_filter=timeseries_keys_filter)
+
+            # Get the size of the largest set of results returned
+            max_count = max([len(result_dict[result_key]) for result_key in result_dict] + [0])
+
+            # No truncation? Then this sub-window is done
+            if max_count < window_limit:
+                break
+
+            if window_end - window_start > min_window:
+                # Truncated. Halve the sub-window (but never below the minimum) and try again
+                window = max((window_end - window_start) / 2, min_window)
+                window_end = min(window_start + window, end_date)
+                timeseries_log.info("Device '{0}': sub-window truncated at {1} results. Retrying with a {2} sub-window...".format(str(device_name), str(window_limit), str(window)))
+            else:
+                # Already at the minimum sub-window. Raise the limit instead for this one
+                window_limit *= 2
+                timeseries_log.warning("Device '{0}': sub-window {1} -> {2} still truncated at its minimum size. Retrying with limit = {3}...".format(str(device_name), str(window_start), str(window_end), str(window_limit)))
+
+        # Remove any repeated data points from the boundary with the previous sub-window and register the ones at this sub-window's boundary
+        window_end_ts = mysql_utils.convert_datetime_to_timestamp_tb(window_end)
+        new_boundary_point_set = set()
+
+        for result_key in result_dict:
+            if boundary_point_set:
+                result_dict[result_key] = [data_point for data_point in result_dict[result_key] if (result_key, int(data_point['ts'])) not in boundary_point_set]
+
+            for data_point in result_dict[result_key]:
+                if int(data_point['ts']) >= window_end_ts:
+                    new_boundary_point_set.add((result_key, int(data_point['ts'])))
+
+        boundary_point_set = new_boundary_point_set
+
+        yield window_start, window_end, result_dict
+
+        # Sparse results? Grow the next sub-window then
+        if max_count < window_limit * proj_config.timeseries_stream_sparse_ratio:
+            window = min(window * 2, max_window)
+
+        window_start = window_end
+
+
 def getLatestTimeseries(device_name, timeseries_keys_filter=None):
     """
     This method is analogous to the previous one, i.e., it also retrieves Timeseries data that is associated to the device identified by 'device_name', but in this particular case only one timestamp/value pair is returned for each of the device's
@@ -410,20 +527,20 @@ def getLatestTimeseries(device_name, timeseries_keys_filter=None):
 
     # Execute the remote call finally
     try:
-        response = requests.get(url=service_dict['url'], headers=service_dict['headers'])
-    except (requests.exceptions.ConnectionError, requests.exceptions.ConnectTimeout):
+        response = tb_http_client.get(url=service_dict['url'], headers=service_dict['headers'])
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
         error_msg = "Unable to establish a connection with {0}...".format(str(service_dict['url']))
         log.error(error_msg)
         raise utils.ServiceEndpointException(message=error_msg)
 
     # Check the HTTP status code in the response
     if response.status_code != 200:
-        error_msg = "Request unsuccessful: Received HTTP {0} with message {1}!".format(str(response.status_code), str(eval(response.text)['message']))
+        error_msg = "Request unsuccessful: Received HTTP {0} with message {1}!".format(str(response.status_code), str(utils.decode_json_response(response.text)['message']))
         log.error(error_msg)
         raise utils.ServiceEndpointException(message=error_msg)
     else:
         # Send back the response already in dictionary form
-        return eval(response.text)
+        return utils.decode_json_response(response.text)
 
 
 def getAttributes(entityType=None, entityId=None, deviceName=None, keys=None):
@@ -515,26 +632,26 @@ def getAttributes(entityType=None, entityId=None, deviceName=None, keys=None):
 
     # Query the remote API
     try:
-        response = requests.get(url=service_dict['url'], headers=service_dict['headers'])
-    except (requests.exceptions.ConnectionError, requests.exceptions.ConnectTimeout) as ce:
+        response = tb_http_client.get(url=service_dict['url'], headers=service_dict['headers'])
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as ce:
         error_msg = "Could not get a response from {0}...".format(str(service_dict['url']))
         log.error(error_msg)
         raise utils.ServiceEndpointException(message=ce)
 
     # If a response was returned, check the HTTP return code
     if response.status_code != 200:
-        error_msg = "Request not successful: Received an HTTP " + str(eval(response.text)['status']) + " with message: " + str(eval(response.text)['message'])
+        error_msg = "Request not successful: Received an HTTP " + str(utils.decode_json_response(response.text)['status']) + " with message: " + str(utils.decode_json_response(response.text)['message'])
         log.error(error_msg)
         raise utils.ServiceEndpointException(message=error_msg)
     else:
         # Got a valid result. Format the returned objects for return
-        data_to_return = eval(utils.translate_postgres_to_python(response.text))
+        data_to_return = utils.decode_json_response(response.text)
 
         if len(data_to_return) is 0:
             # Nothing to return then. Send back a None instead
             return None
 
-        # If the request was alright, I've received the following Response Body (after eval)
+        # If the request was alright, I've received the following Response Body (after decoding)
         # data_to_return =
         # [
         #   {
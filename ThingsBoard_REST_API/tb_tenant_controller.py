@@ -5,9 +5,10 @@ import ambi_logger
 import urllib.parse
 import requests
 from mysql_database.python_database_modules import mysql_auth_controller as mac
+from ThingsBoard_REST_API import tb_http_client
 
 
-def getTenants(textSearch=None, idOffset=None, textOffset=None, limit=10):
+def getTenants(textSearch=None, idOffset=None, textOffset=None, limit=10, warn_on_next=True):
     """GET method to retrieve either all tenants registered in the thingsboard server or a specific tenant by providing the related search terms.
     @:param OPTIONAL textSearch (str) - A text search string to limit the number of tenants to be returned by this operation. This functionality is quite limited I may add. It only searches the title field and only returns any results if
     this element is EXACTLY equal to the title field. Eg. textSearch='Mr Ricardo Almeida' returns that tenant information but textSearch='Ricardo Almeida' return nothing even though this string matches exactly the 'name' field
@@ -16,6 +17,7 @@ def getTenants(textSearch=None, idOffset=None, textOffset=None, limit=10):
     string. Yet adding just one character after the last '-' returns a list of all registered tenants... again, I'm still failing to see the use of this field to be honest
     @:param OPTIONAL textOffset (any) - No idea what this field is used for. I've tried searches with matching and un-matching strings, ints, floats, etc... and I always get all the tenants back. Pointless field if I ever saw one...
     @:param limit (int) - The only required field in this methods. Limits the number of results to return
+    @:param warn_on_next (bool) - Set this flag to False to skip the warning about the results left to return in the remote API (when 'hasNext' comes back True). The tb_pagination iterators, which request the next pages themselves, do just that
     @:return tenant_data (dict) - The return element is a complex one. If successful, the returned structure is as follows:
     tenant_data = {
         'data': [
@@ -117,23 +119,23 @@ def getTenants(textSearch=None, idOffset=None, textOffset=None, limit=10):
 
     service_dict = utils.build_service_calling_info(mac.get_auth_token(user_type='sys_admin'), service_endpoint)
     try:
-        response = requests.get(url=service_dict['url'], headers=service_dict['headers'])
-    except (requests.exceptions.ConnectionError, requests.exceptions.ConnectTimeout) as ce:
+        response = tb_http_client.get(url=service_dict['url'], headers=service_dict['headers'])
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as ce:
         error_msg = "Could not get a response from {0}..".format(str(service_dict['url']))
         tenant_log.error(error_msg)
         raise ce
 
     # In order to continue, I'm only interested in HTTP 200. Whatever comes back different than that, I'm shutting down this thing
     if response.status_code != 200:
-        # Capture the error message that is returned in the message body, as a dictionary encoded in a str (hence the eval to cast it from str back to dict)
-        error_msg = "Received an HTTP " + str(eval(response.text)['status']) + " with the message: " + str(eval(response.text)['message'])
+        # Capture the error message that is returned in the message body, as a dictionary encoded in a str (hence the decoding to cast it from str back to dict)
+        error_msg = "Received an HTTP " + str(utils.decode_json_response(response.text)['status']) + " with the message: " + str(utils.decode_json_response(response.text)['message'])
         tenant_log.error(error_msg)
-        raise utils.ServiceEndpointException(message=error_msg, error_code=int(eval(response.text)['errorCode']))
+        raise utils.ServiceEndpointException(message=error_msg, error_code=int(utils.decode_json_response(response.text)['errorCode']))
     else:
         # Replace the troublesome elements from the API side to Python-esque (Pass it just the text part of the response. I have no use for the rest of the object anyway)
 
         # At this point, I'm going to check the state of the 'hasNext' key in the response and warning the user if its set to True (means that the limit argument was set at value that left some records still on the API side)
-        if eval(utils.translate_postgres_to_python(response.text))['hasNext']:
+        if warn_on_next and utils.decode_json_response(response.text)['hasNext']:
             # In this case, warn the user and carry on
             tenant_log.warning("There are still more results to return from the API side. Increase the 'limit' argument value to obtain them.")
 
@@ -0,0 +1,69 @@
+"""
+Use this module to compare the different ways of decoding the responses from the remote API. It builds a synthetic (but realistic) getTimeseries response body, with a configurable number of timeseries keys and data points per key, and times
+the old eval(utils.translate_postgres_to_python()) approach against utils.decode_json_response (with the standard json module and with orjson, if installed). No access to the ThingsBoard server or the MySQL database is required.
+"""
+import json
+import random
+import timeit
+import utils
+
+# Size of the synthetic response: number of timeseries keys and number of data points per key
+timeseries_key_list = ['temperature', 'humidity', 'carbon_dioxide', 'volatile_organic_compounds', 'lux', 'power']
+points_per_key = 50000
+
+# Number of times each decoding approach is timed (the best time is the one reported)
+repeat = 5
+
+
+def build_timeseries_payload(key_list, point_count):
+    """
+    This method creates a str with the same structure that is returned by the telemetry timeseries service of the remote API, i.e., {"key": [{"ts": int, "value": str}, ...], ...}
+    @:param key_list (list of str) - The timeseries keys to include in the payload
+    @:param point_count (int) - The number of data points per timeseries key
+    @:return payload (str) - The JSON encoded payload
+    """
+    start_ts = 1590000000000
+    payload_dict = {}
+    for key in key_list:
+        payload_dict[key] = [{"ts": start_ts + i * 60000, "value": str(round(random.uniform(0, 1000), 2))} for i in range(point_count)]
+
+    return json.dumps(payload_dict)
+
+
+def eval_decoder(response_text):
+    """ The decoding approach used before utils.decode_json_response """
+    return eval(utils.translate_postgres_to_python(response_text))
+
+
+def json_decoder(response_text):
+    """ utils.decode_json_response forced to the standard json module """
+    return json.loads(response_text)
+
+
+def __main__():
+    payload = build_timeseries_payload(key_list=timeseries_key_list, point_count=points_per_key)
+    print("Synthetic getTimeseries payload: {0} keys x {1} points ({2:.1f} MB)\n".format(str(len(timeseries_key_list)), str(points_per_key), len(payload) / (1024 * 1024)))
+
+    # Make sure that all approaches return the same thing before timing them
+    reference = eval_decoder(payload)
+    assert json_decoder(payload) == reference
+    assert utils.decode_json_response(payload) == reference
+
+    decoder_list = [
+        ("eval(translate_postgres_to_python())", eval_decoder),
+        ("json.loads", json_decoder),
+        ("utils.decode_json_response ({0})".format("orjson" if utils.orjson is not None else "json"), utils.decode_json_response)
+    ]
+
+    results = []
+    for decoder_name, decoder in decoder_list:
+        best_time = min(timeit.repeat(lambda: decoder(payload), number=1, repeat=repeat))
+        results.append((decoder_name, best_time))
+
+    baseline = results[0][1]
+    for decoder_name, best_time in results:
+        print("{0:<50}{1:>10.3f} s{2:>10.1f}x".format(decoder_name, best_time, baseline / best_time))
+
+
+if __name__ == "__main__":
+    __main__()
@@ -2,6 +2,7 @@
 This method is used to periodically update the environmental data associated to the set of devices that are currently monitoring the surf board factory
 """
 import datetime
+import proj_config
 from mysql_database.python_database_modules import mysql_telemetry_controller
 from mysql_database.python_database_modules import mysql_device_controller
 
@@ -9,7 +10,9 @@ def __main__():
     # Use this parameter to fetch the last hour of data
     # collection_interval = datetime.timedelta(hours=5110)
     # collection_interval = datetime.timedelta(minutes=2)
-    collection_interval = datetime.timedelta(minutes=3)
+    # collection_interval = datetime.timedelta(minutes=3)
+    # With incremental collection, this window only applies to the devices that were never collected before
+    collection_interval = proj_config.default_collection_time_limit
 
     #use this parameter to fetch since the beginning
     #collection_interval = datetime.datetime(year=2020, month=5, day=1, hour=0, minute=0, second=0)
@@ -44,9 +47,13 @@ def __main__():
         'LoadTestDevice'
     ]
 
+    # Query the devices concurrently. Set max_workers to None to go back to one device at a time. The collection is incremental, i.e., each device only gets the data after the last data point already stored, so a missed run doesn't lose
+    # anything
     mysql_telemetry_controller.populate_device_data_table(
         collection_time_limit=collection_interval,
-        device_name_list=device_name_list
+        device_name_list=device_name_list,
+        max_workers=proj_config.device_data_max_workers,
+        incremental=True
     )
 
 
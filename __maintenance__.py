@@ -8,24 +8,33 @@ from mysql_database.python_database_modules import mysql_device_controller
 from mysql_database.python_database_modules import mysql_telemetry_controller
 from mysql_database.python_database_modules import mysql_utils
 from mysql_database.python_database_modules import mysql_entity_relation_controller
+from mysql_database.python_database_modules import mysql_partition_manager
 import proj_config
 import user_config
 import utils
+import job_executor
 
 
 def __main__():
-    # First of all, refresh the access tokens by invoking the authentication table refresher
-    mysql_auth_controller.populate_auth_table()
+    # The synchronization jobs and their actual dependencies. Everything needs fresh access tokens first. The customer, tenant, asset and device tables are independent of each other, so these run concurrently, and the relations between assets
+    # and devices are built from the contents of the last two. Only the records that changed since the last run are written in the metadata tables
+    job_list = [
+        job_executor.create_job('auth', mysql_auth_controller.populate_auth_table),
+        job_executor.create_job('customers', mysql_customer_controller.update_customer_table, dependency_list=['auth'], diff_sync=True),
+        job_executor.create_job('tenants', mysql_tenant_controller.update_tenants_table, dependency_list=['auth'], diff_sync=True),
+        job_executor.create_job('assets', mysql_asset_controller.update_tenant_assets_table, dependency_list=['auth'], diff_sync=True),
+        job_executor.create_job('devices', mysql_device_controller.update_devices_table, dependency_list=['auth'], diff_sync=True),
+        # The assets and devices tables are refreshed by the jobs above, so there's no need for this one to refresh them again
+        job_executor.create_job('asset_devices', mysql_entity_relation_controller.update_asset_devices_table, dependency_list=['assets', 'devices'], refresh_dependencies=False),
+        # The device data partitions don't depend on anything else
+        job_executor.create_job('device_data_partitions', mysql_partition_manager.maintain_partitions)
+    ]
 
-    # Start by updating the customer, tenant and asset tables. These are the "fundamental" ones
-    mysql_customer_controller.update_customer_table()
-    mysql_tenant_controller.update_tenants_table()
-    mysql_asset_controller.update_tenant_assets_table()
+    result_dict = job_executor.run_job_graph(job_list=job_list)
 
-    # And finish with the device table since this operation requires data from the previous tables
-    mysql_device_controller.update_devices_table()
+    print(job_executor.format_job_summary(result_dict=result_dict))
 
-    mysql_entity_relation_controller.update_asset_devices_table()
+    return result_dict
 
 
 def reset_context():
@@ -40,21 +49,28 @@ def reset_context():
         mysql_utils.reset_table(table_name=table_name)
         print("Done!\n")
 
+    # The device table is empty now. Drop the in-memory copy too
+    mysql_device_controller.invalidate_device_registry()
 
-def gather_latest_data(collection_interval, device_name_list=None):
+
+def gather_latest_data(collection_interval, device_name_list=None, incremental=True):
     """
     This method abstracts the periodic collection of environmental data from all configured devices
-    :param collection_interval (datetime.timedelta) - A time window for data collection. Only records with a timestamp between the current datetime and the other end of the time window defined this way are considered
+    :param collection_interval (datetime.timedelta) - A time window for data collection. Only records with a timestamp between the current datetime and the other end of the time window defined this way are considered. In incremental mode, this
+    window is only used for the devices/timeseriesKeys that were never collected before
     :param device_name_list (list of str) - Provide a list of device names in this argument if you wish that the data update to be limited to them. Leave it as None to update all devices currently in the tb_devices table.
+    :param incremental (bool) - If True (the default), only the data newer than the last data point already stored for each device/timeseriesKey is collected (see mysql_telemetry_controller.populate_device_data_table)
     :raise utils.InputValidationException - If any inputs fail initial validation
     :raise mysql_utils.MySQLDatabaseException - If any problems are encountered when dealing with the database
     """
     utils.validate_input_type(collection_interval, datetime.timedelta)
-    utils.validate_input_type(device_name_list, list)
-    for device_name in device_name_list:
-        utils.validate_input_type(device_name, str)
+    if device_name_list:
+        utils.validate_input_type(device_name_list, list)
+        for device_name in device_name_list:
+            utils.validate_input_type(device_name, str)
+    utils.validate_input_type(incremental, bool)
 
-    mysql_telemetry_controller.populate_device_data_table(collection_time_limit=collection_interval, device_name_list=device_name_list)
+    mysql_telemetry_controller.populate_device_data_table(collection_time_limit=collection_interval, device_name_list=device_name_list, incremental=incremental)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,193 @@
+""" Place holder for a simple executor of job graphs, i.e., sets of jobs (method calls) with dependencies between them, such as the table synchronization jobs run by the __maintenance__ module """
+
+import time
+import concurrent.futures
+import ambi_logger
+import utils
+import proj_config
+
+
+def create_job(job_name, job_function, dependency_list=None, **kwargs):
+    """
+    Creates the job dictionary expected by run_job_graph.
+    :param job_name: (str) An unique name for the job. Other jobs use this name to state their dependency on this one
+    :param job_function: (function) The method to run
+    :param dependency_list: (list of str) The names of the jobs that have to finish successfully before this one can run
+    :param kwargs: The arguments to call job_function with
+    :raise utils.InputValidationException: If any of the inputs fails validation
+    :return job: (dict) A dictionary with the 'name', 'function', 'kwargs' and 'dependencies' keys
+    """
+    utils.validate_input_type(job_name, str)
+
+    if not callable(job_function):
+        raise utils.InputValidationException(message="The job function provided for job '{0}' is not callable!".format(str(job_name)))
+
+    if dependency_list is None:
+        dependency_list = []
+
+    utils.validate_input_type(dependency_list, list)
+    for dependency_name in dependency_list:
+        utils.validate_input_type(dependency_name, str)
+
+    return {'name': job_name, 'function': job_function, 'kwargs': kwargs, 'dependencies': list(dependency_list)}
+
+
+def run_job_graph(job_list, max_workers=None):
+    """
+    Runs a list of jobs (created with create_job), respecting the dependencies between them: a job is only started after all the jobs it depends on have finished successfully, and jobs without pending dependencies run concurrently, with at most
+    max_workers jobs running at the same time. If a job fails, every job that depends on it (directly or not) is skipped, but the independent ones carry on.
+    Repeated jobs are only run once: jobs with the same name, or with the same function and arguments under a different name, are merged into the first one of them (with the dependencies of all of them). The names of the merged jobs remain
+    valid as dependencies for other jobs.
+    :param job_list: (list of dict) The jobs to run
+    :param max_workers: (int) The maximum number of jobs running at the same time. Uses proj_config.job_executor_max_workers if omitted
+    :raise utils.InputValidationException: If any of the inputs fails validation, if a job depends on a job that is not in the list or if the dependencies are circular
+    :return result_dict: (dict) A dictionary indexed by job name (only for the jobs that were actually scheduled) with a dictionary with the job 'status' ('success', 'failed' or 'skipped'), its 'elapsed' time, in seconds (None if it didn't
+    run), its 'result' (the job function return) and its 'error' (the exception raised, if any)
+    """
+    log = ambi_logger.get_logger(__name__)
+
+    utils.validate_input_type(job_list, list)
+
+    if max_workers is None:
+        max_workers = proj_config.job_executor_max_workers
+
+    utils.validate_input_type(max_workers, int)
+
+    # Merge the repeated jobs first. The alias dictionary maps every job name provided to the name of the job that is actually going to run
+    job_dict = {}
+    job_alias_dict = {}
+    job_signature_dict = {}
+
+    for job in job_list:
+        utils.validate_input_type(job, dict)
+
+        job_signature = (job['function'], repr(sorted(job['kwargs'].items())))
+
+        if job['name'] in job_dict:
+            merged_job_name = job['name']
+        elif job_signature in job_signature_dict:
+            merged_job_name = job_signature_dict[job_signature]
+        else:
+            job_dict[job['name']] = {'name': job['name'], 'function': job['function'], 'kwargs': job['kwargs'], 'dependencies': list(job['dependencies'])}
+            job_alias_dict[job['name']] = job['name']
+            job_signature_dict[job_signature] = job['name']
+            continue
+
+        log.info("Job '{0}' is repeated. Running it only once as '{1}'.".format(str(job['name']), str(merged_job_name)))
+        job_alias_dict[job['name']] = merged_job_name
+        job_dict[merged_job_name]['dependencies'].extend(job['dependencies'])
+
+    # Resolve the dependencies to the names of the jobs that are actually going to run
+    for job in job_dict.values():
+        dependency_set = set()
+
+        for dependency_name in job['dependencies']:
+            if dependency_name not in job_alias_dict:
+                error_msg = "Job '{0}' depends on job '{1}', which is not among the jobs provided!".format(str(job['name']), str(dependency_name))
+                log.error(error_msg)
+                raise utils.InputValidationException(message=error_msg)
+
+            if job_alias_dict[dependency_name] != job['name']:
+                dependency_set.add(job_alias_dict[dependency_name])
+
+        job['dependencies'] = dependency_set
+
+    _validate_job_graph(job_dict=job_dict)
+
+    result_dict = {}
+    pending_job_dict = dict(job_dict)
+    running_future_dict = {}
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending_job_dict or running_future_dict:
+            # Skip the jobs that depend on a failed or skipped job
+            for job_name in list(pending_job_dict.keys()):
+                failed_dependency_list = [dependency_name for dependency_name in pending_job_dict[job_name]['dependencies']
+                                          if dependency_name in result_dict and result_dict[dependency_name]['status'] != 'success']
+
+                if failed_dependency_list:
+                    log.warning("Skipping job '{0}': job(s) {1} did not finish successfully.".format(str(job_name), str(failed_dependency_list)))
+                    result_dict[job_name] = {'status': 'skipped', 'elapsed': None, 'result': None, 'error': None}
+                    pending_job_dict.pop(job_name)
+
+            # Start the jobs whose dependencies are all done
+            for job_name in list(pending_job_dict.keys()):
+                if all([dependency_name in result_dict for dependency_name in pending_job_dict[job_name]['dependencies']]):
+                    job = pending_job_dict.pop(job_name)
+                    running_future_dict[executor.submit(_run_job, job)] = job_name
+
+            if not running_future_dict:
+                continue
+
+            # Wait for any of the running jobs to finish before checking what else can be started
+            done_future_set, _ = concurrent.futures.wait(list(running_future_dict.keys()), return_when=concurrent.futures.FIRST_COMPLETED)
+
+            for done_future in done_future_set:
+                job_name = running_future_dict.pop(done_future)
+                result_dict[job_name] = done_future.result()
+
+    log.info("Job graph finished:\n{0}".format(format_job_summary(result_dict=result_dict)))
+
+    return result_dict
+
+
+def format_job_summary(result_dict):
+    """
+    Formats the results of run_job_graph into a small table with the status and elapsed time of each job, in the order in which they finished.
+    :param result_dict: (dict) The dictionary returned by run_job_graph
+    :return summary: (str) The table, one job per line
+    """
+    utils.validate_input_type(result_dict, dict)
+
+    name_width = max([len(job_name) for job_name in result_dict] + [len('Job')])
+
+    summary_line_list = ["{0}  {1:<8}  {2:>10}".format('Job'.ljust(name_width), 'Status', 'Elapsed')]
+
+    for job_name, job_result in result_dict.items():
+        elapsed = "{0:.2f}s".format(job_result['elapsed']) if job_result['elapsed'] is not None else "-"
+        summary_line_list.append("{0}  {1:<8}  {2:>10}".format(job_name.ljust(name_width), job_result['status'], elapsed))
+
+    return "\n".join(summary_line_list)
+
+
+def _run_job(job):
+    """
+    Runs a single job and times it. Any exception raised by the job is logged and returned in the result instead of being raised, so that the remaining jobs can carry on.
+    :param job: (dict) The job to run
+    :return job_result: (dict) A dictionary with the 'status', 'elapsed', 'result' and 'error' keys (see run_job_graph)
+    """
+    log = ambi_logger.get_logger(__name__)
+
+    log.info("Starting job '{0}'...".format(str(job['name'])))
+    start_time = time.time()
+
+    try:
+        result = job['function'](**job['kwargs'])
+    except Exception as e:
+        elapsed = time.time() - start_time
+        log.error("Job '{0}' failed after {1:.2f}s: {2}".format(str(job['name']), elapsed, str(e)))
+        return {'status': 'failed', 'elapsed': elapsed, 'result': None, 'error': e}
+
+    elapsed = time.time() - start_time
+    log.info("Job '{0}' finished in {1:.2f}s.".format(str(job['name']), elapsed))
+
+    return {'status': 'success', 'elapsed': elapsed, 'result': result, 'error': None}
+
+
+def _validate_job_graph(job_dict):
+    """
+    Checks that the dependencies between jobs don't form a cycle (which would leave those jobs waiting forever), by trying to sort them in dependency order.
+    :param job_dict: (dict) The jobs, indexed by name, with their dependencies already resolved to a set of job names
+    :raise utils.InputValidationException: If the dependencies are circular
+    """
+    resolved_set = set()
+    unresolved_set = set(job_dict.keys())
+
+    while unresolved_set:
+        ready_set = set([job_name for job_name in unresolved_set if job_dict[job_name]['dependencies'].issubset(resolved_set)])
+
+        if not ready_set:
+            raise utils.InputValidationException(message="Circular dependencies detected among jobs {0}. Cannot run them!".format(str(sorted(unresolved_set))))
+
+        resolved_set.update(ready_set)
+        unresolved_set.difference_update(ready_set)
@@ -9,49 +9,47 @@ from mysql_database.python_database_modules import mysql_utils
 import ambi_logger
 
 
-def add_table_data(data_dict, table_name):
+def add_table_data(data_dict, table_name, upsert=False):
     """
     Method that abstracts the insertion of data into the provided database table. The method maps the provided data dictionary to any available column in the table identified in table name. The method uses the table data as main reference, i.e.,
     it only writes data whose key in the data dictionary has a direct correspondence to a table column in the database. If more the data dictionary has more keys/items than available columns, an log warning is issued about it but the method
     carries on writing in all available data.
+    In upsert mode the record is written with a single INSERT ... ON DUPLICATE KEY UPDATE execution instead of an INSERT followed by an UPDATE whenever the first one hits a 'Duplicate entry'. The outcome (inserted, updated or unchanged) is
+    taken from the affected rows count of that single execution (see mysql_utils.classify_upsert_outcome).
     @:param data_dict (dict) - A dict structure, i.e., a key-value arrangement with the data to be added/updated into the database table. IMPORTANT: The table columns name were prepared such that there's a one-to-one equivalence between them and
     the expected keys in the data dictionary.
     @:param table_name (str) - The name of the database where the data dict has to be written into.
+    @:param upsert (bool) - Set this flag to write the record with a single upsert statement.
     @:raise utils.InputValidationException - If any of the inputs fails initial validation.
     @:raise mysql_utils.MySQLDatabaseException - If any issues occur with the database accesses.
-    @:return result (bool) - If the database addition/update was performed successfully, this method returns True. Otherwise, the appropriate exception is raised with the details on why it was raised in the first place.
+    @:return result (bool or str) - If the database addition/update was performed successfully, this method returns True. Otherwise, the appropriate exception is raised with the details on why it was raised in the first place. In upsert mode,
+    the method returns 'inserted', 'updated' or 'unchanged' instead.
     """
     log = ambi_logger.get_logger(__name__)
 
     # Validate inputs
     utils.validate_input_type(data_dict, dict)
     utils.validate_input_type(table_name, str)
+    utils.validate_input_type(upsert, bool)
 
-    # Prepare the database access objects
     database_name = user_config.access_info['mysql_database']['database']
-    cnx = mysql_utils.connect_db(database_name=database_name)
-    select_cursor = cnx.cursor(buffered=True)
-    change_cursor = cnx.cursor(buffered=True)
-
-    # First, check if the table exists
-    sql_select = """SHOW tables FROM """ + str(database_name) + """;"""
 
-    select_cursor = mysql_utils.run_sql_statement(cursor=select_cursor, sql_statement=sql_select, data_tuple=())
-
-    records = select_cursor.fetchall()
-
-    # The result of the previous fetchall command is a list of one element tuples, hence why I'm putting the name that I want to verify its existence in such list as a one element tuple. The alternative was to format the previous list into a
-    # single string list element, but it is way more simple this way
-    if (table_name,) not in records:
+    # First, check if the table exists. The schema catalog in mysql_utils only goes to the database for this if the table is not known yet
+    if not mysql_utils.table_exists(table_name=table_name):
         error_msg = "The table name provided: {0} doesn't exist yet in database {1}. Cannot continue.".format(str(table_name), str(database_name))
         log.error(error_msg)
         raise utils.InputValidationException(message=error_msg)
 
-    # Okay, the table exists in the database. Get all its columns into a list
+    # Okay, the table exists in the database. Get all its columns into a list (from the schema catalog too)
     column_list = mysql_utils.get_table_columns(database_name=database_name, table_name=table_name)
 
-    # And create the standard INSERT statement from it
-    sql_insert = mysql_utils.create_insert_sql_statement(column_list=column_list, table_name=table_name)
+    # And get the standard INSERT statement for it
+    sql_insert = mysql_utils.get_sql_statement(table_name=table_name, statement_type='insert')
+
+    # Prepare the database access objects
+    cnx = mysql_utils.connect_db(database_name=database_name)
+    select_cursor = cnx.cursor(buffered=True)
+    change_cursor = cnx.cursor(buffered=True)
 
     # Build the respective data tuple by going through all column names and checking if there is a corresponding key in the data dictionary
     data_list = []
@@ -70,6 +68,30 @@ def add_table_data(data_dict, table_name):
             # And set the value then
             data_list.append(None)
 
+    if upsert:
+        # One statement, one round trip, whatever the state of the record in the database
+        sql_upsert = mysql_utils.get_sql_statement(table_name=table_name, statement_type='upsert')
+
+        try:
+            change_cursor = mysql_utils.run_sql_statement(cursor=change_cursor, sql_statement=sql_upsert, data_tuple=tuple(data_list))
+            outcome = mysql_utils.classify_upsert_outcome(rowcount=change_cursor.rowcount)
+        except mysql_utils.MySQLDatabaseException as mse:
+            log.error("Could not execute\n{0}\nin {1}.{2}. Cannot continue..".format(str(change_cursor.statement), str(database_name), str(table_name)))
+            select_cursor.close()
+            change_cursor.close()
+            cnx.close()
+            raise mse
+
+        cnx.commit()
+        select_cursor.close()
+        change_cursor.close()
+        cnx.close()
+
+        if outcome != 'unchanged':
+            log.info("Record {0} in {1}.{2} successfully".format(outcome, str(database_name), str(table_name)))
+
+        return outcome
+
     # Done. Proceed with the INSERT
     try:
         change_cursor = mysql_utils.run_sql_statement(cursor=change_cursor, sql_statement=sql_insert, data_tuple=tuple(data_list))
@@ -93,7 +115,7 @@ def add_table_data(data_dict, table_name):
             trigger_column_list = mysql_utils.get_trigger_columns(table_name=table_name)
 
             # Cool. Use this data to get the respective UPDATE statement
-            sql_update = mysql_utils.create_update_sql_statement(column_list=column_list, table_name=table_name, trigger_column_list=trigger_column_list)
+            sql_update = mysql_utils.get_sql_statement(table_name=table_name, statement_type='update')
 
             # And complete the existing data list by appending to it the values corresponding to the elements in the trigger list
             for trigger_column_name in trigger_column_list:
@@ -169,3 +191,136 @@ def add_table_data(data_dict, table_name):
             cnx.close()
             # Something else must have happened then. Keep on raising the Exception
             raise mse
+
+
+def add_table_data_batch(data_dict_list, table_name, batch_size=None):
+    """
+    Batched version of the add_table_data method. Instead of opening a new database connection, validating the table and running an INSERT (and an UPDATE if the first one fails) per record, this method does all the table validation once,
+    uses a single database connection for the whole list of records and writes them in chunks of batch_size records, each chunk with a single multi-row INSERT ... ON DUPLICATE KEY UPDATE statement executed and committed in its own transaction.
+    As with add_table_data, the table columns are the main reference: only the data dictionary keys with a matching table column get written and missing keys are written as NULL.
+    Records in the same list that share the same unique key values (the table's trigger columns) are collapsed into the last one provided before writing anything, since MySQL would otherwise count the same record as inserted and then updated
+    within the same statement.
+    To be able to tell how many records were inserted, updated or were already identical to the ones in the database, each chunk runs a quick COUNT of the records that already exist with the same unique key values before the upsert, in the same
+    transaction. From there, given that the upsert statement reports 1 affected row per record inserted and 2 per record updated, the math is trivial.
+    @:param data_dict_list (list of dict) - A list of dictionaries, each one with the data of a record to add/update in the database table. As with add_table_data, the keys of these dictionaries are expected to match the table column names.
+    @:param table_name (str) - The name of the database table where the data is to be written into.
+    @:param batch_size (int) - The maximum number of records to write per statement/transaction. If omitted, proj_config.mysql_batch_size is used instead.
+    @:raise utils.InputValidationException - If any of the inputs fails initial validation or if the table doesn't exist in the database.
+    @:raise mysql_utils.MySQLDatabaseException - If any issues occur with the database accesses. The chunk being written when the error occurred is rolled back, but the chunks committed before that one remain in the database.
+    @:return result_dict (dict) - A dictionary with the outcome of the operation in the format {'inserted': int, 'updated': int, 'unchanged': int}
+    """
+    log = ambi_logger.get_logger(__name__)
+
+    # Validate inputs
+    utils.validate_input_type(data_dict_list, list)
+    for data_dict in data_dict_list:
+        utils.validate_input_type(data_dict, dict)
+    utils.validate_input_type(table_name, str)
+
+    if batch_size is None:
+        batch_size = proj_config.mysql_batch_size
+    else:
+        utils.validate_input_type(batch_size, int)
+
+    if batch_size <= 0:
+        error_msg = "Invalid batch size provided: {0}. Please provide a greater than zero integer for this argument.".format(str(batch_size))
+        log.error(error_msg)
+        raise utils.InputValidationException(message=error_msg)
+
+    result_dict = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+
+    # Nothing to write. No need to bother the database then
+    if not data_dict_list:
+        return result_dict
+
+    database_name = user_config.access_info['mysql_database']['database']
+
+    # Same table existence check as in add_table_data. All the schema metadata comes from the catalog in mysql_utils, so no metadata queries are done here after the first call for this table
+    if not mysql_utils.table_exists(table_name=table_name):
+        error_msg = "The table name provided: {0} doesn't exist yet in database {1}. Cannot continue.".format(str(table_name), str(database_name))
+        log.error(error_msg)
+        raise utils.InputValidationException(message=error_msg)
+
+    column_list = mysql_utils.get_table_columns(database_name=database_name, table_name=table_name)
+    trigger_column_list = mysql_utils.get_trigger_columns(table_name=table_name)
+
+    cnx = mysql_utils.connect_db(database_name=database_name)
+    select_cursor = cnx.cursor(buffered=True)
+    change_cursor = cnx.cursor(buffered=True)
+
+    # Warn the user about any keys in the data dictionaries without a matching column, but only once per key (it would flood the log otherwise)
+    missing_column_set = set()
+    for data_dict in data_dict_list:
+        missing_column_set.update(set(column_list) - set(data_dict.keys()))
+
+    if missing_column_set:
+        log.warning("Didn't find any {0} keys in some of the data dictionaries provided. Setting the respective columns in {1}.{2} to NULL for those records".format(str(sorted(missing_column_set)), str(database_name), str(table_name)))
+
+    # Convert the data dictionaries into ordered data lists, collapsing the ones with the same unique key in the process (the last one provided wins). A dictionary keeps the insertion order, so the records are written in the same order as provided
+    record_dict = {}
+    for data_dict in data_dict_list:
+        data_list = [data_dict.get(column_name, None) for column_name in column_list]
+        record_key = tuple([data_dict.get(trigger_column_name, None) for trigger_column_name in trigger_column_list])
+
+        # Records with NULL elements in their unique key never trigger a duplicate in the database. Keep them all then
+        if None in record_key:
+            record_key = (id(data_dict),)
+
+        record_dict[record_key] = data_list
+
+    record_list = list(record_dict.values())
+
+    if len(record_list) != len(data_dict_list):
+        log.warning("Collapsed {0} records with repeated {1} values before writing them into {2}.{3}".format(str(len(data_dict_list) - len(record_list)), str(trigger_column_list), str(database_name), str(table_name)))
+
+    # The position of the trigger columns in each data list, to build the data tuple of the existing records COUNT
+    trigger_index_list = [column_list.index(trigger_column_name) for trigger_column_name in trigger_column_list]
+
+    for i in range(0, len(record_list), batch_size):
+        batch = record_list[i:i + batch_size]
+
+        # Build the SELECT COUNT for the records that already exist in the database table, using a row constructor with the unique key columns, i.e., WHERE (key_1, key_2) IN ((%s, %s), (%s, %s), ...)
+        key_group = """(""" + """, """.join(['%s'] * len(trigger_column_list)) + """)"""
+        sql_count = """SELECT COUNT(*) FROM """ + str(table_name) + """ WHERE (""" + """, """.join(trigger_column_list) + """) IN (""" + """, """.join([key_group] * len(batch)) + """);"""
+
+        count_data_list = []
+        upsert_data_list = []
+        for data_list in batch:
+            count_data_list.extend([data_list[index] for index in trigger_index_list])
+            upsert_data_list.extend(data_list)
+
+        sql_upsert = mysql_utils.get_sql_statement(table_name=table_name, statement_type='upsert', row_count=len(batch))
+
+        try:
+            select_cursor = mysql_utils.run_sql_statement(cursor=select_cursor, sql_statement=sql_count, data_tuple=tuple(count_data_list))
+            existing_records = select_cursor.fetchone()[0]
+
+            change_cursor = mysql_utils.run_sql_statement(cursor=change_cursor, sql_statement=sql_upsert, data_tuple=tuple(upsert_data_list))
+            affected_rows = change_cursor.rowcount
+
+            cnx.commit()
+        except mysql_utils.MySQLDatabaseException as mse:
+            log.error("Unable to write a batch of {0} records into {1}.{2}. Rolling it back...".format(str(len(batch)), str(database_name), str(table_name)))
+            cnx.rollback()
+            select_cursor.close()
+            change_cursor.close()
+            cnx.close()
+            raise mse
+
+        # Every record that didn't exist before was inserted (1 affected row each). The remaining affected rows come in pairs, one pair per updated record. Whatever is left from the existing records was already identical. The values are clamped
+        # to protect this math against concurrent writers changing the table between the COUNT and the upsert
+        inserted = max(len(batch) - existing_records, 0)
+        updated = min(max((affected_rows - inserted) // 2, 0), existing_records)
+
+        result_dict['inserted'] += inserted
+        result_dict['updated'] += updated
+        result_dict['unchanged'] += existing_records - updated
+
+    log.info("Wrote {0} records into {1}.{2}: {3} inserted, {4} updated and {5} unchanged.".format(str(len(record_list)), str(database_name), str(table_name), str(result_dict['inserted']), str(result_dict['updated']),
+                                                                                                      str(result_dict['unchanged'])))
+
+    select_cursor.close()
+    change_cursor.close()
+    cnx.close()
+
+    return result_dict
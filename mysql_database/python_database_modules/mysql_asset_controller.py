@@ -5,12 +5,18 @@ import proj_config
 import utils
 import ambi_logger
 import datetime
-from ThingsBoard_REST_API import tb_asset_controller
+import time
+import contextlib
+from ThingsBoard_REST_API import tb_pagination
 from mysql_database.python_database_modules import database_table_updater
 from mysql_database.python_database_modules import mysql_utils
+from mysql_database.python_database_modules import mysql_metadata_sync
+from mysql_database.python_database_modules import mysql_rollup_manager
+from mysql_database.python_database_modules import mysql_query_planner
+from mysql_database.python_database_modules import mysql_env_data_cache
 
 
-def get_asset_env_data(start_date, end_date, variable_list, asset_name=None, asset_id=None, filter_nones=True):
+def get_asset_env_data(start_date, end_date, variable_list, asset_name=None, asset_id=None, filter_nones=True, bucket=None, agg=None, max_points=None, return_plan=False):
     """
     Use this method to retrieve the environmental data between two dates specified by the pair base_date and time_interval, for each of the variables indicated in the variables list and for an asset identified by at least one of the elements in
     the pair asset_name/asset_id.
@@ -23,6 +29,17 @@ def get_asset_env_data(start_date, end_date, variable_list, asset_name=None, ass
     :param asset_id: (str) The id string associated to an asset element in the database, i.e., the 32 byte hexadecimal string in the usual 'xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx' format. This method expects either this element or the asset name to
     be provided before continuing. If none are present, the respective Exception is raised.
     :param filter_nones: (bool) Set this flag to True to exclude any None values from the final result dictionary. Otherwise the method returns all values, including NULL/None ones.
+    :param bucket: (datetime.timedelta) Set this parameter to have the data downsampled by the database: the time window is split into consecutive buckets of this length (see the NOTE below on where they start), and each variable gets a single data point
+    per bucket (with data), with the bucket start as its timestamp and the aggregate of the bucket values as its value. The bucket has to be a whole number of seconds. If omitted, every raw data point is returned.
+    :param agg: (str) The aggregation function to apply to each bucket, one of proj_config.env_data_aggregations: 'avg', 'min', 'max', 'count' (number of non NULL values) or 'last' (the most recent non NULL value). Only valid with a
+    bucket or a max_points. Defaults to 'avg' if any of these is provided without it.
+    :param max_points: (int) Instead of a bucket, set this parameter to the maximum number of data points per variable to get back (at least 3), and the bucket length is chosen to fit it (see mysql_query_planner.plan_env_data_query).
+    :param return_plan: (bool) Set this flag to True to get the query plan, with the source (raw data or rollup) and the time taken by each part of the time window, together with the results, i.e., a (response, plan) tuple, with the plan in
+    the format described in mysql_query_planner.plan_env_data_query
+    NOTE: Bucketed queries are planned by mysql_query_planner: the buckets start at fixed multiples of the bucket length (instead of at start_date, whose partial bucket is identified by start_date itself) and the whole buckets are served from
+    the coarsest device data rollup (see mysql_rollup_manager) that fits a whole number of times in the bucket, with the partial buckets at both ends of the window served from finer data. As with the raw data, the time window includes
+    end_date itself (if it falls on a bucket boundary, its data gets a bucket of its own).
+    NOTE: The whole buckets and the raw data are cached (see mysql_env_data_cache), so repeated queries over sliding windows only retrieve the buckets (or raw data chunks) that are still open, besides the partial buckets at both ends.
     :raise utils.InputValidationException: If any of the inputs fails the initial data type validation or if none of the asset identifiers (name or id) are provided.
     :raise mysql_utils.MySQLDatabaseException: If any errors occur during the database accesses.
     :return response (dict): This method returns a response dictionary in a format that is expected to be serialized and returned as a REST API response further on. For this method, the response dictionary has the following format:
@@ -111,22 +128,26 @@ def get_asset_env_data(start_date, end_date, variable_list, asset_name=None, ass
         raise utils.InputValidationException(message=error_msg)
 
     utils.validate_input_type(variable_list, list)
-    for i in range(0, len(variable_list)):
-        # Check inf the element is indeed a str as expected
-        utils.validate_input_type(variable_list[i], str)
-        # Take the change to normalize it to all lowercase characters
-        variable_list[i] = variable_list[i].lower()
+
+    # Validate and normalize the variable names into a new list instead of changing the one provided (removing elements from a list while iterating over it skips the element right after each removed one)
+    valid_variable_list = []
+    for variable_name in variable_list:
+        # Check if the element is indeed a str as expected
+        utils.validate_input_type(variable_name, str)
+        # Take the chance to normalize it to all lowercase characters
+        variable_name = variable_name.lower()
 
         # And check if it is indeed a valid element
-        if variable_list[i] not in proj_config.ontology_names:
+        if variable_name not in proj_config.ontology_names:
             log.warning("Attention: the environmental variable name provided: {0} is not among the ones supported:\n{1}\nRemoving it from the variable list...".format(
-                str(variable_list[i]),
+                str(variable_name),
                 str(proj_config.ontology_names)
             ))
-            variable_list.remove(variable_list[i])
+        elif variable_name not in valid_variable_list:
+            valid_variable_list.append(variable_name)
 
     # Check if the last operation didn't emptied the whole environmental variable list
-    if len(variable_list) == 0:
+    if len(valid_variable_list) == 0:
         error_msg = "The variable list is empty! Cannot continue until at least one valid environmental variable is provided"
         log.error(error_msg)
         raise utils.InputValidationException(message=error_msg)
@@ -134,7 +155,7 @@ def get_asset_env_data(start_date, end_date, variable_list, asset_name=None, ass
     # The asset_id is one of the most important parameters in this case. Use the provided arguments to either obtain it or make sure the one provided is a valid one. If both parameters were provided (asset_id and asset_name)
     if asset_id:
         # If an asset id was provided, use it to obtain the associated name
-        asset_name_db = retrieve_asset_name(asset_id=asset_id)
+        asset_name_db = mysql_env_data_cache.get_metadata(metadata_key=('asset_name', asset_id), loader=retrieve_asset_name, asset_id=asset_id)
 
         # Check if any names were obtained above and, if so, check if it matches any asset name also provided
         if asset_name:
@@ -149,7 +170,7 @@ def get_asset_env_data(start_date, end_date, variable_list, asset_name=None, ass
 
     if not asset_id and asset_name:
         # Another case: only the asset name was provided but no associated id. Use the respective method to retrieve the asset id from the name
-        asset_id = retrieve_asset_id(asset_name=asset_name)
+        asset_id = mysql_env_data_cache.get_metadata(metadata_key=('asset_id', asset_name), loader=retrieve_asset_id, asset_name=asset_name)
 
         # Check if a valid id was indeed returned (not None)
         if not asset_id:
@@ -162,93 +183,341 @@ def get_asset_env_data(start_date, end_date, variable_list, asset_name=None, ass
             raise utils.InputValidationException(message=error_msg)
 
     utils.validate_input_type(filter_nones, bool)
+    utils.validate_input_type(return_plan, bool)
+
+    # Validate the downsampling parameters
+    if bucket is not None and max_points is not None:
+        error_msg = "Both a bucket ({0}) and a point budget ({1}) were provided. Please provide only one of them.".format(str(bucket), str(max_points))
+        log.error(error_msg)
+        raise utils.InputValidationException(message=error_msg)
+
+    if agg is not None and bucket is None and max_points is None:
+        error_msg = "An aggregation function ({0}) was provided without a bucket. Cannot continue until a bucket length (or a point budget) is provided too!".format(str(agg))
+        log.error(error_msg)
+        raise utils.InputValidationException(message=error_msg)
+
+    if bucket is not None:
+        utils.validate_input_type(bucket, datetime.timedelta)
+
+        if bucket.total_seconds() < 1 or bucket.total_seconds() != int(bucket.total_seconds()):
+            error_msg = "Invalid bucket provided: {0}. The bucket length has to be a positive, whole number of seconds!".format(str(bucket))
+            log.error(error_msg)
+            raise utils.InputValidationException(message=error_msg)
+
+    if bucket is not None or max_points is not None:
+        if agg is None:
+            agg = 'avg'
+
+        utils.validate_input_type(agg, str)
+        agg = agg.lower()
+
+        if agg not in proj_config.env_data_aggregations:
+            error_msg = "The aggregation function provided: {0} is not among the ones supported: {1}".format(str(agg), str(proj_config.env_data_aggregations))
+            log.error(error_msg)
+            raise utils.InputValidationException(message=error_msg)
+
+    # Decide where each part of the time window is read from (this validates the point budget too)
+    plan = mysql_query_planner.plan_env_data_query(start_date=start_date, end_date=end_date, bucket=bucket, max_points=max_points)
+
+    # Initial input validation cleared. Retrieve the devices associated to the asset (cached, as the asset lookups above, see mysql_env_data_cache)
+    database_name = user_config.access_info['mysql_database']['database']
+    device_id_list = mysql_env_data_cache.get_metadata(metadata_key=('asset_devices', asset_id), loader=retrieve_asset_device_ids, asset_id=asset_id)
+
+    log.info("Asset (asset_name = {0}, asset_id = {1}) has {2} devices associated.".format(str(asset_name), str(asset_id), str(len(device_id_list))))
+
+    # The database connection is only opened if some of the data is not in the cache
+    with contextlib.ExitStack() as exit_stack:
+        cnx_list = []
+
+        def get_cnx():
+            if not cnx_list:
+                cnx_list.append(exit_stack.enter_context(mysql_utils.db_connection(database_name=database_name)))
+
+            return cnx_list[0]
+
+        # Run the plan, one segment at a time. The segments are in time order, so the data points of each variable remain in time order too
+        result_dict = {}
+        for segment in plan['segment_list']:
+            segment_start_time = time.time()
+
+            if proj_config.env_data_cache_enabled and (segment['kind'] == 'middle' or (segment['kind'] == 'single' and segment['bucket'] is None)):
+                segment_result_dict = _select_cached_env_data(get_cnx=get_cnx, asset_id=asset_id, device_id_list=device_id_list, variable_list=valid_variable_list, segment=segment, filter_nones=filter_nones, agg=agg)
+            else:
+                segment_result_dict = _select_env_data(cnx=get_cnx(), device_id_list=device_id_list, variable_list=valid_variable_list, start_date=segment['start'], end_date=segment['end'], filter_nones=filter_nones,
+                                                       bucket=segment['bucket'], agg=agg, source=segment['source'], end_inclusive=segment['end_inclusive'])
+
+            segment['elapsed'] = time.time() - segment_start_time
+
+            for variable_name in segment_result_dict:
+                result_dict.setdefault(variable_name, []).extend(segment_result_dict[variable_name])
+
+    log.info("Environmental data query for asset (asset_name = {0}, asset_id = {1}) answered with:\n{2}".format(str(asset_name), str(asset_id), mysql_query_planner.format_query_plan(plan=plan)))
+
+    if return_plan:
+        return result_dict, plan
+
+    return result_dict
+
+
+def retrieve_asset_device_ids(asset_id):
+    """
+    This method returns the ids of all the devices associated to an asset, as registered in the asset/device relations table.
+    :param asset_id: (str) The id of the asset
+    :raise utils.InputValidationException: If the input argument fails the data type validation
+    :raise mysql_utils.MySQLDatabaseException: If any errors occur when accessing the database or if the asset has no devices associated
+    :return device_id_list: (list of str) The ids of the devices associated to the asset
+    """
+    log = ambi_logger.get_logger(__name__)
+
+    utils.validate_id(entity_id=asset_id)
 
-    # Initial input validation cleared. Before moving any further, implement the database access objects and use them to retrieve a unique, single name/id pair for the asset in question
     database_name = user_config.access_info['mysql_database']['database']
     asset_device_table_name = proj_config.mysql_db_tables['asset_devices']
-    device_data_table_name = proj_config.mysql_db_tables['device_data']
 
-    cnx = mysql_utils.connect_db(database_name=database_name)
-    select_cursor = cnx.cursor(buffered=True)
+    with mysql_utils.db_connection(database_name=database_name) as cnx:
+        select_cursor = cnx.cursor(buffered=True)
 
-    # All ready for data retrieval. First, retrieve the device_id for every device associated to the given asset
-    sql_select = """SELECT toId, toName FROM """ + str(asset_device_table_name) + """ WHERE fromEntityType = %s AND fromId = %s AND toEntityType = %s;"""
+        sql_select = """SELECT toId, toName FROM """ + str(asset_device_table_name) + """ WHERE fromEntityType = %s AND fromId = %s AND toEntityType = %s;"""
+        select_cursor = mysql_utils.run_sql_statement(cursor=select_cursor, sql_statement=sql_select, data_tuple=('ASSET', asset_id, 'DEVICE'))
 
-    select_cursor = mysql_utils.run_sql_statement(cursor=select_cursor, sql_statement=sql_select, data_tuple=('ASSET', asset_id, 'DEVICE'))
+        # Analyse the execution results
+        if select_cursor.rowcount == 0:
+            error_msg = "Asset (asset_id = {0}) has no devices associated to it! Cannot continue...".format(str(asset_id))
+            log.error(msg=error_msg)
+            select_cursor.close()
+            raise mysql_utils.MySQLDatabaseException(message=error_msg)
 
-    # Analyse the execution results
-    if select_cursor.rowcount is 0:
-        error_msg = "Asset (asset_name = {0}, asset_id = {1}) has no devices associated to it! Cannot continue...".format(str(asset_name), str(asset_id))
-        log.error(msg=error_msg)
+        device_id_list = [record[0] for record in select_cursor.fetchall()]
         select_cursor.close()
-        cnx.close()
-        raise mysql_utils.MySQLDatabaseException(message=error_msg)
+
+    return device_id_list
+
+
+def _select_cached_env_data(get_cnx, asset_id, device_id_list, variable_list, segment, filter_nones, agg):
+    """
+    Cached version of _select_env_data, for the query plan segments made of whole buckets (the 'middle' ones) and for the raw data queries. The segment is split into data units (its buckets or, for the raw data, fixed time chunks of
+    proj_config.env_data_cache_raw_chunk) and only the units that are not cached, or that are still open, are retrieved from the database, one query per run of consecutive missing units. The closed units retrieved (the ones that ended more
+    than proj_config.env_data_cache_settle_delay ago, since late data can still come in for the more recent ones) are then stored in the cache for the next calls.
+    :param get_cnx: (function) Returns the database connection to use (opening it on the first call)
+    :param asset_id: (str) The id of the asset
+    :param device_id_list: (list of str) The ids of the devices associated to the asset
+    :param variable_list: (list of str) The (already validated) variable names (ontology names) to retrieve
+    :param segment: (dict) The query plan segment, as returned by mysql_query_planner.plan_env_data_query
+    :param filter_nones: (bool) Set this flag to True to exclude any None values from the result dictionary
+    :param agg: (str) The (already validated) aggregation function to apply to each bucket
+    :raise mysql_utils.MySQLDatabaseException: If any errors occur during the database access
+    :return result_dict: (dict) The data retrieved, in the format described in get_asset_env_data. Variables without any data points in the segment are left out
+    """
+    if segment['bucket'] is None:
+        unit_length = proj_config.env_data_cache_raw_chunk
+        unit_descriptor = ('raw', filter_nones)
+        unit_start = mysql_env_data_cache.floor_to_grid(date=segment['start'], unit_length=unit_length)
     else:
-        log.info("Asset (asset_name = {0}, asset_id = {1}) has {2} devices associated.".format(str(asset_name), str(asset_id), str(select_cursor.rowcount)))
+        unit_length = segment['bucket']
+        unit_descriptor = ('bucket', int(unit_length.total_seconds()), agg, filter_nones)
+        unit_start = segment['start']
+
+    # List the units that overlap the segment. For the buckets, the data at the segment end (if included) is not a whole unit, so it's retrieved separately below
+    unit_start_list = []
+    while unit_start < segment['end'] or (segment['end_inclusive'] and segment['bucket'] is None and unit_start == segment['end']):
+        unit_start_list.append(unit_start)
+        unit_start += unit_length
+
+    # Grab what's already in the cache. A unit only counts as cached if all the variables are there for it (it's a single query for all the variables anyway). Units that end after settle_limit are still open
+    settle_limit = datetime.datetime.now() - proj_config.env_data_cache_settle_delay
+    unit_data_dict = {}
+    missing_unit_start_list = []
+
+    for unit_start in unit_start_list:
+        if unit_start + unit_length > settle_limit:
+            missing_unit_start_list.append(unit_start)
+            continue
+
+        unit_variable_dict = {}
+        for variable_name in variable_list:
+            point_list = mysql_env_data_cache.get_data_unit(unit_key=(asset_id, variable_name, unit_descriptor, unit_start), device_id_list=device_id_list)
+
+            if point_list is None:
+                break
+
+            unit_variable_dict[variable_name] = point_list
+        else:
+            unit_data_dict[unit_start] = unit_variable_dict
+            continue
 
-    # Extract the devices id's to a list for easier iteration later on
-    record = select_cursor.fetchone()
-    device_id_list = []
+        missing_unit_start_list.append(unit_start)
 
-    while record:
-        device_id_list.append(record[0])
+    # Retrieve the missing units, a run of consecutive units at a time
+    run_list = []
+    for unit_start in missing_unit_start_list:
+        if run_list and run_list[-1][1] == unit_start:
+            run_list[-1][1] = unit_start + unit_length
+        else:
+            run_list.append([unit_start, unit_start + unit_length])
 
-        # Grab another one
-        record = select_cursor.fetchone()
+    for run_start, run_end in run_list:
+        run_result_dict = _select_env_data(cnx=get_cnx(), device_id_list=device_id_list, variable_list=variable_list, start_date=run_start, end_date=run_end, filter_nones=filter_nones, bucket=segment['bucket'], agg=agg,
+                                           source=segment['source'], end_inclusive=False)
 
-    # Prepare a mash up of all device_id retrieved so far separated by OR statements to replace the last element in the SQL SELECT statement to execute later on
-    device_id_string = []
+        # Split the results back into units (including the empty ones, which are worth caching too)
+        unit_start = run_start
+        while unit_start < run_end:
+            unit_data_dict[unit_start] = dict([(variable_name, []) for variable_name in variable_list])
+            unit_start += unit_length
 
-    for _ in device_id_list:
-        device_id_string.append("deviceId = %s")
+        for variable_name, point_list in run_result_dict.items():
+            for point in point_list:
+                # Clamped to the run, just in case the local time conversion of the timestamp shifts it (daylight saving time changes)
+                point_unit_start = mysql_env_data_cache.floor_to_grid(date=datetime.datetime.fromtimestamp(int(point['timestamp'])), unit_length=unit_length, origin=run_start)
+                point_unit_start = min(max(point_unit_start, run_start), run_end - unit_length)
 
-    # And now connect them all into a single string stitched together with 'OR's
-    device_where_str = """ OR """.join(device_id_string)
+                unit_data_dict[point_unit_start][variable_name].append(point)
+
+        unit_start = run_start
+        while unit_start < run_end:
+            if unit_start + unit_length <= settle_limit:
+                for variable_name in variable_list:
+                    mysql_env_data_cache.put_data_unit(unit_key=(asset_id, variable_name, unit_descriptor, unit_start), point_list=unit_data_dict[unit_start][variable_name], device_id_list=device_id_list, unit_start=unit_start,
+                                                       unit_end=unit_start + unit_length)
+
+            unit_start += unit_length
+
+    # Put the segment together. The raw data chunks at both ends can go past the segment, so their data points need to be filtered. The data points are copied on the way out, since the cached ones are shared
+    start_timestamp = int(segment['start'].timestamp())
+    end_timestamp = int(segment['end'].timestamp())
 
-    # Store the full results in this dictionary
     result_dict = {}
+    for unit_start in unit_start_list:
+        for variable_name in variable_list:
+            for point in unit_data_dict[unit_start][variable_name]:
+                if segment['bucket'] is None:
+                    point_timestamp = int(point['timestamp'])
 
-    # Prepare the SQL SELECT to retrieve data from
-    for i in range(0, len(variable_list)):
-        # And the partial results in this one
-        sql_select = """SELECT timestamp, value FROM """ + str(device_data_table_name) + """ WHERE ontologyId = %s AND (""" + str(device_where_str) + """) AND (timestamp >= %s AND timestamp <= %s);"""
+                    if point_timestamp < start_timestamp or point_timestamp > end_timestamp or (point_timestamp == end_timestamp and not segment['end_inclusive']):
+                        continue
 
-        # Prepare the data tuple by joining together the current ontologyId with all the deviceIds retrieved from before
-        data_tuple = tuple([variable_list[i]] + device_id_list + [start_date] + [end_date])
+                result_dict.setdefault(variable_name, []).append(dict(point))
 
-        select_cursor = mysql_utils.run_sql_statement(cursor=select_cursor, sql_statement=sql_select, data_tuple=data_tuple)
+    # The data at the segment end gets a bucket of its own (the one that starts there, cut short at the end of the segment), always from the database
+    if segment['end_inclusive'] and segment['bucket'] is not None:
+        end_result_dict = _select_env_data(cnx=get_cnx(), device_id_list=device_id_list, variable_list=variable_list, start_date=segment['end'], end_date=segment['end'], filter_nones=filter_nones, bucket=segment['bucket'], agg=agg,
+                                           source='raw', end_inclusive=True)
 
-        # Analyse the execution outcome
-        if select_cursor.rowcount > 0:
-            # Results came back for this particular ontologyId. For this method, the information of the device that made the measurement is irrelevant. Create a dictionary entry for the ontologyId parameter and populate the list of dictionaries
-            # with the data retrieved
-            result_dict[variable_list[i]] = []
+        for variable_name, point_list in end_result_dict.items():
+            result_dict.setdefault(variable_name, []).extend(point_list)
 
-            # Process the database records
-            record = select_cursor.fetchone()
+    return result_dict
 
-            while record:
-                # Check if the filtering flag is set
-                if filter_nones:
-                    # And if so, check if the current record has a None as its value
-                    if record[1] is None:
-                        # If so, grab the next record and skip the rest of this cycle
-                        record = select_cursor.fetchone()
-                        continue
 
-                result_dict[variable_list[i]].append(
-                    {
-                        "timestamp": str(int(record[0].timestamp())),
-                        "value": str(record[1])
-                    }
-                )
+def _select_env_data(cnx, device_id_list, variable_list, start_date, end_date, filter_nones=True, bucket=None, agg=None, source='raw', end_inclusive=True):
+    """
+    Retrieves the environmental data for all the variables and devices provided with a single SELECT. The rows are streamed from the database (unbuffered cursor) ordered by ontologyId and timestamp and grouped into the result dictionary as
+    they arrive, in a single pass. The query is served by the tb_device_data_env_idx covering index (ontologyId, deviceId, timestamp, value), so the database doesn't need to touch the table rows at all (check
+    mysql_database/thingsboard_ambiosensing_tables/add_device_data_env_index.sql)
+    If a bucket is provided, the database groups the rows by variable and time bucket (the number of whole buckets between start_date and the row timestamp) and returns only the aggregate for each group, so the amount of data transferred and
+    formatted depends on the number of buckets and not on the number of raw data points. The rows can come from one of the rollup tables instead of the raw data (as decided by mysql_query_planner).
+    :param cnx: (mysql.connector.connection.MySQLConnection) An open database connection
+    :param device_id_list: (list of str) The ids of the devices whose data is to be retrieved
+    :param variable_list: (list of str) The (already validated) variable names (ontology names) to retrieve
+    :param start_date: (datetime.datetime) The beginning of the time window for data retrieval
+    :param end_date: (datetime.datetime) The end of the time window for data retrieval
+    :param filter_nones: (bool) Set this flag to True to exclude any None values from the result dictionary
+    :param bucket: (datetime.timedelta) The (already validated) bucket length, or None to retrieve the raw data points
+    :param agg: (str) The (already validated) aggregation function to apply to each bucket
+    :param source: (str) Where to read the data from: 'raw' for the device data table or a rollup resolution ('1m', '1h' or '1d') for the respective rollup table. The rollups can only be used with a bucket
+    :param end_inclusive: (bool) If the data at end_date itself is to be included. The rollups stop short of it (their bucket starting at end_date has data past it), so with a rollup source the data at end_date is read from the raw data
+    :raise mysql_utils.MySQLDatabaseException: If any errors occur during the database access
+    :return result_dict: (dict) The data retrieved, in the format described in get_asset_env_data. Only the variables with at least one record in the time window get an entry in the dictionary
+    """
+    device_data_table_name = proj_config.mysql_db_tables['device_data']
+
+    where_str = """ WHERE ontologyId IN (""" + """, """.join(['%s'] * len(variable_list)) + """) AND deviceId IN (""" + """, """.join(['%s'] * len(device_id_list)) + """) AND timestamp >= %s AND timestamp """ + \
+                ("""<=""" if end_inclusive else """<""") + """ %s"""
+    where_data_list = variable_list + device_id_list + [start_date, end_date]
+
+    if bucket is None:
+        sql_select = """SELECT ontologyId, timestamp, value FROM """ + str(device_data_table_name) + where_str + """ ORDER BY ontologyId, timestamp;"""
+        data_tuple = tuple(where_data_list)
+    else:
+        bucket_seconds = int(bucket.total_seconds())
+
+        # 'last' has no aggregate function of its own. The values of each group are concatenated from the newest to the oldest and only the first one is kept (the concatenation skips NULLs, hence the most recent non NULL value)
+        agg_expression_dict = {
+            'avg': """AVG(value)""",
+            'min': """MIN(value)""",
+            'max': """MAX(value)""",
+            'count': """COUNT(value)""",
+            'last': """SUBSTRING_INDEX(GROUP_CONCAT(value ORDER BY timestamp DESC SEPARATOR ','), ',', 1)"""
+        }
+
+        if source == 'raw':
+            sql_select = """SELECT ontologyId, FLOOR(TIMESTAMPDIFF(SECOND, %s, timestamp) / %s) AS bucketIndex, """ + agg_expression_dict[agg] + """ FROM """ + str(device_data_table_name) + where_str + \
+                         """ GROUP BY ontologyId, bucketIndex ORDER BY ontologyId, bucketIndex;"""
+        else:
+            # Same query, but over the rollup buckets instead of the raw data points. The rollup window is half open, since the bucket starting at end_date has data past it: if end_date is to be included, its raw data points are added to the
+            # rollup buckets as single value 'buckets' of their own, which the aggregates below handle just like the rollup ones
+            rollup_expression_dict = {
+                'avg': """SUM(valueSum) / NULLIF(SUM(valueCount), 0)""",
+                'min': """MIN(valueMin)""",
+                'max': """MAX(valueMax)""",
+                'count': """SUM(valueCount)""",
+                'last': """SUBSTRING_INDEX(GROUP_CONCAT(lastValue ORDER BY lastTimestamp DESC SEPARATOR ','), ',', 1)"""
+            }
+
+            rollup_where_str = """ WHERE ontologyId IN (""" + """, """.join(['%s'] * len(variable_list)) + """) AND deviceId IN (""" + """, """.join(['%s'] * len(device_id_list)) + \
+                               """) AND bucketStart >= %s AND bucketStart < %s"""
 
-                # Grab the next record in line
-                record = select_cursor.fetchone()
+            rollup_source_str = """SELECT ontologyId, bucketStart, """ + """, """.join(mysql_rollup_manager.rollup_value_column_list) + """ FROM """ + mysql_rollup_manager.get_rollup_table_name(resolution=source) + rollup_where_str
+
+            if end_inclusive:
+                rollup_source_str += """ UNION ALL SELECT ontologyId, timestamp, IF(value IS NULL, 0, 1), value, value, value, value, IF(value IS NULL, NULL, timestamp) FROM """ + str(device_data_table_name) + \
+                                     """ WHERE ontologyId IN (""" + """, """.join(['%s'] * len(variable_list)) + """) AND deviceId IN (""" + """, """.join(['%s'] * len(device_id_list)) + """) AND timestamp = %s"""
+                where_data_list = where_data_list + variable_list + device_id_list + [end_date]
+
+            sql_select = """SELECT ontologyId, FLOOR(TIMESTAMPDIFF(SECOND, %s, bucketStart) / %s) AS bucketIndex, """ + rollup_expression_dict[agg] + """ FROM (""" + rollup_source_str + \
+                         """) AS rollupData GROUP BY ontologyId, bucketIndex ORDER BY ontologyId, bucketIndex;"""
+
+        data_tuple = tuple([start_date, bucket_seconds] + where_data_list)
+
+    # An unbuffered cursor hands out the rows as they arrive from the server, instead of loading the whole result set to memory first
+    select_cursor = cnx.cursor(buffered=False)
+    select_cursor = mysql_utils.run_sql_statement(cursor=select_cursor, sql_statement=sql_select, data_tuple=data_tuple)
+
+    result_dict = {}
+    current_ontology_id = None
+    current_data_list = None
+
+    for record in select_cursor:
+        # The rows come grouped by ontologyId, so a new list is only needed when it changes. For this method, the information of the device that made the measurement is irrelevant
+        if record[0] != current_ontology_id:
+            current_ontology_id = record[0]
+            current_data_list = result_dict.setdefault(current_ontology_id, [])
+
+        # Skip the NULL values if the filtering flag is set
+        if filter_nones and record[2] is None:
+            continue
+
+        if bucket is None:
+            timestamp = record[1]
+        else:
+            # Each bucket is identified by its start
+            timestamp = start_date + datetime.timedelta(seconds=bucket_seconds * int(record[1]))
+
+        value = record[2]
+
+        # Depending on the connector version, GROUP_CONCAT results can come back as bytes
+        if isinstance(value, (bytes, bytearray)):
+            value = value.decode('UTF-8')
+
+        current_data_list.append(
+            {
+                "timestamp": str(int(timestamp.timestamp())),
+                "value": str(value)
+            }
+        )
 
-    # All done it seems. Close down the database access elements and return the results so far
     select_cursor.close()
-    cnx.close()
+
     return result_dict
 
 
@@ -380,33 +649,30 @@ def retrieve_asset_name(asset_id):
             return asset_name
 
 
-def update_tenant_assets_table():
+def update_tenant_assets_table(diff_sync=False):
     """
     Method to populate the database table with all the ASSETS belonging to a given tenant. I'm still trying to figure out the actual logic behind this call since the API service that I call to retrieve the desired information uses a
     'customer_user' type credential pair but the results returned are related to the Tenant that is associated to Customer identified by those credentials (why not use the 'tenant_admin' credentials instead? Makes more sense in my honest opinion.
     In fact, using those credentials yields a HTTP 403 - access denied - response from the remote server... go figure...) so the relation with a Tenant is tenuous, at best. Anyhow, what matters is that all configured assets in the ThingsBoard
     platform seem to be returned at once by the tb side method, so now its just a matter of putting them into a proper database table
+    :param diff_sync: (bool) Set this flag to compare all the assets returned with the current table contents and write only the new, changed or deleted ones, in bulk (see mysql_metadata_sync.sync_table_records), instead of writing every asset
+    one by one
     :raise mysql_utils.MySQLDatabaseException: For errors with the database operation
     :raise utils.ServiceEndpointException: For errors with the remote API service execution
     :raise utils.AuthenticationException: For errors related with the authentication credentials used.
     """
 
+    utils.validate_input_type(diff_sync, bool)
+
     # Key to return the actual database name from proj_config.mysql_db_tables dictionary
     module_table_key = 'tenant_assets'
-    # A generous limit number to retrieve all results in the remote API side
-    limit = 50
 
-    # Grab the response from the remote API then
-    response = tb_asset_controller.getTenantAssets(limit=limit)
-
-    # Translate the response got and convert it to the expected dictionary
-    response_dict = eval(utils.translate_postgres_to_python(response.text))
-
-    # And retrieve the core of the stuff I'm interested into
-    asset_list = response_dict['data']
+    # Grab the assets from the remote API then, page by page. The iterator keeps on requesting pages until there are no more assets left to return
+    asset_iterator = tb_pagination.iterate_tenant_assets()
 
     # Process the returned assets one by one
-    for asset in asset_list:
+    asset_record_list = []
+    for asset in asset_iterator:
         # Suppress the 'tenantId' sub-dictionary by replacing it by its 'id' parameter with a new key that matches a column name now. A tenantId already implies a TENANT entityType, so the later is redundant and can go out
         asset['tenantId'] = asset['tenantId']['id']
 
@@ -422,5 +688,14 @@ def update_tenant_assets_table():
         except KeyError:
             pass
 
-        # All set. Invoke the database updater then
-        database_table_updater.add_table_data(asset, proj_config.mysql_db_tables[module_table_key])
+        # All set. Invoke the database updater then (or keep the asset for the diff sync at the end)
+        if diff_sync:
+            asset_record_list.append(asset)
+        else:
+            database_table_updater.add_table_data(asset, proj_config.mysql_db_tables[module_table_key], upsert=True)
+
+    if diff_sync:
+        mysql_metadata_sync.sync_table_records(record_list=asset_record_list, table_name=proj_config.mysql_db_tables[module_table_key])
+
+    # The cached asset names and ids may be outdated now
+    mysql_env_data_cache.invalidate_metadata()
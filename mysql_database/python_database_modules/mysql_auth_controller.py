@@ -5,9 +5,26 @@ import utils
 import user_config
 import proj_config
 import datetime
+import threading
+import base64
+import json
+import requests
 from mysql_database.python_database_modules import mysql_utils
 from ThingsBoard_REST_API import tb_auth_controller
 
+# The user types supported by the ThingsBoard installation
+supported_user_types = ['sys_admin', 'tenant_admin', 'customer_user']
+
+# Process-wide authorization token cache, in the format {user_type: (token, expiry_datetime)}. Every REST call needs a token, and going to the database and checking it remotely every time costs two extra round trips per call. Cached tokens are
+# reused until proj_config.auth_token_refresh_margin before their expiry date (which is read directly from the token itself). Each user type has its own lock, so that concurrent callers needing a refresh wait for a single one instead of each
+# requesting their own
+_auth_token_cache = {}
+_auth_token_locks = {user_type: threading.Lock() for user_type in supported_user_types}
+
+# Background token refresher (see start_token_refresher) thread and the event used to stop it
+_token_refresher_thread = None
+_token_refresher_stop_event = threading.Event()
+
 
 def populate_auth_table():
     """Use this method to request a new set of valid authorization tokens for all defined user types and to write them into the database. By default, this method starts by cleaning out any records currently in the authorization table in the
@@ -26,6 +43,9 @@ def populate_auth_table():
 
     populate_auth_log.info("Cleaning out {0}.{1}...".format(str(database_name), str(table_name)))
 
+    # All the tokens are about to be replaced, so the cached ones have to go too
+    invalidate_auth_token()
+
     # Prepare the DELETE statement by deleting all records older than a datetime argument
     sql_delete = """DELETE FROM """ + str(table_name) + """ WHERE token_timestamp < %s;"""
 
@@ -70,8 +90,9 @@ def populate_auth_table():
 
 def get_auth_token(user_type):
     """This is going to be the go-to method in this module. This method receives one of the supported user types ('SYS_ADMIN', 'TENANT_ADMIN' or 'CUSTOMER_USER') and fetches the respective authorization token. What this method does to get it is
-    abstracted from the user. This method automatically checks the usual suspects first: database table. If there's any token in there for the provided user type, it then tests it to see if it is still valid. If not, it then tries to use the
-    refresh token to issue a valid one and, if that is also not possible, request a new pair of authentication and refresh tokens.
+    abstracted from the user. The process-wide token cache is checked first: if it has a token for the user type that is not about to expire (the expiry date is decoded locally from the token itself, no remote calls needed), that one is returned
+    straight away. Otherwise the usual suspects are checked (see _retrieve_auth_token), or the cached token is renewed using its refresh token, and the result is cached for the next calls. Concurrent callers that need a new token for the same
+    user type share a single retrieval.
     This method should be integrated into basic service calls to save the user to deal with the whole authorization token logistics
     @:param user_type (str) - One of the following supported user types: sys_admin, tenant_admin, customer_user (the case type of this argument is irrelevant because I will take care of it later on)
     @:raise utils.InputValidationException - If an invalid argument is provided
@@ -87,11 +108,245 @@ def get_auth_token(user_type):
 
     # Set the user type string to all lower case characters to simplify comparisons from this point on
     user_type = user_type.lower()
-    supported_user_types = ['sys_admin', 'tenant_admin', 'customer_user']
 
     if user_type not in supported_user_types:
         raise utils.InputValidationException("Invalid user type provided: '{0}'. Please provided one of these: {1}".format(str(user_type), str(supported_user_types)))
 
+    # The fast path: a cached token that is still good. No locks, no database and no remote calls
+    cached_token = _get_cached_auth_token(user_type=user_type)
+    if cached_token is not None:
+        return cached_token
+
+    with _auth_token_locks[user_type]:
+        # Someone else may have refreshed the token while this thread was waiting for the lock. Check again
+        cached_token = _get_cached_auth_token(user_type=user_type)
+        if cached_token is not None:
+            return cached_token
+
+        if user_type in _auth_token_cache:
+            # There's a cached token, but it is about to expire. It was valid, which means that so is its refresh token, so skip the whole database check and renew it directly
+            auth_token_log.info("The cached authorization token for user type {0} is about to expire. Renewing it...".format(str(user_type)))
+            auth_token = _renew_auth_token(user_type=user_type)
+        else:
+            auth_token = _retrieve_auth_token(user_type=user_type)
+
+            # The token may be valid right now but close to its expiry date. Renew it straight away in that case
+            token_expiry = _get_token_expiry(auth_token=auth_token)
+            if token_expiry is not None and datetime.datetime.now() >= token_expiry - proj_config.auth_token_refresh_margin:
+                auth_token_log.info("The authorization token for user type {0} is about to expire. Renewing it...".format(str(user_type)))
+                auth_token = _renew_auth_token(user_type=user_type)
+
+        _cache_auth_token(user_type=user_type, auth_token=auth_token)
+
+        return auth_token
+
+
+def invalidate_auth_token(user_type=None):
+    """Use this method to drop authorization tokens from the process-wide cache, forcing the next get_auth_token call to go through the full retrieval process again (if a token was revoked in the remote server, for instance).
+    @:param user_type (str) - The user type whose token is to be dropped. All cached tokens are dropped if this one is omitted
+    @:raise utils.InputValidationException - If an invalid argument is provided"""
+    if user_type is None:
+        _auth_token_cache.clear()
+    else:
+        utils.validate_input_type(user_type, str)
+        _auth_token_cache.pop(user_type.lower(), None)
+
+
+def start_token_refresher(user_type_list=None, check_interval=None):
+    """Use this method in long running processes (backfills, collectors running for hours, etc.) to keep the authorization tokens fresh from a background thread. The refresher thread wakes up every check_interval seconds and renews (using the
+    refresh token stored in the database) any of the tracked tokens that is within proj_config.auth_token_refresher_lead of its expiry date, updating both the database and the token cache. Since this lead time is larger than the margin used by
+    get_auth_token, the requests never find an expiring token in the cache in steady state and never have to wait for a renewal. Calling this method with the refresher already running does nothing.
+    @:param user_type_list (list of str) - The user types whose tokens are to be kept fresh. Defaults to ['tenant_admin'], which is the one used by the data collection services
+    @:param check_interval (int) - Number of seconds between checks. Defaults to proj_config.auth_token_refresher_interval
+    @:raise utils.InputValidationException - If an invalid argument is provided
+    @:raise utils.AuthenticationException - If the authentication credentials are not correct
+    @:raise utils.ServiceEndpointException - If the call to the remote service fails
+    @:raise mysql_utils.MySQLDatabaseException - If problems arise when dealing with the database"""
+    global _token_refresher_thread
+
+    log = ambi_logger.get_logger(__name__)
+
+    if user_type_list is None:
+        user_type_list = ['tenant_admin']
+    else:
+        utils.validate_input_type(user_type_list, list)
+        for user_type in user_type_list:
+            utils.validate_input_type(user_type, str)
+
+            if user_type.lower() not in supported_user_types:
+                raise utils.InputValidationException("Invalid user type provided: '{0}'. Please provided one of these: {1}".format(str(user_type), str(supported_user_types)))
+
+        user_type_list = [user_type.lower() for user_type in user_type_list]
+
+    if check_interval is None:
+        check_interval = proj_config.auth_token_refresher_interval
+    else:
+        utils.validate_input_type(check_interval, int)
+
+    if is_token_refresher_running():
+        log.info("The token refresher is already running.")
+        return
+
+    # Make sure all tracked tokens are in the cache before starting. This is the last time that a caller waits for a token
+    for user_type in user_type_list:
+        get_auth_token(user_type=user_type)
+
+    _token_refresher_stop_event.clear()
+    _token_refresher_thread = threading.Thread(target=_run_token_refresher, args=(user_type_list, check_interval), name='auth_token_refresher', daemon=True)
+    _token_refresher_thread.start()
+
+    log.info("Started the background token refresher for user types {0} (checking every {1} s).".format(str(user_type_list), str(check_interval)))
+
+
+def is_token_refresher_running():
+    """Simple method to check if the background token refresher is currently running.
+    @:return running (bool) - True if the refresher thread is alive, False otherwise"""
+    return _token_refresher_thread is not None and _token_refresher_thread.is_alive()
+
+
+def stop_token_refresher():
+    """Stops the background token refresher started with start_token_refresher, if it is running, and waits for its thread to finish."""
+    global _token_refresher_thread
+
+    if _token_refresher_thread is None:
+        return
+
+    _token_refresher_stop_event.set()
+    _token_refresher_thread.join()
+    _token_refresher_thread = None
+
+    ambi_logger.get_logger(__name__).info("Stopped the background token refresher.")
+
+
+def _run_token_refresher(user_type_list, check_interval):
+    """The body of the background token refresher thread. Errors are logged and retried in the next check instead of killing the thread: if the refresher fails for long enough, get_auth_token simply falls back to renewing the tokens itself.
+    @:param user_type_list (list of str) - The user types whose tokens are to be kept fresh, already validated and in lower case
+    @:param check_interval (int) - Number of seconds between checks"""
+    log = ambi_logger.get_logger(__name__)
+
+    while not _token_refresher_stop_event.is_set():
+        for user_type in user_type_list:
+            cached_entry = _auth_token_cache.get(user_type)
+
+            # Only renew the tokens that are getting close to expiry (or that are not in the cache anymore)
+            if cached_entry is not None and datetime.datetime.now() < cached_entry[1] - proj_config.auth_token_refresher_lead:
+                continue
+
+            try:
+                # Take the same lock used by get_auth_token, so that a request that happens to need a token at this exact moment waits for this renewal instead of doing its own
+                with _auth_token_locks[user_type]:
+                    if cached_entry is None:
+                        auth_token = _retrieve_auth_token(user_type=user_type)
+                    else:
+                        auth_token = _renew_auth_token(user_type=user_type)
+
+                    _cache_auth_token(user_type=user_type, auth_token=auth_token)
+            except (utils.AuthenticationException, utils.InputValidationException, utils.ServiceEndpointException, mysql_utils.MySQLDatabaseException, requests.exceptions.RequestException) as e:
+                log.error("The token refresher was unable to renew the authorization token for user type {0}: {1}. Trying again in {2} s...".format(str(user_type), str(e), str(check_interval)))
+            except Exception:
+                # Anything else is unexpected, but it still shouldn't kill the thread: log it with the traceback and keep going
+                log.exception("Unexpected error in the token refresher while renewing the authorization token for user type {0}. Trying again in {1} s...".format(str(user_type), str(check_interval)))
+
+        _token_refresher_stop_event.wait(timeout=check_interval)
+
+
+def _cache_auth_token(user_type, auth_token):
+    """Simple method to add an authorization token to the process-wide cache, along with its expiry date. Tokens without a readable expiry date are not cached (and any previous token for the same user type is dropped).
+    @:param user_type (str) - One of the supported user types, already validated and in lower case
+    @:param auth_token (str) - The authorization token to cache"""
+    token_expiry = _get_token_expiry(auth_token=auth_token)
+
+    if token_expiry is None:
+        # Without an expiry date there's no way to tell when the token stops being valid. Don't cache it then: the next call does the full check again
+        ambi_logger.get_logger(__name__).warning("Unable to read the expiry date of the authorization token for user type {0}. The token is not going to be cached.".format(str(user_type)))
+        _auth_token_cache.pop(user_type, None)
+    else:
+        _auth_token_cache[user_type] = (auth_token, token_expiry)
+
+
+def _get_cached_auth_token(user_type):
+    """Simple method to return the cached authorization token for the user type provided, as long as it is not within proj_config.auth_token_refresh_margin of its expiry date.
+    @:param user_type (str) - One of the supported user types, already validated and in lower case
+    @:return token (str) - The cached authorization token or None if there isn't a valid one in cache"""
+    cached_entry = _auth_token_cache.get(user_type)
+
+    if cached_entry is not None and datetime.datetime.now() < cached_entry[1] - proj_config.auth_token_refresh_margin:
+        return cached_entry[0]
+
+    return None
+
+
+def _get_token_expiry(auth_token):
+    """The authorization tokens issued by the ThingsBoard server are JSON Web Tokens (JWT), i.e., three base64url encoded strings separated by dots (header.payload.signature). The payload is a JSON dictionary with the token claims, among which
+    there's the 'exp' one with the POSIX timestamp (in seconds) of the token's expiry date. This method decodes this claim locally, which is enough to know if a token is still valid without asking the remote server about it. NOTE: The signature is
+    not verified here (there's no need to: the token came from the server in the first place).
+    @:param auth_token (str) - The authorization token to decode
+    @:return token_expiry (datetime.datetime) - The expiry date of the token, or None if it cannot be decoded from the token"""
+    log = ambi_logger.get_logger(__name__)
+
+    try:
+        payload = auth_token.split('.')[1]
+        # base64 needs the padding that the JWT encoding drops
+        payload += '=' * (-len(payload) % 4)
+        claim_dict = json.loads(base64.urlsafe_b64decode(payload.encode('utf-8')).decode('utf-8'))
+        return datetime.datetime.fromtimestamp(int(claim_dict['exp']))
+    except (IndexError, ValueError, TypeError, KeyError, AttributeError) as e:
+        log.warning("Unable to decode the expiry date of the authorization token provided: {0}".format(str(e)))
+        return None
+
+
+def _renew_auth_token(user_type):
+    """This method uses the refresh token stored in the database to get a new pair of authorization/refresh tokens for the user type provided (tb_auth_controller.refresh_session_token requests a brand new pair instead if the refresh token is also
+    expired), updates the respective record in the database and returns the new authorization token.
+    @:param user_type (str) - One of the supported user types, already validated and in lower case
+    @:raise utils.AuthenticationException - If the authentication credentials are not correct
+    @:raise utils.ServiceEndpointException - If the call to the remote service fails
+    @:raise mysql_utils.MySQLDatabaseException - If problems arise when dealing with the database
+    @:return token (str) - The new authorization token"""
+    log = ambi_logger.get_logger(__name__)
+
+    new_auth_dict = tb_auth_controller.refresh_session_token(sys_admin=(user_type == 'sys_admin'), tenant_admin=(user_type == 'tenant_admin'), customer_user=(user_type == 'customer_user'))
+
+    database_name = user_config.mysql_db_access['database']
+    table_name = proj_config.mysql_db_tables['authentication']
+    column_list = mysql_utils.get_table_columns(database_name=database_name, table_name=table_name)
+
+    cnx = mysql_utils.connect_db(database_name=database_name)
+    change_cursor = cnx.cursor(buffered=True)
+
+    # Same UPDATE as the one done in _retrieve_auth_token for expired tokens: user_type, token, token_timestamp, refreshToken, refreshToken_timestamp and user_type again (because of the WHERE clause in the UPDATE)
+    sql_update = mysql_utils.create_update_sql_statement(column_list=column_list, table_name=table_name, trigger_column_list=['user_type'])
+    update_data_tuple = (user_type, new_auth_dict[user_type]['token'], datetime.datetime.now().replace(microsecond=0), new_auth_dict[user_type]['refreshToken'], datetime.datetime.now().replace(microsecond=0), user_type)
+
+    change_cursor = mysql_utils.run_sql_statement(change_cursor, sql_update, update_data_tuple)
+
+    if not change_cursor.rowcount:
+        error_msg = "Could not update {0}.{1} with '{2}' statement...".format(str(database_name), str(table_name), str(change_cursor.statement))
+        log.error(error_msg)
+        change_cursor.close()
+        cnx.close()
+        raise mysql_utils.MySQLDatabaseException(message=error_msg)
+
+    cnx.commit()
+    change_cursor.close()
+    cnx.close()
+
+    log.info("Renewed the authorization token for user type {0} in {1}.{2}.".format(str(user_type), str(database_name), str(table_name)))
+
+    return new_auth_dict[user_type]['token']
+
+
+def _retrieve_auth_token(user_type):
+    """This method does the full (and expensive) authorization token retrieval, without going through the token cache. It checks the usual suspects first: database table. If there's any token in there for the provided user type, it then tests it
+    (remotely) to see if it is still valid. If not, it then tries to use the refresh token to issue a valid one and, if that is also not possible, request a new pair of authentication and refresh tokens.
+    @:param user_type (str) - One of the supported user types, already validated and in lower case
+    @:raise utils.AuthenticationException - If the authentication credentials are not correct
+    @:raise utils.ServiceEndpointException - If the call to the remote service fails
+    @:raise mysql_utils.MySQLDatabaseException - If problems arise when dealing with the database
+    @:return token (str) - A valid authorization token that can be used to authenticate a remote service call"""
+
+    auth_token_log = ambi_logger.get_logger(__name__)
+
     # All seems good so far. Lets check the database first
     database_name = user_config.mysql_db_access['database']
     table_name = proj_config.mysql_db_tables['authentication']
@@ -124,7 +379,7 @@ def get_auth_token(user_type):
         token_status_dict = None
 
         if token_status_response.text != "":
-            token_status_dict = eval(utils.translate_postgres_to_python(token_status_response.text))
+            token_status_dict = utils.decode_json_response(token_status_response.text)
 
         # This particular annoying case in which a valid authorization token from a different installation is used in this case. In this case, the installation accepts the token, since it has the expected format, but internally it gets rejected
         # because the credential pair that originated it obviously doesn't match! But somehow the API fails to mention this! Instead, the damn thing accepts the token and even returns HTTP 200 responses to my requests but these come back all
@@ -132,7 +387,7 @@ def get_auth_token(user_type):
         # forcing a token refresh
         if token_status_response.status_code != 200 or token_status_response.text == "":
             # Check the most usual case for a non-HTTP 200 return: HTTP 401 with sub-errorCode (its embedded in the response text) 11 - the authorization token has expired
-            if token_status_response.status_code == 401 and eval(token_status_response.text)['errorCode'] == 11:
+            if token_status_response.status_code == 401 and utils.decode_json_response(token_status_response.text)['errorCode'] == 11:
                 # Inform the user first
                 auth_token_log.warning("The authorization token for user type = {0} retrieved from {1}.{2} is expired. Requesting new one...".format(str(user_type), str(database_name), str(table_name)))
             elif token_status_response.text == "":
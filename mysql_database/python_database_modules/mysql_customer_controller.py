@@ -3,28 +3,27 @@
 import proj_config
 import utils
 from mysql_database.python_database_modules import database_table_updater
-from ThingsBoard_REST_API import tb_customer_controller
+from ThingsBoard_REST_API import tb_pagination
 from mysql_database.python_database_modules import mysql_utils
+from mysql_database.python_database_modules import mysql_metadata_sync
 
 
-def update_customer_table():
+def update_customer_table(diff_sync=False):
     """Use this method to run an update on the MySQL table where the customer data is aggregated. This method places a call to retrieve the latest customer related data from the remote API and uses the table updater to decide what to do regarding
-    the various returned records: insert a new record in the MySQL database, update an existing database record or do nothing (if the existing and returned records are identical)"""
+    the various returned records: insert a new record in the MySQL database, update an existing database record or do nothing (if the existing and returned records are identical)
+    @:param diff_sync (bool) - Set this flag to compare all the customers returned with the current table contents and write only the new, changed or deleted ones, in bulk (see mysql_metadata_sync.sync_table_records), instead of writing every
+    customer one by one
+    """
+    utils.validate_input_type(diff_sync, bool)
 
     module_table_key = 'customers'
-    limit = 50
 
-    # Grab the data from the remote API
-    response = tb_customer_controller.getCustomers(limit=limit)
-
-    # Translate the response text to replace the PostGres-speak returned for Python-speak. And cast that text into a dictionary too
-    response_dict = eval(utils.translate_postgres_to_python(response.text))
-
-    # Extract the list of customers from the returned dictionary under the 'data' key
-    customer_list = response_dict['data']
+    # Grab the data from the remote API, all pages of it. The iterator returns the customers from the 'data' key of each page, one by one
+    customer_iterator = tb_pagination.iterate_customers()
 
     # And process them one by one
-    for customer in customer_list:
+    customer_record_list = []
+    for customer in customer_iterator:
         # The customer table has an almost one-to-one correspondence between the dictionary keys returned in each customer and the column names in the MySQL database, except for the sub dictionary that is passed under the tenantId key (which as a
         # 'entityType and a id keys and strings as values). In the MySQL database I've condensed that entry into a column named 'tenantId' that should receive just the string under the 'id' key from the current customer dictionary. This means that
         # I should replace this sub dictionary for a 'tenantId': <id_string> at this point or otherwise this process is going to crash later on when it tries to send that data to be added to the customers table
@@ -41,5 +40,11 @@ def update_customer_table():
             # If the customer structure doesn't have that key, ignore it.
             pass
 
-        # Send the data to be added to the MySQL database in the customers table
-        database_table_updater.add_table_data(data_dict=customer, table_name=proj_config.mysql_db_tables[module_table_key])
+        # Send the data to be added to the MySQL database in the customers table (or keep it for the diff sync at the end)
+        if diff_sync:
+            customer_record_list.append(customer)
+        else:
+            database_table_updater.add_table_data(data_dict=customer, table_name=proj_config.mysql_db_tables[module_table_key], upsert=True)
+
+    if diff_sync:
+        mysql_metadata_sync.sync_table_records(record_list=customer_record_list, table_name=proj_config.mysql_db_tables[module_table_key])
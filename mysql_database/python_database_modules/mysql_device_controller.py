@@ -4,13 +4,23 @@ import ambi_logger
 import proj_config
 import user_config
 import utils
+import bisect
+import itertools
+import concurrent.futures
+import threading
 from mysql_database.python_database_modules import database_table_updater
 from mysql_database.python_database_modules import mysql_utils
+from mysql_database.python_database_modules import mysql_metadata_sync
 from ThingsBoard_REST_API import tb_device_controller
+from ThingsBoard_REST_API import tb_pagination
 from ThingsBoard_REST_API import tb_telemetry_controller
 
+# In-memory registry of the devices in tb_devices (see _get_device_registry). It is loaded from the database once, on the first lookup, and dropped by invalidate_device_registry whenever the table is rewritten
+_device_registry = None
+_device_registry_lock = threading.Lock()
 
-def update_devices_table(customer_name=False):
+
+def update_devices_table(customer_name=False, diff_sync=False):
     """The logic behind this module is quite similar to the one employed in the update_tenant_table(): it gets a similar data structure in (with all the same annoying problems), has to do the same kind of processing and so on. As with the other
     method, I'm going to write a insert and an update methods that can call each other depending on the context: both methods detect what is going on in the database and then act accordingly.
     @:param customer_name (str) - OPTIONAL parameter. There are essentially multiple ways to retrieve device dictionary data from the remote API. So far, I've created support for retrieving device data from the getTenantsDevices method,
@@ -18,31 +28,18 @@ def update_devices_table(customer_name=False):
     using tenant data only retrieves devices that are associated to a tenant, as well as using customer data only returns devices associated to a customer. So, ideally, I should use both methods and merge the resulting list before running the
     table_updater method. The problem is that the customer based method requires a customer_id that is retrieved using a more memorable customer_name (and also because I've implemented a more flexible way to retrieve this data when the complete
     customer_name is not completely known), so I can only get the additional result sets if the customer_name is passed on to this method. So, if this argument is omitted, this method uses just the tenant data. If not, both data sets are retrieved.
+    @:param diff_sync (bool) - Set this flag to compare all the devices returned with the current table contents and write only the new, changed or deleted ones (see mysql_metadata_sync.sync_table_records). Otherwise, all devices are upserted
     @:raise utils.InputValidationException - If the inputs fail validation
     @:raise Exception - If other errors occur.
     """
     module_table_key = 'devices'
-    # Use the same limit value for both calls
-    # limit = 50
-    pageSize = 100
-    page = 0
     update_devices_log = ambi_logger.get_logger(__name__)  # __name__ is a method fingerprint (from python native) and contains a unique path
 
-    # Get the base response using just tenant data
-    # tenant_response = tb_device_controller.getTenantDevices(limit=limit)
-    tenant_response = tb_device_controller.getTenantDevices(pageSize=pageSize, page=page)
-
-    # Translate the stuff that comes from the ThingsBoard API as PostGres-speak to Python-speak before forwarding the data
-    tenant_response_dict = eval(utils.translate_postgres_to_python(tenant_response.text))  # Converts the response.text into a dictionary (eval is a python native method :D )
-
-    # Test if all results came back with the current limit setting
-    if tenant_response_dict['hasNext']:
-        update_devices_log.warning("Not all results from the remote API were returned on the last call using tenant data (limit = {0}). Raise the limit parameter to retrieve more of them.".format(str(limit)))
+    utils.validate_input_type(diff_sync, bool)
 
-    # Extract the device data to a list
-    tenant_device_list = tenant_response_dict['data']
+    # Get the base device iterator using just tenant data. The page iterators go through all the pages of results from the remote API, requesting the next page while the devices in the current one are being processed
+    device_iterator_list = [tb_pagination.iterate_tenant_devices()]
 
-    customer_device_list = None
     # Check if its possible to use the customer data too to retrieve customer associated devices
     if customer_name:
         # Validate it first
@@ -52,58 +49,49 @@ def update_devices_table(customer_name=False):
             update_devices_log.error(ive.message)
             raise ive
 
-        # Input validated. Proceed to query the API using the same limit
-        customer_response = tb_device_controller.getCustomerDevices(customer_name=customer_name, limit=limit)
+        # Input validated. Chain the customer device iterator after the tenant one
+        device_iterator_list.append(tb_pagination.iterate_customer_devices(customer_name=customer_name))
+
+    # Devices can be associated to customers and to tenants simultaneously, so the same device can come up in both iterators. Both device data retrieval methods use the exact same data structure to format these results, so keeping track of the
+    # device ids already processed is enough to process only one record per device
+    processed_device_id_set = set()
+    device_list = []
+    timeseries_keys_future_list = []
+
+    # Each device needs its timeseries keys requested from the remote API (more on that below). These requests are independent from each other, so they are all placed through a bounded pool of workers, as soon as each device comes in from the
+    # page iterators, instead of one after the other
+    with concurrent.futures.ThreadPoolExecutor(max_workers=proj_config.device_sync_max_workers) as executor:
+        # The rest of the code should work with either just tenant based devices or also with customer based ones
+        for device in itertools.chain(*device_iterator_list):
+            # Skip the devices that came up already
+            if device['id']['id'] in processed_device_id_set:
+                continue
 
-        # Translate it to Python and cast the response to a dictionary
-        customer_response_dict = eval(utils.translate_postgres_to_python(customer_response.text))
+            processed_device_id_set.add(device['id']['id'])
 
-        # Test if the customer bound results were truncated by the limit value
-        if customer_response_dict['hasNext']:
-            update_devices_log.warning("Not all results from the remote API were returned on the last call using customer data (limit = {0}). Raise the limit parameter to retrieve more of them.".format(str(limit)))
+            # Unlike the tenant processing method, the devices data has a couple of redundant fields that I decide to remove for sake of simplicity. Namely, the result dictionary for each device entry returns two keys: tenantId and CustomerId which
+            # are sub-dictionaries with the format {'entityType': string, 'id': string}. I'm only interested in the id field (because I can use it later to do JOIN statements using the id field and main correlation). The entityType associated
+            # value for those case is 'TENANT' and 'CUSTOMER', which is a bit redundant given that it is already implicit in the parent key. As such, I decided to create database columns named respectively tenantId and customerId but are set to
+            # VARCHAR type to store just the id string. So, for this to work later on I need to replace these sub-dictionaries by just the id strings. Otherwise the list of values is not going to match the number of database columns
+            device['tenantId'] = device['tenantId']['id']
+            device['customerId'] = device['customerId']['id']
 
-        # Extract the records into a list
-        customer_device_list = customer_response_dict['data']
+            # I still have one more customization to do in this service. Subsequent calls for device data from the ThingsBoard remote API require 5 specific and mandatory elements: the entityType, entityId, timeseriesKey,
+            # startTimestamp and endTimestamp. The first 2 are covered by the device_controller.getTenantDevices method and the last 2 are set by the user (not method dependent). So I'm only missing the timeseriesKey at this point to be able to
+            # do bulk requests for device data. To obtain that, I need to place a specific call to a remote API service, namely the telemetry_controller.getTimeseriesKey method. This method requires the device's entityKey and entityId that were
+            # just returned from the previous API call. The thingsboard_devices_table already has an 'extra' column names timeseriesKey at the end to include this element so now its just a matter of putting it into the dictionary to return.
+            # Humm... it seems that there are sensors that can provide readings from multiple sources (the device can be a multi-sensor array that uses a single interface to communicate
+            # The result of the next request is always a list with as many elements as the number of supported timeSeriesKeys by the device identified (one per supported reading/sensor)
+            device_list.append(device)
+            timeseries_keys_future_list.append(executor.submit(tb_telemetry_controller.getTimeseriesKeys, device['id']['entityType'], device['id']['id']))
 
-    # And then try to add it, one by one, to the database table. The lazy way to do this is to add records indiscriminately to the database and let it, along with the database_table_updater module that is called to do just that,
-    # to sort through possible repeated records (devices can be associated to customers and to tenants simultaneously) with their internal tools. But fortunately I've detected that both device data retrieval methods use the exact same data
-    # structure to format these results, hence a quick comparison should be enough to be able to collate a list with only one record per device in it
+        # All requests placed. Collect the results, in the same order as the devices. Any exception raised by a request comes up at this point
+        timeseries_keys_list = [timeseries_keys_future.result() for timeseries_keys_future in timeseries_keys_future_list]
 
-    # Start by picking the tenant device list as the default
-    device_list = tenant_device_list
-
-    # If another list was retrieved from the customer data too
-    if customer_device_list:
-        # Go through all the customer associated devices
-        for customer_device in customer_device_list:
-            # And if a record is deemed repeated
-            if customer_device in device_list:
-                # Ignore it and move to the next one in line
-                continue
-            # Otherwise
-            else:
-                # Add it to the main list
-                device_list.append(customer_device)
-
-    # The rest of the code should work with either just a tenant based device list or one with also customer based devices
-    for device in device_list:
-        # Unlike the tenant processing method, the devices data has a couple of redundant fields that I decide to remove for sake of simplicity. Namely, the result dictionary for each device entry returns two keys: tenantId and CustomerId which
-        # are sub-dictionaries with the format {'entityType': string, 'id': string}. I'm only interested in the id field (because I can use it later to do JOIN statements using the id field and main correlation). The entityType associated value
-        # for those case is 'TENANT' and 'CUSTOMER', which is a bit redundant given that it is already implicit in the parent key. As such, I decided to create database columns named respectively tenantId and customerId but are set to VARCHAR type
-        # to store just the id string. So, for this to work later on I need to replace these sub-dictionaries by just the id strings. Otherwise the list of values is not going to match the number of database columns
-        device['tenantId'] = device['tenantId']['id']
-        device['customerId'] = device['customerId']['id']
-
-        # I still have one more customization to do in this service. Subsequent calls for device data from the ThingsBoard remote API require 5 specific and mandatory elements: the entityType, entityId, timeseriesKey,
-        # startTimestamp and endTimestamp. The first 2 are covered by the device_controller.getTenantDevices method and the last 2 are set by the user (not method dependent). So I'm only missing the timeseriesKey at this point to be able to do
-        # bulk requests for device data. To obtain that, I need to place a specific call to a remote API service, namely the telemetry_controller.getTimeseriesKey method. This method requires the device's entityKey and entityId that were just
-        # returned from the previous API call. This method, if correctly call, returns a single string with the name that the PostGres database from the API side is using to store the device data. It is not optimal to create a single table with
-        # just a column with this data (or even with two additional entityType and entityId) when I can simply add a new one to the existing thingsboard_devices_table and place a call at this point to the other API service that returns just that
-        # and concatenate it to the existing data dictionary. The thingsboard_devices_table already has an 'extra' column names timeseriesKey at the end to include this element so now its just a matter of putting it into the dictionary to return.
-        # Humm... it seems that there are sensors that can provide readings from multiple sources (the device can be a multi-sensor array that uses a single interface to communicate
-        # The return from the next statement is always a list with as many elements as the number of supported timeSeriesKeys by the device identified (one per supported reading/sensor)
-        timeseries_keys = tb_telemetry_controller.getTimeseriesKeys(device['id']['entityType'], device['id']['id'])
+    update_devices_log.info("Retrieved the timeseries keys for {0} devices.".format(str(len(device_list))))
 
+    device_record_list = []
+    for device, timeseries_keys in zip(device_list, timeseries_keys_list):
         # The database entry needs to contain all elements returned in the list in timeseries_keys variable
         # Add an extra entry to the device dictionary to be used on the database population operation. The str.join() operation is going to concatenate all elements in the timeseries_keys using a comma to separate them in a single string.
         # Also, this approach has the advantage that if an API request is built from this data (retrieved from the database of course), this format allows for a direct call - no post processing required at all. This is because of how these types
@@ -123,15 +111,28 @@ def update_devices_table(customer_name=False):
         except KeyError:
             pass
 
-        database_table_updater.add_table_data(device, proj_config.mysql_db_tables[module_table_key])
+        device_record_list.append(device)
+
+    if diff_sync:
+        # Write only what changed since the last sync (the sync method logs the outcome)
+        mysql_metadata_sync.sync_table_records(record_list=device_record_list, table_name=proj_config.mysql_db_tables[module_table_key])
+    else:
+        # Write all the devices at once, with the batched upsert writer
+        result_dict = database_table_updater.add_table_data_batch(data_dict_list=device_record_list, table_name=proj_config.mysql_db_tables[module_table_key])
+
+        update_devices_log.info("Devices table synchronized: {0} inserted, {1} updated, {2} unchanged.".format(str(result_dict['inserted']), str(result_dict['updated']), str(result_dict['unchanged'])))
+
+    # The device table was just rewritten. The in-memory registry is stale now
+    invalidate_device_registry()
 
 
 def get_device_credentials(device_name):
     """
     This method simplifies a recurring task: determining the entityType, entityId and timeseriesKeys associated to the device identified by 'device_name'.
     Since most remote services provided by the Thingsboard remote API are fond of using this entityType/entityId pair to uniquely identify every entity configured in the platform (tenants, customers, devices, etc.) but us humans are more keen to
-    rely on names to identify the same entities, this method integrates both approaches for the devices context: it searches the current database entries for the name provided and, if a unique result is obtained, returns its associated entityType,
-    entityId and timeseriesKeys.
+    rely on names to identify the same entities, this method integrates both approaches for the devices context: it searches the current device entries for the name provided and, if a unique result is obtained, returns its associated entityType,
+    entityId and timeseriesKeys. The search is done in the in-memory device registry (no database accesses, apart from the initial registry load) with the same progressively wider criteria used so far: exact name, then names ending with
+    'device_name', then names starting with it and, finally, names containing it, stopping as soon as a single device is found. All comparisons are case insensitive, like the LIKE comparisons in the database.
     @:param device_name (str) - The name of the device, as it should be defined via the 'name' field in the respective Thingsboard installation
     @:raise utils.InputValidationException - If the input fails initial validation
     @:raise mysql_utils.MySQLDatabaseException - If the database access incurs in problems
@@ -142,49 +143,181 @@ def get_device_credentials(device_name):
 
     utils.validate_input_type(device_name, str)
 
-    # Create the typical database access objects
-    database_name = user_config.access_info['mysql_database']['database']
-    table_name = proj_config.mysql_db_tables['devices']
-    cnx = mysql_utils.connect_db(database_name=database_name)
-    select_cursor = cnx.cursor(buffered=True)
-
-    # Now for the tricky part: to run a SQL SELECT using the device name as the only filter and ensuring than one and only one record is returned. For this I'm going to use the SQL 'LIKE' operator and using all four wildcard options in the search
-    # field: 'device_name', '%device_name', 'device_name%' and '%device_name%'.
-    search_vector = [device_name, '%' + device_name, device_name + '%', '%' + device_name + '%']
-    sql_select = """SELECT entityType, id, timeseriesKeys FROM """ + table_name + """ WHERE name LIKE %s;"""
-
-    # Run a SQL SELECT with all elements of the search vector, stopping the loop as soon as a single record gets returned back
-    result = None
-    for i in range(0, len(search_vector)):
-        select_cursor = mysql_utils.run_sql_statement(cursor=select_cursor, sql_statement=sql_select, data_tuple=(search_vector[i],))
-
-        if select_cursor.rowcount != 1:
-            log.warning("Searching for name = {0}. Got {1} results back. Expanding search with new wildcards...".format(str(search_vector[i]), str(select_cursor.rowcount)))
-            # Ignore the rest of this loop in this case then
-            continue
-        else:
-            log.info("Got an unique record while searching for name = {0}. Moving on".format(str(search_vector[i])))
-            # Set the result parameter
-            result = select_cursor.fetchone()
-            # Get out of this loop in this case
-            break
-
-    # Check if a valid result was found. Continue if so, return None otherwise
-    if result is None:
-        log.warning("Could not retrieve an unique record for device_name = {0} in {1}.{2}. Nothing more to do...".format(str(device_name), str(database_name), str(table_name)))
-        return None
+    registry = _get_device_registry()
+
+    # Repeated lookups (the same devices are looked up over and over during data collection) are answered straight from the lookup cache
+    if device_name in registry['lookup_cache']:
+        device_entry = registry['lookup_cache'][device_name]
     else:
-        # Extract the timeseriesKey string to a list of strings and prepare the return tuple
-        timeseriesKeys_list = []
+        device_entry = _search_device_registry(registry=registry, device_name=device_name)
+        registry['lookup_cache'][device_name] = device_entry
+
+    if device_entry is None:
+        log.warning("Could not retrieve an unique record for device_name = {0} in {1}.{2}. Nothing more to do...".format(str(device_name), str(user_config.access_info['mysql_database']['database']),
+                                                                                                                    str(proj_config.mysql_db_tables['devices'])))
+        return None
+
+    # Return a copy of the timeseries keys list, so that the registry entry cannot be changed by the caller
+    return device_entry['entityType'], device_entry['id'], list(device_entry['timeseriesKeys'])
+
+
+def get_device_by_id(device_id):
+    """
+    Simple method to retrieve a device's registry entry from its id.
+    @:param device_id (str) - The id of the device to retrieve
+    @:raise utils.InputValidationException - If the input fails initial validation
+    @:raise mysql_utils.MySQLDatabaseException - If the database access incurs in problems
+    @:return device_entry (dict) - A dictionary with the device's 'name', 'entityType', 'id' and 'timeseriesKeys' (list of str), or None if no device exists with the id provided
+    """
+    utils.validate_input_type(device_id, str)
+
+    device_entry = _get_device_registry()['id_index'].get(device_id)
+
+    if device_entry is None:
+        return None
+
+    return dict(device_entry, timeseriesKeys=list(device_entry['timeseriesKeys']))
+
+
+def invalidate_device_registry():
+    """
+    Drops the in-memory device registry. The next lookup loads it again from tb_devices. Call this one whenever the tb_devices table is changed.
+    """
+    global _device_registry
+
+    with _device_registry_lock:
+        _device_registry = None
+
+
+def _normalize_device_name(device_name):
+    """
+    Simple method to put device names into the form used by the registry indexes: no surrounding white spaces and all in lower case (which matches the case insensitive comparisons done by MySQL)
+    @:param device_name (str) - The device name to normalize
+    @:return normalized_name (str) - The normalized device name
+    """
+    return device_name.strip().lower()
+
 
-        # The list of timeseries keys is kept in the database as single string with all elements separated with a comma: timeseriesKeys = "timeseriesKey1,timeseriesKey2,...,timeseriesKeyN"
-        tokens = result[2].split(',')
+def _get_device_registry():
+    """
+    This method returns the in-memory device registry, loading it from tb_devices first if needed. The registry is a dictionary with the following indexes:
+    registry = {
+        'name_index': {name (str): device_entry},                               # Exact names
+        'normalized_index': {normalized_name (str): [device_entry, ...]},       # Normalized names (there can be more than one device per normalized name)
+        'id_index': {id (str): device_entry},                                   # Device ids
+        'prefix_list': [normalized_name (str), ...],                            # Sorted normalized names, for prefix searches
+        'suffix_list': [reversed_normalized_name (str), ...],                   # Sorted reversed normalized names, for suffix searches
+        'lookup_cache': {device_name (str): device_entry or None}               # Results of previous lookups
+    }
+    where each device_entry is a dictionary with the device's 'name', 'entityType', 'id' and 'timeseriesKeys' (list of str)
+    @:raise mysql_utils.MySQLDatabaseException - If the database access incurs in problems
+    @:return registry (dict) - The device registry
+    """
+    global _device_registry
+
+    # Double checked locking: only one thread loads the registry
+    registry = _device_registry
+    if registry is not None:
+        return registry
+
+    with _device_registry_lock:
+        if _device_registry is not None:
+            return _device_registry
+
+        log = ambi_logger.get_logger(__name__)
+
+        database_name = user_config.access_info['mysql_database']['database']
+        table_name = proj_config.mysql_db_tables['devices']
+        cnx = mysql_utils.connect_db(database_name=database_name)
+        select_cursor = cnx.cursor(buffered=True)
+
+        sql_select = """SELECT name, entityType, id, timeseriesKeys FROM """ + str(table_name) + """;"""
+        select_cursor = mysql_utils.run_sql_statement(cursor=select_cursor, sql_statement=sql_select, data_tuple=())
+
+        registry = {'name_index': {}, 'normalized_index': {}, 'id_index': {}, 'prefix_list': [], 'suffix_list': [], 'lookup_cache': {}}
+
+        for result in select_cursor.fetchall():
+            if result[0] is None:
+                continue
+
+            # The list of timeseries keys is kept in the database as single string with all elements separated with a comma: timeseriesKeys = "timeseriesKey1,timeseriesKey2,...,timeseriesKeyN"
+            device_entry = {'name': result[0], 'entityType': result[1], 'id': result[2], 'timeseriesKeys': (result[3] or "").split(',')}
+
+            normalized_name = _normalize_device_name(result[0])
+
+            registry['name_index'][result[0]] = device_entry
+            registry['normalized_index'].setdefault(normalized_name, []).append(device_entry)
+            registry['id_index'][result[2]] = device_entry
+
+        select_cursor.close()
+        cnx.close()
+
+        registry['prefix_list'] = sorted(registry['normalized_index'].keys())
+        registry['suffix_list'] = sorted([normalized_name[::-1] for normalized_name in registry['normalized_index'].keys()])
+
+        log.info("Loaded {0} devices from {1}.{2} into the device registry.".format(str(len(registry['id_index'])), str(database_name), str(table_name)))
+
+        _device_registry = registry
+        return registry
+
+
+def _search_device_registry(registry, device_name):
+    """
+    This method does the actual device search in the registry, using progressively wider criteria and stopping as soon as one of them finds a single device:
+    1. Exact name (case sensitive and then normalized)
+    2. Normalized names ending with the normalized device_name (binary search over the sorted reversed names)
+    3. Normalized names starting with the normalized device_name (binary search over the sorted names)
+    4. Normalized names containing the normalized device_name (full scan, but only reached when everything else fails)
+    @:param registry (dict) - The device registry, as returned by _get_device_registry
+    @:param device_name (str) - The name of the device to search for
+    @:return device_entry (dict) - The registry entry of the device found, or None if no single device could be found
+    """
+    log = ambi_logger.get_logger(__name__)
+
+    if device_name in registry['name_index']:
+        return registry['name_index'][device_name]
+
+    normalized_name = _normalize_device_name(device_name)
+
+    # Each search is only run if all the previous ones failed, hence the lambdas
+    search_list = [
+        ("name = {0}".format(str(device_name)), lambda: registry['normalized_index'].get(normalized_name, [])),
+        ("name = %{0}".format(str(device_name)), lambda: _find_by_prefix(sorted_list=registry['suffix_list'], prefix=normalized_name[::-1], registry=registry, reverse=True)),
+        ("name = {0}%".format(str(device_name)), lambda: _find_by_prefix(sorted_list=registry['prefix_list'], prefix=normalized_name, registry=registry)),
+        ("name = %{0}%".format(str(device_name)), lambda: [device_entry for name in registry['prefix_list'] if normalized_name in name for device_entry in registry['normalized_index'][name]])
+    ]
+
+    for search_description, search_function in search_list:
+        device_entry_list = search_function()
+
+        if len(device_entry_list) != 1:
+            log.warning("Searching for {0}. Got {1} results back. Expanding search...".format(str(search_description), str(len(device_entry_list))))
+            continue
+
+        log.info("Got an unique record while searching for {0}. Moving on".format(str(search_description)))
+        return device_entry_list[0]
+
+    return None
+
+
+def _find_by_prefix(sorted_list, prefix, registry, reverse=False):
+    """
+    Simple method to find all the registry entries whose normalized names (or reversed normalized names) start with the prefix provided, using a binary search over the sorted list of names.
+    @:param sorted_list (list of str) - The sorted list of normalized names (or reversed normalized names) to search
+    @:param prefix (str) - The prefix to search for
+    @:param registry (dict) - The device registry, as returned by _get_device_registry
+    @:param reverse (bool) - Set this one to True if the sorted_list contains reversed names
+    @:return device_entry_list (list of dict) - The registry entries found
+    """
+    device_entry_list = []
 
-        for i in range(0, len(tokens)):
-            timeseriesKeys_list.append(tokens[i])
+    index = bisect.bisect_left(sorted_list, prefix)
+    while index < len(sorted_list) and sorted_list[index].startswith(prefix):
+        name = sorted_list[index][::-1] if reverse else sorted_list[index]
+        device_entry_list.extend(registry['normalized_index'][name])
+        index += 1
 
-        # All done. Return the final structure then
-        return result[0], result[1], timeseriesKeys_list
+    return device_entry_list
 
 
 def get_device_types():
@@ -197,9 +330,9 @@ def get_device_types():
     response = tb_device_controller.getDeviceTypes()
 
     if response.status_code != 200:
-        error_msg = "Received a HTTP {0} with the message {1}".format(str(response.status_code), str(eval(response.text)['message']))
+        error_msg = "Received a HTTP {0} with the message {1}".format(str(response.status_code), str(utils.decode_json_response(response.text)['message']))
         log.error(msg=error_msg)
         raise utils.ServiceEndpointException(message=error_msg)
 
-    return eval(utils.translate_postgres_to_python(response.text))
+    return utils.decode_json_response(response.text)
 
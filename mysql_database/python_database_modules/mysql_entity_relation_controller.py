@@ -1,125 +1,150 @@
 """ Place holder for methods related to the interface between the MySQL database (MySQL internal Ambiosensing database) and the data obtained from service calls placed to the API group entity-relation-controller"""
-from mysql_database.python_database_modules import mysql_utils, mysql_asset_controller, mysql_device_controller
+from mysql_database.python_database_modules import mysql_utils, mysql_asset_controller, mysql_device_controller, mysql_metadata_sync, mysql_env_data_cache
 from ThingsBoard_REST_API import tb_entity_relation_controller
 import ambi_logger
+import concurrent.futures
 import user_config
 import proj_config
 import utils
 
 
-def update_asset_devices_table():
+def update_asset_devices_table(refresh_dependencies=True):
     """Use this method to fill out the asset devices table that corresponds devices to the assets that are related to them. The idea here is to use ASSETs to represent spaces and the ThingsBoard relation property to associate DEVICEs to those
     assets as a way to represent the devices currently installed and monitoring that space
+    @:param refresh_dependencies (bool) - If True (the default), the assets and devices tables are refreshed first, since the relations are built from their contents. Set it to False if these were refreshed right before this call (as in the
+    __maintenance__ job graph, where this job depends on those two)
     @:raise mysql_utils.MySQLDatabaseException - For problems related with the database access
     @:raise utils.ServiceEndpointException - For issues related with the remote API call
     @:raise utils.AuthenticationException - For problems related with the authentication credentials used"""
 
     asset_devices_log = ambi_logger.get_logger(__name__)
 
+    utils.validate_input_type(refresh_dependencies, bool)
+
     asset_devices_table_name = proj_config.mysql_db_tables['asset_devices']
     assets_table_name = proj_config.mysql_db_tables['tenant_assets']
     devices_table_name = proj_config.mysql_db_tables['devices']
 
-    # Fire up the database access objects
     database_name = user_config.access_info['mysql_database']['database']
-    cnx = mysql_utils.connect_db(database_name=database_name)
-    outer_select_cursor = cnx.cursor(buffered=True)
-    inner_select_cursor = cnx.cursor(buffered=True)
 
-    mysql_utils.reset_table(table_name=asset_devices_table_name)
+    if refresh_dependencies:
+        # First get a list of all the assets supported so far. Refresh the asset database table first of all
+        mysql_asset_controller.update_tenant_assets_table()
+        # And the devices table too since I need data from there too later on
+        mysql_device_controller.update_devices_table()
+
+    # NOTE: The asset devices table is never cleared before being rebuilt. Instead, the full set of relations is built in memory first and only the differences to the current table contents are written at the end, in a single transaction, so that
+    # anyone reading this table in the meantime never sees it empty or half built
 
-    # First get a list of all the assets supported so far. Refresh the asset database table first of all
-    mysql_asset_controller.update_tenant_assets_table()
-    # And the devices table too since I need data from there too later on
-    mysql_device_controller.update_devices_table()
+    # Load all the assets ids, names and types (I need those for later) and the devices names and types too. Each relation returned from the remote API only has the ids of the entities involved, so these dictionaries provide the names and
+    # types for those without a SELECT per relation
+    with mysql_utils.db_connection(database_name=database_name) as cnx:
+        select_cursor = cnx.cursor(buffered=True)
 
-    # And grab all assets ids, names and types (I need those for later)
-    sql_select = """SELECT id, name, type FROM """ + str(assets_table_name) + """;"""
+        sql_select = """SELECT id, name, type FROM """ + str(assets_table_name) + """;"""
+        select_cursor = mysql_utils.run_sql_statement(cursor=select_cursor, sql_statement=sql_select, data_tuple=())
+        asset_info_list = select_cursor.fetchall()
 
-    # Execute the statement with the select cursor
-    outer_select_cursor = mysql_utils.run_sql_statement(cursor=outer_select_cursor, sql_statement=sql_select, data_tuple=())
+        sql_select = """SELECT id, name, type FROM """ + str(devices_table_name) + """;"""
+        select_cursor = mysql_utils.run_sql_statement(cursor=select_cursor, sql_statement=sql_select, data_tuple=())
+        device_info_list = select_cursor.fetchall()
 
-    # Check if any results came back
-    if outer_select_cursor.rowcount <= 0:
-        error_msg = "Unable to get any results from {0}.{1} with '{2}'...".format(str(database_name), str(assets_table_name), str(outer_select_cursor.statement))
+        select_cursor.close()
+
+    # Check if any assets came back
+    if not asset_info_list:
+        error_msg = "Unable to get any results from {0}.{1}...".format(str(database_name), str(assets_table_name))
         asset_devices_log.error(error_msg)
-        outer_select_cursor.close()
-        inner_select_cursor.close()
-        cnx.close()
         raise mysql_utils.MySQLDatabaseException(message=error_msg)
 
-    # Got some results. Process them then
+    # Index the names and types by entity type and id
+    entity_info_dict = {
+        'ASSET': dict([(asset_info[0], (asset_info[1], asset_info[2])) for asset_info in asset_info_list]),
+        'DEVICE': dict([(device_info[0], (device_info[1], device_info[2])) for device_info in device_info_list])
+    }
+
+    # Set the common used parameters for the entity-relation call
+    entityType = "ASSET"
+    relationTypeGroup = "COMMON"
+    direction = "FROM"
+
+    relation_record_list = []
+
+    # For each valid ASSET Id found, run a query in the ThingsBoard side of things for all DEVICEs that have a relation to that asset. These queries are independent from each other, so they are all placed concurrently, with at most
+    # proj_config.relation_sync_max_workers of them in flight at any given time
+    with concurrent.futures.ThreadPoolExecutor(max_workers=proj_config.relation_sync_max_workers) as executor:
+        relation_future_list = [executor.submit(_find_asset_relations, asset_info[0], entityType, relationTypeGroup, direction) for asset_info in asset_info_list]
+
+        # Merge all the results into a single batch of relations, asset by asset (in the same order as the assets). Any exception raised by a query comes up at this point
+        for asset_info, relation_future in zip(asset_info_list, relation_future_list):
+            # Now lets format this info accordingly
+            for relation in relation_future.result():
+                relation_record_list.append(_build_relation_record(relation=relation, asset_info=asset_info, entity_info_dict=entity_info_dict))
+
+    asset_devices_log.info("Retrieved {0} relations for {1} assets.".format(str(len(relation_record_list)), str(len(asset_info_list))))
+
+    # Done with everything, I believe. Write only what changed since the last time, all at once
+    mysql_metadata_sync.sync_table_records(record_list=relation_record_list, table_name=asset_devices_table_name)
+
+    # The cached asset/device associations may be outdated now
+    mysql_env_data_cache.invalidate_metadata()
+
+
+def _find_asset_relations(asset_id, entityType, relationTypeGroup, direction):
+    """
+    Queries the remote API for the relations of a single asset.
+    @:param asset_id (str) - The id of the asset
+    @:param entityType (str) - The entity type to query for
+    @:param relationTypeGroup (str) - The relation type group to query for
+    @:param direction (str) - The direction of the relations to query for
+    @:raise utils.ServiceEndpointException - For issues related with the remote API call
+    @:return relation_list (list of dict) - The relations returned by the remote API
+    """
+    # Query for related devices
+    api_response = tb_entity_relation_controller.findByQuery(entityType=entityType, entityId=asset_id, relationTypeGroup=relationTypeGroup, direction=direction)
+
+    # Get rid of all non-Python terms in the response dictionary and cast it as a list too
+    return utils.decode_json_response(api_response.text)
+
+
+def _build_relation_record(relation, asset_info, entity_info_dict):
+    """
+    Formats a relation returned by the remote API as a record of the asset devices table.
+    @:param relation (dict) - A relation, as returned by tb_entity_relation_controller.findByQuery
+    @:param asset_info (tuple) - The (id, name, type) of the asset where the relation starts
+    @:param entity_info_dict (dict) - The names and types of the assets and devices, in a {entityType: {id: (name, type)}} dictionary
+    @:return data_dict (dict) - The relation record
+    """
+    # Create a dictionary to store all the data to send to the database. For now its easier to manipulate one of these and cast it to a tuple just before executing the statement
+    data_dict = {
+        "fromEntityType": relation["from"]["entityType"],
+        "fromId": relation["from"]["id"],
+        "fromName": asset_info[1],
+        "fromType": asset_info[2],
+        "toEntityType": relation["to"]["entityType"],
+        "toId": relation["to"]["id"],
+        "toName": None,
+        "toType": None,
+        "relationType": relation["type"],
+        "relationGroup": relation["typeGroup"],
+    }
+
+    # As always, take care with the stupid 'description'/'additionalInfo' issue...
+    if relation["additionalInfo"] is not None:
+        try:
+            # Try to get a 'description' from the returned dictionary from the 'additionalInfo' sub dictionary
+            data_dict["description"] = relation["additionalInfo"]["description"]
+        # If the field wasn't set, instead of crashing the code
+        except KeyError:
+            # Simply set this field to None and move on with it...
+            data_dict["description"] = None
     else:
-        # For each valid ASSET Id found in this table, run a query in the ThingsBoard side of things for all DEVICEs that have a relation to that asset and send it to the database
-        asset_info = outer_select_cursor.fetchone()
-
-        # Set the common used parameters for the entity-relation call
-        entityType = "ASSET"
-        relationTypeGroup = "COMMON"
-        direction = "FROM"
-
-        # Run this while there are still asset ids to process
-        while asset_info:
-
-            # Query for related devices
-            api_response = tb_entity_relation_controller.findByQuery(entityType=entityType, entityId=asset_info[0], relationTypeGroup=relationTypeGroup, direction=direction)
-
-            # Get rid of all non-Python terms in the response dictionary and cast it as a list too
-            relation_list = eval(utils.translate_postgres_to_python(api_response.text))
-
-            # Now lets format this info accordingly and send it to the database
-            for relation in relation_list:
-                # Create a dictionary to store all the data to send to the database. For now its easier to manipulate one of these and cast it to a tuple just before executing the statement
-                data_dict = {
-                    "fromEntityType": relation["from"]["entityType"],
-                    "fromId": relation["from"]["id"],
-                    "fromName": asset_info[1],
-                    "fromType": asset_info[2],
-                    "toEntityType": relation["to"]["entityType"],
-                    "toId": relation["to"]["id"],
-                    "toName": None,
-                    "toType": None,
-                    "relationType": relation["type"],
-                    "relationGroup": relation["typeGroup"],
-                }
-
-                # As always, take care with the stupid 'description'/'additionalInfo' issue...
-                if relation["additionalInfo"] is not None:
-                    try:
-                        # Try to get a 'description' from the returned dictionary from the 'additionalInfo' sub dictionary
-                        data_dict["description"] = relation["additionalInfo"]["description"]
-                    # If the field wasn't set, instead of crashing the code
-                    except KeyError:
-                        # Simply set this field to None and move on with it...
-                        data_dict["description"] = None
-                else:
-                    data_dict["description"] = None
-
-                # And now to get the data to use in the INSERT statement. For that I need to do a quick SELECT first since I need info from a different side too
-                if data_dict['toEntityType'] == 'DEVICE':
-                    sql_select = """SELECT name, type FROM """ + str(devices_table_name) + """ WHERE id = %s;"""
-                elif data_dict['toEntityType'] == 'ASSET':
-                    sql_select = """SELECT name, type FROM """ + str(assets_table_name) + """ WHERE id = %s;"""
-
-                data_tuple = (relation['to']['id'],)
-
-                # NOTE: I need to use the change cursor because my select_cursor still has unprocessed results from the previous SELECT execution and using it would delete those
-                inner_select_cursor = mysql_utils.run_sql_statement(cursor=inner_select_cursor, sql_statement=sql_select, data_tuple=data_tuple)
-
-                # Check if any results were returned. Use them if so, otherwise replace the missing results with 'Unknown'. In this case there's no point in raising Exceptions if I can't find the actual name or type of the related device
-                if inner_select_cursor.rowcount > 0:
-                    # I got the data I was looking for from the devices table
-                    result = inner_select_cursor.fetchone()
-                    data_dict["toName"] = result[0]
-                    data_dict["toType"] = result[1]
-
-                # Write the data in the database table
-                mysql_utils.add_data_to_table(table_name=asset_devices_table_name, data_dict=data_dict)
-
-            # Finished with the current asset. Fetch the next one and repeat the cycle if its not None
-            asset_info = outer_select_cursor.fetchone()
-
-        # Done with everything, I believe. Close the database access objects and carry on
-        outer_select_cursor.close()
-        inner_select_cursor.close()
-        cnx.close()
+        data_dict["description"] = None
+
+    # Fill in the name and type of the related entity. If it can't be found, leave them as None: there's no point in raising Exceptions if I can't find the actual name or type of the related device
+    try:
+        data_dict["toName"], data_dict["toType"] = entity_info_dict[data_dict['toEntityType']][data_dict['toId']]
+    except KeyError:
+        pass
+
+    return data_dict
@@ -0,0 +1,229 @@
+""" Place holder for the in-process cache of the environmental data queries (mysql_asset_controller.get_asset_env_data). Two kinds of things are cached:
+    - Asset metadata (asset name/id lookups and the devices associated to each asset), kept for proj_config.env_data_cache_metadata_ttl seconds
+    - Data units, i.e., the data points of a single asset and variable in a single time bucket (bucketed queries) or in a fixed time chunk of proj_config.env_data_cache_raw_chunk (raw queries). Only closed units (units that ended more than
+      proj_config.env_data_cache_settle_delay ago) are cached, and they are kept until evicted, invalidated or, if proj_config.env_data_cache_max_age is set, until they get too old
+The data units are evicted in least recently used order once their (estimated) memory footprint goes past proj_config.env_data_cache_max_bytes. The device data collection invalidates the units that overlap the data it writes, but only in
+this process: if the data is collected by a different process, proj_config.env_data_cache_max_age bounds the time a unit can go without being refreshed """
+
+import sys
+import time
+import datetime
+import threading
+import collections
+import ambi_logger
+import utils
+import proj_config
+
+# Origin of the time grid of the raw data chunks
+chunk_grid_origin = datetime.datetime(2000, 1, 1)
+
+# The data units, in least recently used order, indexed by (asset_id, variable_name, unit_descriptor, unit_start). Each unit is a dictionary with the 'point_list', its estimated 'size', in bytes, the 'device_id_set' of the asset, the
+# 'start' and 'end' of the unit and the time when it was 'stored'
+_data_cache = {'units': collections.OrderedDict(), 'size': 0, 'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+# The asset metadata, indexed by whatever key the caller provides, with a (value, stored time) tuple each
+_metadata_cache = {}
+
+_cache_lock = threading.RLock()
+
+
+def get_metadata(metadata_key, loader, **kwargs):
+    """
+    Returns a piece of asset metadata from the cache, if it's there and it's not older than proj_config.env_data_cache_metadata_ttl, or from the loader method provided otherwise (storing it in the cache for the next calls). None values are
+    never cached (for the retrieve_asset_* methods, a None means that nothing was found, which may change soon). If the cache is disabled, this simply calls the loader.
+    :param metadata_key: (tuple) The cache key
+    :param loader: (function) The method that retrieves the value from the database
+    :param kwargs: The arguments to call the loader with
+    :return value: The metadata value
+    """
+    if not proj_config.env_data_cache_enabled:
+        return loader(**kwargs)
+
+    with _cache_lock:
+        if metadata_key in _metadata_cache:
+            value, stored_time = _metadata_cache[metadata_key]
+
+            if time.time() - stored_time < proj_config.env_data_cache_metadata_ttl:
+                return value
+
+            _metadata_cache.pop(metadata_key)
+
+    # Load it without holding the lock, since it goes to the database
+    value = loader(**kwargs)
+
+    if value is not None:
+        with _cache_lock:
+            _metadata_cache[metadata_key] = (value, time.time())
+
+    return value
+
+
+def invalidate_metadata():
+    """
+    Drops all the cached asset metadata. To be called when the asset or asset/device relation tables change.
+    """
+    with _cache_lock:
+        _metadata_cache.clear()
+
+
+def get_data_unit(unit_key, device_id_list):
+    """
+    Returns the data points of a cached data unit, marking it as the most recently used one. A unit computed for a different set of devices than the current one (the asset/device relations changed in the meantime) is dropped instead.
+    :param unit_key: (tuple) The (asset_id, variable_name, unit_descriptor, unit_start) key of the unit
+    :param device_id_list: (list of str) The ids of the devices currently associated to the asset
+    :return point_list: (list of dict) The data points of the unit (the cached list itself, so don't change it), or None if the unit is not in the cache (or is too old, or is from another set of devices)
+    """
+    with _cache_lock:
+        unit = _data_cache['units'].get(unit_key, None)
+
+        if unit is not None and proj_config.env_data_cache_max_age is not None and time.time() - unit['stored'] >= proj_config.env_data_cache_max_age:
+            _remove_data_unit(unit_key=unit_key)
+            unit = None
+
+        if unit is not None and unit['device_id_set'] != frozenset(device_id_list):
+            _remove_data_unit(unit_key=unit_key)
+            _data_cache['invalidations'] += 1
+            unit = None
+
+        if unit is None:
+            _data_cache['misses'] += 1
+            return None
+
+        _data_cache['units'].move_to_end(unit_key)
+        _data_cache['hits'] += 1
+
+        return unit['point_list']
+
+
+def put_data_unit(unit_key, point_list, device_id_list, unit_start, unit_end):
+    """
+    Stores a data unit in the cache, as the most recently used one, and evicts the least recently used units until the cache is back within its memory bound. Units larger than the whole bound are not stored at all.
+    :param unit_key: (tuple) The (asset_id, variable_name, unit_descriptor, unit_start) key of the unit
+    :param point_list: (list of dict) The data points of the unit, in the format returned by get_asset_env_data (an empty list is a valid unit too: a time bucket without data)
+    :param device_id_list: (list of str) The ids of the devices associated to the asset, to be able to invalidate the unit when new data from any of them comes in (or when the devices of the asset change)
+    :param unit_start: (datetime.datetime) The beginning of the time interval covered by the unit
+    :param unit_end: (datetime.datetime) The end (exclusive) of the time interval covered by the unit
+    """
+    unit_size = _estimate_size(point_list=point_list)
+
+    if unit_size > proj_config.env_data_cache_max_bytes:
+        return
+
+    with _cache_lock:
+        if unit_key in _data_cache['units']:
+            _remove_data_unit(unit_key=unit_key)
+
+        _data_cache['units'][unit_key] = {'point_list': point_list, 'size': unit_size, 'device_id_set': frozenset(device_id_list), 'start': unit_start, 'end': unit_end, 'stored': time.time()}
+        _data_cache['size'] += unit_size
+
+        while _data_cache['size'] > proj_config.env_data_cache_max_bytes:
+            _remove_data_unit(unit_key=next(iter(_data_cache['units'])))
+            _data_cache['evictions'] += 1
+
+
+def invalidate_device_data(device_data_list):
+    """
+    Drops the cached data units that may have changed with a write into the device data table, i.e., the units of the same variable (ontologyId), for an asset associated to the same device, whose time interval overlaps the one of the records
+    written for that device and variable.
+    :param device_data_list: (list of dict) The records written into the device data table. Only the 'deviceId', 'ontologyId' and 'timestamp' keys are used
+    :raise utils.InputValidationException: If the input fails validation
+    :return unit_count: (int) The number of data units dropped
+    """
+    utils.validate_input_type(device_data_list, list)
+
+    # Reduce the records to a time interval per device/ontologyId pair
+    interval_dict = {}
+    for device_data in device_data_list:
+        if device_data.get('deviceId', None) is None or device_data.get('ontologyId', None) is None or device_data.get('timestamp', None) is None:
+            continue
+
+        interval_key = (device_data['deviceId'], device_data['ontologyId'])
+
+        if interval_key in interval_dict:
+            interval_dict[interval_key] = (min(interval_dict[interval_key][0], device_data['timestamp']), max(interval_dict[interval_key][1], device_data['timestamp']))
+        else:
+            interval_dict[interval_key] = (device_data['timestamp'], device_data['timestamp'])
+
+    if not interval_dict:
+        return 0
+
+    with _cache_lock:
+        invalid_unit_key_list = []
+
+        for unit_key, unit in _data_cache['units'].items():
+            for device_id in unit['device_id_set']:
+                interval = interval_dict.get((device_id, unit_key[1]), None)
+
+                if interval is not None and unit['start'] <= interval[1] and unit['end'] > interval[0]:
+                    invalid_unit_key_list.append(unit_key)
+                    break
+
+        for unit_key in invalid_unit_key_list:
+            _remove_data_unit(unit_key=unit_key)
+
+        _data_cache['invalidations'] += len(invalid_unit_key_list)
+
+    if invalid_unit_key_list:
+        ambi_logger.get_logger(__name__).info("Invalidated {0} cached environmental data units after a device data write.".format(str(len(invalid_unit_key_list))))
+
+    return len(invalid_unit_key_list)
+
+
+def clear_cache():
+    """
+    Drops everything in the cache (data units and metadata) and resets its statistics.
+    """
+    with _cache_lock:
+        _data_cache['units'].clear()
+
+        for stat_key in ['size', 'hits', 'misses', 'evictions', 'invalidations']:
+            _data_cache[stat_key] = 0
+
+        _metadata_cache.clear()
+
+
+def get_cache_stats():
+    """
+    Returns the current state of the data unit cache, to check how well it's doing.
+    :return stats_dict: (dict) A dictionary with the number of 'units' cached, their estimated 'size', in bytes, and the number of 'hits', 'misses', 'evictions' and 'invalidations' so far
+    """
+    with _cache_lock:
+        return {'units': len(_data_cache['units']), 'size': _data_cache['size'], 'hits': _data_cache['hits'], 'misses': _data_cache['misses'], 'evictions': _data_cache['evictions'],
+                'invalidations': _data_cache['invalidations']}
+
+
+def floor_to_grid(date, unit_length, origin=None):
+    """
+    Returns the start of the time unit of a fixed length grid that contains a given date.
+    :param date: (datetime.datetime) The date
+    :param unit_length: (datetime.timedelta) The length of the grid units
+    :param origin: (datetime.datetime) A date where a grid unit starts. Uses chunk_grid_origin if omitted
+    :return unit_start: (datetime.datetime) The start of the grid unit
+    """
+    if origin is None:
+        origin = chunk_grid_origin
+
+    return origin + ((date - origin) // unit_length) * unit_length
+
+
+def _remove_data_unit(unit_key):
+    """
+    Removes a data unit from the cache, keeping the cache size up to date. The caller has to hold the cache lock.
+    :param unit_key: (tuple) The key of the unit to remove
+    """
+    unit = _data_cache['units'].pop(unit_key)
+    _data_cache['size'] -= unit['size']
+
+
+def _estimate_size(point_list):
+    """
+    Estimates the memory taken by the data points of a unit (the list, the dictionaries and their strings; the key strings are shared by all points, so they are left out).
+    :param point_list: (list of dict) The data points
+    :return size: (int) The estimated size, in bytes
+    """
+    size = sys.getsizeof(point_list)
+
+    for point in point_list:
+        size += sys.getsizeof(point) + sys.getsizeof(point['timestamp']) + sys.getsizeof(point['value'])
+
+    return size
@@ -0,0 +1,163 @@
+""" Place holder for the methods that synchronize the metadata tables (tenants, customers, assets, devices, relations) with the data returned from the remote API by writing only the differences between the two """
+
+import hashlib
+import datetime
+import ambi_logger
+import utils
+import user_config
+import proj_config
+from mysql_database.python_database_modules import mysql_utils
+
+
+def sync_table_records(record_list, table_name, delete_missing=True):
+    """
+    This method brings a database table to the exact state described by the record list provided, with the minimum of database writes. Instead of writing every record (and letting the database sort out what is new and what isn't), the method
+    loads the current state of the table once, computes a hash for each record (in the database and in the list provided), indexed by the table's unique key (the trigger columns) and compares both sets:
+        - Records whose key doesn't exist in the table yet are inserted
+        - Records whose key exists in the table but with a different hash are updated
+        - Records in the table whose key is not in the list provided are deleted (if delete_missing is set)
+        - Everything else is left untouched
+    The inserts and updates are written with multi-row INSERT ... ON DUPLICATE KEY UPDATE statements and the deletes with multi-row DELETE statements, proj_config.mysql_batch_size records at a time (so that a first synchronization against an
+    empty table doesn't go past the database's max_allowed_packet), all in the same transaction. If nothing changed, the only database access is the initial SELECT.
+    As with database_table_updater.add_table_data, the table columns are the main reference: keys in the record dictionaries without a matching column are ignored and columns without a matching key are set to NULL.
+    :param record_list: (list of dict) The complete list of records that the table should contain. Each record should be a one level dictionary, like the ones returned by utils.extract_all_key_value_pairs_from_dictionary
+    :param table_name: (str) The name of the database table to synchronize
+    :param delete_missing: (bool) Set this flag to False to keep the records in the table that are not in the record list
+    :raise utils.InputValidationException: If any of the inputs fails validation or if the table doesn't exist
+    :raise mysql_utils.MySQLDatabaseException: If any errors occur during the database accesses
+    :return result_dict: (dict) A dictionary with the number of records that were 'inserted', 'updated', 'deleted' and left 'unchanged'
+    """
+    log = ambi_logger.get_logger(__name__)
+
+    utils.validate_input_type(record_list, list)
+    for record in record_list:
+        utils.validate_input_type(record, dict)
+    utils.validate_input_type(table_name, str)
+    utils.validate_input_type(delete_missing, bool)
+
+    database_name = user_config.access_info['mysql_database']['database']
+
+    if not mysql_utils.table_exists(table_name=table_name):
+        error_msg = "The table name provided: {0} doesn't exist yet in database {1}. Cannot continue.".format(str(table_name), str(database_name))
+        log.error(error_msg)
+        raise utils.InputValidationException(message=error_msg)
+
+    column_list = mysql_utils.get_table_columns(database_name=database_name, table_name=table_name)
+    trigger_column_list = mysql_utils.get_trigger_columns(table_name=table_name)
+    trigger_index_list = [column_list.index(trigger_column_name) for trigger_column_name in trigger_column_list]
+
+    # Put the records provided in the same shape as the table rows: a tuple of values in column order. If the same key comes up more than once, the last record wins (same as it would if these were written one by one)
+    new_row_dict = {}
+    for record in record_list:
+        row = tuple([record.get(column_name, None) for column_name in column_list])
+        new_row_dict[_get_row_key(row=row, trigger_index_list=trigger_index_list)] = row
+
+    result_dict = {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0}
+
+    with mysql_utils.db_connection(database_name=database_name) as cnx:
+        select_cursor = cnx.cursor(buffered=True)
+        change_cursor = cnx.cursor(buffered=True)
+
+        # Load the current state of the table, reduced to a hash per key
+        sql_select = """SELECT """ + """, """.join(column_list) + """ FROM """ + str(table_name) + """;"""
+        select_cursor = mysql_utils.run_sql_statement(cursor=select_cursor, sql_statement=sql_select, data_tuple=())
+
+        current_hash_dict = {}
+        for row in select_cursor.fetchall():
+            current_hash_dict[_get_row_key(row=row, trigger_index_list=trigger_index_list)] = _hash_row(row=row)
+
+        # Sort out what needs to be written
+        upsert_row_list = []
+        for row_key, row in new_row_dict.items():
+            if row_key not in current_hash_dict:
+                upsert_row_list.append(row)
+                result_dict['inserted'] += 1
+            elif current_hash_dict[row_key] != _hash_row(row=row):
+                upsert_row_list.append(row)
+                result_dict['updated'] += 1
+            else:
+                result_dict['unchanged'] += 1
+
+        delete_key_list = []
+        if delete_missing:
+            delete_key_list = [row_key for row_key in current_hash_dict if row_key not in new_row_dict]
+            result_dict['deleted'] = len(delete_key_list)
+
+        batch_size = proj_config.mysql_batch_size
+
+        for i in range(0, len(upsert_row_list), batch_size):
+            batch = upsert_row_list[i:i + batch_size]
+
+            # Only the full batch statement goes into the schema catalog. The last, shorter, batch gets its statement built on the spot, otherwise the catalog would keep a new statement for every batch length that ever comes up
+            if len(batch) == batch_size:
+                sql_upsert = mysql_utils.get_sql_statement(table_name=table_name, statement_type='upsert', row_count=batch_size)
+            else:
+                sql_upsert = mysql_utils.create_upsert_sql_statement(column_list=column_list, table_name=table_name, trigger_column_list=trigger_column_list, row_count=len(batch))
+
+            data_list = []
+            for row in batch:
+                data_list.extend(row)
+
+            change_cursor = mysql_utils.run_sql_statement(cursor=change_cursor, sql_statement=sql_upsert, data_tuple=tuple(data_list))
+
+        key_group = """(""" + """, """.join(['%s'] * len(trigger_column_list)) + """)"""
+
+        for i in range(0, len(delete_key_list), batch_size):
+            batch = delete_key_list[i:i + batch_size]
+
+            sql_delete = """DELETE FROM """ + str(table_name) + """ WHERE (""" + """, """.join(trigger_column_list) + """) IN (""" + """, """.join([key_group] * len(batch)) + """);"""
+
+            data_list = []
+            for row_key in batch:
+                data_list.extend(row_key)
+
+            change_cursor = mysql_utils.run_sql_statement(cursor=change_cursor, sql_statement=sql_delete, data_tuple=tuple(data_list))
+
+        if upsert_row_list or delete_key_list:
+            cnx.commit()
+
+        select_cursor.close()
+        change_cursor.close()
+
+    log.info("Synchronized {0}.{1}: {2} inserted, {3} updated, {4} deleted, {5} unchanged.".format(str(database_name), str(table_name), str(result_dict['inserted']), str(result_dict['updated']), str(result_dict['deleted']),
+                                                                                                       str(result_dict['unchanged'])))
+
+    return result_dict
+
+
+def _get_row_key(row, trigger_index_list):
+    """
+    Extracts the unique key of a table row.
+    :param row: (tuple) The row values, in column order
+    :param trigger_index_list: (list of int) The positions of the trigger columns in the row
+    :return row_key: (tuple) The values of the trigger columns, normalized in the same way as the hashed values so that keys coming from the remote API and from the database match
+    """
+    return tuple([_normalize_value(value=row[trigger_index]) for trigger_index in trigger_index_list])
+
+
+def _hash_row(row):
+    """
+    Computes a hash of a table row. The values are normalized first, since the same value can come back from the database with a different type than the one it was written with (booleans come back as integers, for instance).
+    :param row: (tuple) The row values, in column order
+    :return row_hash: (str) The hash of the row
+    """
+    return hashlib.sha1(repr(tuple([_normalize_value(value=value) for value in row])).encode('UTF-8')).hexdigest()
+
+
+def _normalize_value(value):
+    """
+    Converts a record value into a form that compares the same regardless of it coming from the remote API or from the database.
+    :param value: The value to normalize
+    :return normalized_value: (str or None) None for NULL values and a string for everything else
+    """
+    if value is None:
+        return None
+
+    if isinstance(value, bool):
+        return str(int(value))
+
+    if isinstance(value, datetime.datetime):
+        # DATETIME columns only store seconds
+        return value.replace(microsecond=0).isoformat()
+
+    return str(value)
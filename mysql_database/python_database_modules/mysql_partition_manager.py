@@ -0,0 +1,353 @@
+""" Place holder for the methods that manage the time based partitioning of the device data table. The table is partitioned by month using RANGE COLUMNS on its 'timestamp' column, with the following layout:
+    p_start     VALUES LESS THAN (<first month>)    -> Records older than the first month kept (and NULL timestamps)
+    pYYYYMM     VALUES LESS THAN (<next month>)     -> One partition per month, named after the month whose records it holds
+    ...
+    p_future    VALUES LESS THAN (MAXVALUE)         -> Catch-all for anything past the last monthly partition. Should be always empty
+Queries that bound the 'timestamp' column (timestamp >= start_date AND timestamp <= end_date, for instance) only read the partitions of the months involved (partition pruning) and whole months of data can be dropped or archived as metadata only
+operations, instead of massive DELETEs """
+
+import datetime
+import ambi_logger
+import utils
+import user_config
+import proj_config
+from mysql_database.python_database_modules import mysql_utils
+
+partition_column = 'timestamp'
+start_partition_name = 'p_start'
+future_partition_name = 'p_future'
+partition_name_format = 'p%Y%m'
+
+
+def get_table_partitions(table_name=None):
+    """
+    Retrieves the list of partitions of a table, in order, from the database information schema.
+    :param table_name: (str) The name of the table. Uses the device data table if omitted
+    :raise utils.InputValidationException: If the input fails validation
+    :raise mysql_utils.MySQLDatabaseException: If any errors occur during the database accesses
+    :return partition_list: (list of tuple) A (partition_name, upper_bound, table_rows) tuple for each partition, where upper_bound is a datetime.datetime (None for the MAXVALUE partition) and table_rows is the estimate kept by the database.
+    Empty if the table is not partitioned
+    """
+    if table_name is None:
+        table_name = proj_config.mysql_db_tables['device_data']
+
+    utils.validate_input_type(table_name, str)
+
+    database_name = user_config.access_info['mysql_database']['database']
+
+    with mysql_utils.db_connection(database_name=database_name) as cnx:
+        select_cursor = cnx.cursor(buffered=True)
+
+        sql_select = """SELECT PARTITION_NAME, PARTITION_DESCRIPTION, TABLE_ROWS FROM information_schema.PARTITIONS WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s ORDER BY PARTITION_ORDINAL_POSITION;"""
+        select_cursor = mysql_utils.run_sql_statement(cursor=select_cursor, sql_statement=sql_select, data_tuple=(database_name, table_name))
+
+        result_list = select_cursor.fetchall()
+        select_cursor.close()
+
+    partition_list = []
+    for partition_name, partition_description, table_rows in result_list:
+        # Non partitioned tables return a single record with a NULL partition name
+        if partition_name is None:
+            continue
+
+        partition_list.append((partition_name, _parse_partition_bound(partition_description=partition_description), table_rows))
+
+    return partition_list
+
+
+def is_table_partitioned(table_name=None):
+    """
+    Checks if a table is partitioned already.
+    :param table_name: (str) The name of the table. Uses the device data table if omitted
+    :raise mysql_utils.MySQLDatabaseException: If any errors occur during the database accesses
+    :return partitioned: (bool) True if the table has partitions, False otherwise
+    """
+    return len(get_table_partitions(table_name=table_name)) > 0
+
+
+def partition_table(table_name=None, months_ahead=None):
+    """
+    Migration method that converts an unpartitioned device data table into a monthly partitioned one (see the module description for the partition layout). The monthly partitions go from the month of the oldest record in the table until
+    months_ahead months past the current one. NOTE: This rebuilds the whole table, so it can take a while in large tables. It only needs to run once: after this, use maintain_partitions to keep the partitions up to date.
+    The table's unique key (timestamp, timeseriesKey) already includes the partitioning column, as MySQL requires, so no changes to the table's keys are needed.
+    :param table_name: (str) The name of the table to partition. Uses the device data table if omitted
+    :param months_ahead: (int) The number of monthly partitions to create past the current month. Uses proj_config.device_data_partition_months_ahead if omitted
+    :raise utils.InputValidationException: If any of the inputs fails validation
+    :raise mysql_utils.MySQLDatabaseException: If any errors occur during the database accesses
+    :return result (bool): True if the table was partitioned, False if it was partitioned already
+    """
+    log = ambi_logger.get_logger(__name__)
+
+    if table_name is None:
+        table_name = proj_config.mysql_db_tables['device_data']
+
+    if months_ahead is None:
+        months_ahead = proj_config.device_data_partition_months_ahead
+
+    utils.validate_input_type(table_name, str)
+    utils.validate_input_type(months_ahead, int)
+
+    database_name = user_config.access_info['mysql_database']['database']
+
+    if is_table_partitioned(table_name=table_name):
+        log.warning("{0}.{1} is partitioned already. Nothing to do...".format(str(database_name), str(table_name)))
+        return False
+
+    with mysql_utils.db_connection(database_name=database_name) as cnx:
+        change_cursor = cnx.cursor(buffered=True)
+
+        # Start the monthly partitions at the oldest record in the table (or at the current month for an empty table)
+        sql_select = """SELECT MIN(""" + partition_column + """) FROM """ + str(table_name) + """;"""
+        change_cursor = mysql_utils.run_sql_statement(cursor=change_cursor, sql_statement=sql_select, data_tuple=())
+        oldest_timestamp = change_cursor.fetchone()[0]
+
+        first_month = _get_month_start(date=oldest_timestamp if oldest_timestamp is not None else datetime.datetime.now())
+        last_month = _add_months(date=_get_month_start(date=datetime.datetime.now()), months=months_ahead)
+
+        partition_definition_list = ["""PARTITION """ + start_partition_name + """ VALUES LESS THAN ('""" + str(first_month) + """')"""]
+        partition_definition_list.extend(_build_monthly_partition_definitions(first_month=first_month, last_month=last_month))
+        partition_definition_list.append("""PARTITION """ + future_partition_name + """ VALUES LESS THAN (MAXVALUE)""")
+
+        sql_alter = """ALTER TABLE """ + str(table_name) + """ PARTITION BY RANGE COLUMNS(""" + partition_column + """) (""" + """, """.join(partition_definition_list) + """);"""
+
+        log.info("Partitioning {0}.{1} by month, from {2} to {3}. This may take a while...".format(str(database_name), str(table_name), first_month.strftime('%Y-%m'), last_month.strftime('%Y-%m')))
+        change_cursor = mysql_utils.run_sql_statement(cursor=change_cursor, sql_statement=sql_alter, data_tuple=())
+        change_cursor.close()
+
+    # The table structure just changed
+    mysql_utils.invalidate_schema_catalog(table_name=table_name)
+
+    log.info("{0}.{1} partitioned successfully.".format(str(database_name), str(table_name)))
+
+    return True
+
+
+def create_future_partitions(table_name=None, months_ahead=None):
+    """
+    Makes sure that the partitioned table has monthly partitions until months_ahead months past the current one, by splitting the (empty) p_future partition. Since the partition being split has no records, this is a metadata only operation.
+    :param table_name: (str) The name of the partitioned table. Uses the device data table if omitted
+    :param months_ahead: (int) The number of monthly partitions that should exist past the current month. Uses proj_config.device_data_partition_months_ahead if omitted
+    :raise utils.InputValidationException: If any of the inputs fails validation or if the table is not partitioned as expected
+    :raise mysql_utils.MySQLDatabaseException: If any errors occur during the database accesses
+    :return partition_name_list: (list of str) The names of the partitions created (empty if none were needed)
+    """
+    log = ambi_logger.get_logger(__name__)
+
+    if table_name is None:
+        table_name = proj_config.mysql_db_tables['device_data']
+
+    if months_ahead is None:
+        months_ahead = proj_config.device_data_partition_months_ahead
+
+    utils.validate_input_type(table_name, str)
+    utils.validate_input_type(months_ahead, int)
+
+    database_name = user_config.access_info['mysql_database']['database']
+    partition_list = _get_managed_partitions(table_name=table_name)
+
+    # The upper bound of the last partition before p_future is the first month that doesn't have a partition yet
+    first_month = partition_list[-2][1]
+    last_month = _add_months(date=_get_month_start(date=datetime.datetime.now()), months=months_ahead)
+
+    partition_definition_list = _build_monthly_partition_definitions(first_month=first_month, last_month=last_month)
+
+    if not partition_definition_list:
+        log.info("{0}.{1} has all the partitions needed until {2}.".format(str(database_name), str(table_name), last_month.strftime('%Y-%m')))
+        return []
+
+    if partition_list[-1][2]:
+        log.warning("{0}.{1}.{2} is not empty ({3} records, roughly). Splitting it is going to move those records around.".format(str(database_name), str(table_name), future_partition_name, str(partition_list[-1][2])))
+
+    partition_definition_list.append("""PARTITION """ + future_partition_name + """ VALUES LESS THAN (MAXVALUE)""")
+
+    sql_alter = """ALTER TABLE """ + str(table_name) + """ REORGANIZE PARTITION """ + future_partition_name + """ INTO (""" + """, """.join(partition_definition_list) + """);"""
+
+    with mysql_utils.db_connection(database_name=database_name) as cnx:
+        change_cursor = cnx.cursor(buffered=True)
+        change_cursor = mysql_utils.run_sql_statement(cursor=change_cursor, sql_statement=sql_alter, data_tuple=())
+        change_cursor.close()
+
+    partition_name_list = [partition_definition.split()[1] for partition_definition in partition_definition_list[:-1]]
+
+    log.info("Created partitions {0} in {1}.{2}.".format(str(partition_name_list), str(database_name), str(table_name)))
+
+    return partition_name_list
+
+
+def expire_partitions(table_name=None, retention_months=None, archive=None):
+    """
+    Removes the monthly partitions of the months that are older than the retention period, i.e., whose records are all older than the first day of the current month minus retention_months months. Whole partitions are removed with
+    ALTER TABLE ... DROP PARTITION, which is a metadata only operation, unlike the DELETE of the same records. If the archive flag is set, the records are kept in an archive table per partition, named <table_name>_<partition_name>, before the
+    partition is dropped: the partition is swapped with that (empty) archive table with ALTER TABLE ... EXCHANGE PARTITION, which is a metadata only operation too. The archiving can be safely run again after a failure halfway: an archive
+    table that already holds records is never swapped back into the table (any records written into the partition since then are copied into the archive instead) and the partition is just dropped.
+    :param table_name: (str) The name of the partitioned table. Uses the device data table if omitted
+    :param retention_months: (int) The number of months of data to keep, besides the current one. Uses proj_config.device_data_retention_months if omitted. If that one is None too, nothing is expired
+    :param archive: (bool) Set this flag to archive the expired partitions instead of just dropping them. Uses proj_config.device_data_archive_expired if omitted
+    :raise utils.InputValidationException: If any of the inputs fails validation or if the table is not partitioned as expected
+    :raise mysql_utils.MySQLDatabaseException: If any errors occur during the database accesses
+    :return partition_name_list: (list of str) The names of the partitions removed (empty if none were expired)
+    """
+    log = ambi_logger.get_logger(__name__)
+
+    if table_name is None:
+        table_name = proj_config.mysql_db_tables['device_data']
+
+    if retention_months is None:
+        retention_months = proj_config.device_data_retention_months
+
+    if archive is None:
+        archive = proj_config.device_data_archive_expired
+
+    utils.validate_input_type(table_name, str)
+    utils.validate_input_type(archive, bool)
+
+    if retention_months is None:
+        log.info("No retention period set. Keeping all the partitions.")
+        return []
+
+    utils.validate_input_type(retention_months, int)
+
+    if retention_months < 0:
+        raise utils.InputValidationException(message="Invalid retention period provided: {0}. Please provide a positive number of months.".format(str(retention_months)))
+
+    database_name = user_config.access_info['mysql_database']['database']
+    cutoff_date = _add_months(date=_get_month_start(date=datetime.datetime.now()), months=-retention_months)
+
+    # Only the monthly partitions are expired. The p_start and p_future ones bound the partition layout
+    expired_partition_list = [partition_name for partition_name, upper_bound, _ in _get_managed_partitions(table_name=table_name)[1:-1] if upper_bound <= cutoff_date]
+
+    if not expired_partition_list:
+        log.info("No partitions older than {0} in {1}.{2}.".format(cutoff_date.strftime('%Y-%m'), str(database_name), str(table_name)))
+        return []
+
+    with mysql_utils.db_connection(database_name=database_name) as cnx:
+        change_cursor = cnx.cursor(buffered=True)
+
+        for partition_name in expired_partition_list:
+            if archive:
+                archive_table_name = str(table_name) + "_" + str(partition_name)
+
+                # The archive table has to have the exact same structure as the partitioned one, but without partitions. It may exist already, from a previous run that failed before dropping the partition, and be unpartitioned already too
+                sql_create = """CREATE TABLE IF NOT EXISTS """ + archive_table_name + """ LIKE """ + str(table_name) + """;"""
+                change_cursor = mysql_utils.run_sql_statement(cursor=change_cursor, sql_statement=sql_create, data_tuple=())
+
+                if is_table_partitioned(table_name=archive_table_name):
+                    sql_alter = """ALTER TABLE """ + archive_table_name + """ REMOVE PARTITIONING;"""
+                    change_cursor = mysql_utils.run_sql_statement(cursor=change_cursor, sql_statement=sql_alter, data_tuple=())
+
+                # An archive table with records already holds the partition's data (the exchange went through in a previous run). Exchanging it again would swap the archived records back into the table, so copy over whatever was written
+                # into the partition since then (nothing, normally) instead
+                sql_select = """SELECT EXISTS(SELECT 1 FROM """ + archive_table_name + """);"""
+                change_cursor = mysql_utils.run_sql_statement(cursor=change_cursor, sql_statement=sql_select, data_tuple=())
+
+                if change_cursor.fetchone()[0]:
+                    log.warning("{0}.{1} already holds the records of partition {2}. Skipping the partition exchange...".format(str(database_name), archive_table_name, str(partition_name)))
+                    sql_statement = """INSERT IGNORE INTO """ + archive_table_name + """ SELECT * FROM """ + str(table_name) + """ PARTITION (""" + str(partition_name) + """);"""
+                else:
+                    sql_statement = """ALTER TABLE """ + str(table_name) + """ EXCHANGE PARTITION """ + str(partition_name) + """ WITH TABLE """ + archive_table_name + """;"""
+
+                change_cursor = mysql_utils.run_sql_statement(cursor=change_cursor, sql_statement=sql_statement, data_tuple=())
+                cnx.commit()
+
+                log.info("Archived {0}.{1}.{2} into {0}.{3}.".format(str(database_name), str(table_name), str(partition_name), archive_table_name))
+
+            sql_alter = """ALTER TABLE """ + str(table_name) + """ DROP PARTITION """ + str(partition_name) + """;"""
+            change_cursor = mysql_utils.run_sql_statement(cursor=change_cursor, sql_statement=sql_alter, data_tuple=())
+
+            log.info("Dropped partition {0}.{1}.{2}.".format(str(database_name), str(table_name), str(partition_name)))
+
+        change_cursor.close()
+
+    # New archive tables may have been created
+    if archive:
+        mysql_utils.invalidate_schema_catalog()
+
+    return expired_partition_list
+
+
+def maintain_partitions(table_name=None):
+    """
+    Periodic maintenance of the partitioned device data table: pre-creates the future partitions and expires the old ones, according to the settings in proj_config. Tables that were not partitioned yet (see partition_table) are left alone.
+    :param table_name: (str) The name of the partitioned table. Uses the device data table if omitted
+    :raise mysql_utils.MySQLDatabaseException: If any errors occur during the database accesses
+    :return result_dict: (dict) A dictionary with the names of the partitions 'created' and 'expired'
+    """
+    log = ambi_logger.get_logger(__name__)
+
+    if table_name is None:
+        table_name = proj_config.mysql_db_tables['device_data']
+
+    if not is_table_partitioned(table_name=table_name):
+        log.warning("{0} is not partitioned. Run mysql_partition_manager.partition_table to partition it first.".format(str(table_name)))
+        return {'created': [], 'expired': []}
+
+    return {'created': create_future_partitions(table_name=table_name), 'expired': expire_partitions(table_name=table_name)}
+
+
+def _get_managed_partitions(table_name):
+    """
+    Retrieves the partitions of a table and checks that they follow the layout managed by this module (p_start, monthly partitions, p_future).
+    :param table_name: (str) The name of the partitioned table
+    :raise utils.InputValidationException: If the table is not partitioned or if its partitions don't follow the expected layout
+    :return partition_list: (list of tuple) The partitions of the table (see get_table_partitions)
+    """
+    partition_list = get_table_partitions(table_name=table_name)
+
+    if len(partition_list) < 2 or partition_list[0][0] != start_partition_name or partition_list[-1][0] != future_partition_name:
+        raise utils.InputValidationException(message="{0} is not partitioned as expected (got partitions {1}). Use partition_table to partition it.".format(str(table_name), str([partition[0] for partition in partition_list])))
+
+    return partition_list
+
+
+def _build_monthly_partition_definitions(first_month, last_month):
+    """
+    Builds the partition definitions for every month between first_month and last_month, both included.
+    :param first_month: (datetime.datetime) The first day of the first month
+    :param last_month: (datetime.datetime) The first day of the last month
+    :return partition_definition_list: (list of str) The 'PARTITION pYYYYMM VALUES LESS THAN ('<next month>')' definitions
+    """
+    partition_definition_list = []
+
+    current_month = first_month
+    while current_month <= last_month:
+        next_month = _add_months(date=current_month, months=1)
+        partition_definition_list.append("""PARTITION """ + current_month.strftime(partition_name_format) + """ VALUES LESS THAN ('""" + str(next_month) + """')""")
+        current_month = next_month
+
+    return partition_definition_list
+
+
+def _parse_partition_bound(partition_description):
+    """
+    Converts the upper bound of a partition, as kept in the information schema, into a datetime.
+    :param partition_description: (str) The PARTITION_DESCRIPTION from information_schema.PARTITIONS, e.g., "'2020-02-01 00:00:00'" or "MAXVALUE"
+    :return upper_bound: (datetime.datetime) The upper bound of the partition, or None for the MAXVALUE partition
+    """
+    if partition_description is None or partition_description.strip().upper() == 'MAXVALUE':
+        return None
+
+    return datetime.datetime.strptime(partition_description.strip().strip("'")[:10], '%Y-%m-%d')
+
+
+def _get_month_start(date):
+    """
+    :param date: (datetime.datetime) Any date
+    :return month_start: (datetime.datetime) Midnight of the first day of the month of the date provided
+    """
+    return datetime.datetime(year=date.year, month=date.month, day=1)
+
+
+def _add_months(date, months):
+    """
+    :param date: (datetime.datetime) The first day of a month
+    :param months: (int) The number of months to add (or subtract, if negative)
+    :return month_start: (datetime.datetime) The first day of the resulting month
+    """
+    month_index = date.year * 12 + date.month - 1 + months
+
+    return datetime.datetime(year=month_index // 12, month=month_index % 12 + 1, day=1)
+
+
+if __name__ == "__main__":
+    # One time migration: partition the device data table by month
+    partition_table()
@@ -0,0 +1,164 @@
+""" Place holder for the query planner of the environmental data queries (mysql_asset_controller.get_asset_env_data). The planner decides, for a given time window, bucket length or point budget, which storage answers each part of the window:
+the raw device data ('raw') or one of the rollups ('1m', '1h' or '1d', see mysql_rollup_manager). The result is a query plan, i.e., a list of time segments, each one with its own source, that together cover the whole window:
+    head    -> The partial bucket between start_date and the first bucket boundary aligned with the rollup, answered by the finest data that fits it
+    middle  -> The whole buckets, aligned with the rollup, answered by the rollup itself
+    tail    -> The partial bucket between the last whole bucket and end_date, answered by the finest data that fits it
+The bucket boundaries are fixed in time: they are multiples of the bucket length counted from bucket_grid_origin, which makes them the same for every window, whatever its length (and cacheable, see mysql_env_data_cache).
+When the window is already aligned with the buckets there's no head (nor tail), when no rollup can be used the segments are answered by the raw data and plans without buckets have a single 'raw' segment. Like the raw data queries, every plan
+includes the data at end_date itself: the last segment is the only one that includes its end """
+
+import math
+import datetime
+import ambi_logger
+import utils
+import proj_config
+from mysql_database.python_database_modules import mysql_rollup_manager
+
+# Origin of the bucket grid. It falls on the start of a minute, hour and day, so the grid is aligned with every rollup whose bucket length divides the bucket length
+bucket_grid_origin = datetime.datetime(2000, 1, 1)
+
+
+def plan_env_data_query(start_date, end_date, bucket=None, max_points=None):
+    """
+    Builds the query plan for an environmental data query. The bucket length is either the one provided or, if a point budget is provided instead, the smallest one that keeps the number of data points per variable within that budget, rounded up to
+    a whole number of the coarsest rollup buckets that fit in it (so that the rollup can answer it). Without any of them, the plan is the raw data for the whole window.
+    The buckets start at multiples of the bucket length from bucket_grid_origin (e.g., 2 hour buckets start at even hours and not at start_date), for any window length. These are aligned with the coarsest rollup whose bucket length divides
+    the bucket provided, so that every whole bucket is answered by that rollup, with the partial buckets at both ends of the window answered by finer data (see the module description). The partial bucket at the start of the window is
+    identified by start_date and, if end_date falls on a bucket boundary, the data at end_date gets a bucket of its own.
+    :param start_date: (datetime.datetime) The beginning of the time window
+    :param end_date: (datetime.datetime) The end of the time window
+    :param bucket: (datetime.timedelta) The bucket length (a whole number of seconds), or None to use the raw data points (or to compute it from the max_points)
+    :param max_points: (int) The maximum number of data points per variable to return, at least 3. Ignored if a bucket is provided
+    :raise utils.InputValidationException: If any of the inputs fails validation
+    :return plan: (dict) The query plan, in the format
+        plan = {
+            'bucket': <datetime.timedelta or None>,
+            'segment_list': [
+                {
+                    'kind': <str>,                              -> 'head', 'middle' or 'tail' (see the module description) or 'single' for the plans without buckets
+                    'start': <datetime.datetime>,
+                    'end': <datetime.datetime>,
+                    'end_inclusive': <bool>,                    -> True if the data at 'end' itself belongs to the segment (only for the last segment)
+                    'bucket': <datetime.timedelta or None>,     -> The bucket length to use in this segment, counted from 'start' (for the head, the length of the segment itself)
+                    'source': <str>,                            -> 'raw', '1m', '1h' or '1d'
+                    'elapsed': None                             -> Filled with the time taken by the segment query, in seconds, once it runs
+                },
+                ...
+            ]
+        }
+    """
+    log = ambi_logger.get_logger(__name__)
+
+    utils.validate_input_type(start_date, datetime.datetime)
+    utils.validate_input_type(end_date, datetime.datetime)
+
+    if bucket is not None:
+        utils.validate_input_type(bucket, datetime.timedelta)
+
+    if max_points is not None:
+        utils.validate_input_type(max_points, int)
+
+        # The partial buckets at both ends of the window take up to two points of the budget, so anything smaller than 3 can't be honoured
+        if max_points < 3:
+            error_msg = "Invalid point budget provided: {0}. Please provide an integer of at least 3 for this argument (the partial buckets at both ends of the time window need up to two points of the budget).".format(str(max_points))
+            log.error(error_msg)
+            raise utils.InputValidationException(message=error_msg)
+
+    # The device data timestamps have no fractions of a second, so rounding the window inwards to whole seconds doesn't change the data inside it, but it keeps all the bucket lengths below in whole seconds too
+    if start_date.microsecond:
+        start_date = start_date.replace(microsecond=0) + datetime.timedelta(seconds=1)
+
+    end_date = end_date.replace(microsecond=0)
+
+    if bucket is None and max_points is not None:
+        bucket = _get_budget_bucket(start_date=start_date, end_date=end_date, max_points=max_points)
+
+    plan = {'bucket': bucket, 'segment_list': []}
+
+    # Raw data points, no bucketing
+    if bucket is None:
+        plan['segment_list'].append(_create_segment(segment_kind='single', segment_start=start_date, segment_end=end_date, segment_bucket=None, end_inclusive=True))
+        return plan
+
+    # First bucket boundary at or after start_date and the number of whole buckets between it and end_date. Short windows, without any whole bucket, use the same grid, just with a head and/or a tail only
+    grid_start = bucket_grid_origin - ((bucket_grid_origin - start_date) // bucket) * bucket
+    bucket_count = (end_date - grid_start) // bucket if grid_start < end_date else 0
+    grid_end = grid_start + bucket_count * bucket
+
+    # The time segments, as (kind, start, end, bucket) tuples. The head bucket is the whole segment (a single partial bucket identified by start_date), while the tail uses the full bucket length, since it's the start of a whole bucket
+    segment_tuple_list = []
+
+    if start_date < grid_start:
+        segment_tuple_list.append(('head', start_date, min(grid_start, end_date), grid_start - start_date))
+
+    if bucket_count > 0:
+        segment_tuple_list.append(('middle', grid_start, grid_end, bucket))
+
+    if max(grid_start, grid_end) < end_date:
+        segment_tuple_list.append(('tail', max(grid_start, grid_end), end_date, bucket))
+
+    # Only the last segment includes its end, so that every plan covers the window with end_date included, whatever its length
+    for segment_index, (segment_kind, segment_start, segment_end, segment_bucket) in enumerate(segment_tuple_list):
+        plan['segment_list'].append(_create_segment(segment_kind=segment_kind, segment_start=segment_start, segment_end=segment_end, segment_bucket=segment_bucket, end_inclusive=segment_index == len(segment_tuple_list) - 1))
+
+    return plan
+
+
+def format_query_plan(plan):
+    """
+    Formats a query plan into a small table with the time segments, their sources and (if they ran already) the time each one took.
+    :param plan: (dict) The plan, as returned by plan_env_data_query
+    :return summary: (str) The table, one segment per line
+    """
+    utils.validate_input_type(plan, dict)
+
+    summary_line_list = ["{0:<19}  {1:<20}  {2:<6}  {3:>16}  {4:>10}".format('Start', 'End', 'Source', 'Bucket', 'Elapsed')]
+
+    for segment in plan['segment_list']:
+        elapsed = "{0:.3f}s".format(segment['elapsed']) if segment['elapsed'] is not None else "-"
+        summary_line_list.append("{0:<19}  {1:<20}  {2:<6}  {3:>16}  {4:>10}".format(str(segment['start']), str(segment['end']) + ("]" if segment['end_inclusive'] else ")"), segment['source'], str(segment['bucket']), elapsed))
+
+    return "\n".join(summary_line_list)
+
+
+def _create_segment(segment_kind, segment_start, segment_end, segment_bucket, end_inclusive):
+    """
+    Creates a query plan segment, picking its source: the coarsest rollup that answers the segment exactly (mysql_rollup_manager.select_rollup_resolution) or the raw data if none does. For a segment that includes its end date, the rollup
+    only answers up to it (the rollup bucket that starts at the end date has data past it) and the data at the end date itself is read from the raw data (see mysql_asset_controller._select_env_data).
+    :param segment_kind: (str) 'head', 'middle', 'tail' or 'single'
+    :param segment_start: (datetime.datetime) The beginning of the segment
+    :param segment_end: (datetime.datetime) The end of the segment
+    :param segment_bucket: (datetime.timedelta) The bucket length to use in the segment, or None for the raw data points
+    :param end_inclusive: (bool) If the data at segment_end belongs to the segment
+    :return segment: (dict) The segment, in the format described in plan_env_data_query
+    """
+    source = 'raw'
+
+    rollup_resolution = mysql_rollup_manager.select_rollup_resolution(start_date=segment_start, end_date=segment_end, bucket=segment_bucket)
+
+    if rollup_resolution is not None:
+        source = rollup_resolution
+
+    return {'kind': segment_kind, 'start': segment_start, 'end': segment_end, 'end_inclusive': end_inclusive, 'bucket': segment_bucket, 'source': source, 'elapsed': None}
+
+
+def _get_budget_bucket(start_date, end_date, max_points):
+    """
+    Computes the smallest bucket length that keeps the number of data points per variable within a budget over a time window. Two points of the budget are set aside for the partial buckets at both ends of the window, and the bucket is
+    rounded up to a whole number of the coarsest rollup buckets that fit in it.
+    :param start_date: (datetime.datetime) The beginning of the time window
+    :param end_date: (datetime.datetime) The end of the time window
+    :param max_points: (int) The maximum number of data points per variable
+    :return bucket: (datetime.timedelta) The bucket length, a whole number of seconds
+    """
+    whole_bucket_budget = max_points - 2
+    bucket = datetime.timedelta(seconds=max(int(math.ceil((end_date - start_date).total_seconds() / whole_bucket_budget)), 1))
+
+    if proj_config.device_data_rollup_enabled:
+        for resolution in reversed(mysql_rollup_manager.rollup_resolution_list):
+            bucket_length = mysql_rollup_manager.rollup_definition_dict[resolution]['bucket_length']
+
+            if bucket_length <= bucket:
+                return int(math.ceil(bucket / bucket_length)) * bucket_length
+
+    return bucket
@@ -0,0 +1,287 @@
+""" Place holder for the methods that maintain the rollups of the device data table, i.e., the per minute (1m), hour (1h) and day (1d) aggregates of the data of each device/ontologyId pair, with the following values per bucket:
+    valueCount      -> Number of non NULL values
+    valueSum        -> Sum of the values (for averages)
+    valueMin        -> Smallest value
+    valueMax        -> Largest value
+    lastValue       -> Most recent non NULL value, with its timestamp in lastTimestamp
+The 1m rollup is computed from the raw data, the 1h from the 1m and the 1d from the 1h. Each refresh recomputes whole buckets from their source (instead of adding the new values to the stored aggregates), which makes it safe to run as many times as
+needed over the same data: rewritten records, repeated collections and late arriving data points (older than the ones collected before) all end up with the same rollups as a full rebuild would """
+
+import datetime
+import ambi_logger
+import utils
+import user_config
+import proj_config
+from mysql_database.python_database_modules import mysql_utils
+
+# The rollup resolutions, from the finest to the coarsest. Each one is computed from the previous one (the 1m from the raw data), with the SQL expression that returns the start of the bucket of a source record and the aggregates of its values
+rollup_resolution_list = ['1m', '1h', '1d']
+
+rollup_definition_dict = {
+    '1m': {
+        'table_key': 'device_data_rollup_1m',
+        'bucket_length': datetime.timedelta(minutes=1),
+        'source_table_key': 'device_data',
+        'source_time_column': 'timestamp',
+        'bucket_expression': """timestamp - INTERVAL SECOND(timestamp) SECOND""",
+        'aggregate_expression_list': ["""COUNT(value)""", """SUM(value)""", """MIN(value)""", """MAX(value)""", """SUBSTRING_INDEX(GROUP_CONCAT(value ORDER BY timestamp DESC SEPARATOR ','), ',', 1)""",
+                                      """MAX(IF(value IS NULL, NULL, timestamp))"""]
+    },
+    '1h': {
+        'table_key': 'device_data_rollup_1h',
+        'bucket_length': datetime.timedelta(hours=1),
+        'source_table_key': 'device_data_rollup_1m',
+        'source_time_column': 'bucketStart',
+        'bucket_expression': """bucketStart - INTERVAL MINUTE(bucketStart) MINUTE""",
+        'aggregate_expression_list': ["""SUM(valueCount)""", """SUM(valueSum)""", """MIN(valueMin)""", """MAX(valueMax)""", """SUBSTRING_INDEX(GROUP_CONCAT(lastValue ORDER BY lastTimestamp DESC SEPARATOR ','), ',', 1)""",
+                                      """MAX(lastTimestamp)"""]
+    },
+    '1d': {
+        'table_key': 'device_data_rollup_1d',
+        'bucket_length': datetime.timedelta(days=1),
+        'source_table_key': 'device_data_rollup_1h',
+        'source_time_column': 'bucketStart',
+        'bucket_expression': """TIMESTAMP(DATE(bucketStart))""",
+        'aggregate_expression_list': ["""SUM(valueCount)""", """SUM(valueSum)""", """MIN(valueMin)""", """MAX(valueMax)""", """SUBSTRING_INDEX(GROUP_CONCAT(lastValue ORDER BY lastTimestamp DESC SEPARATOR ','), ',', 1)""",
+                                      """MAX(lastTimestamp)"""]
+    }
+}
+
+# The rollup table columns, in the same order as the values returned by the 'aggregate_expression_list' above
+rollup_value_column_list = ['valueCount', 'valueSum', 'valueMin', 'valueMax', 'lastValue', 'lastTimestamp']
+
+
+def update_rollups(device_data_list):
+    """
+    Incremental maintenance of the rollups, to be called by the device data collection right after writing a list of records into the device data table. Only the buckets touched by the records provided are recomputed: the minutes with new data
+    for each device/ontologyId pair are merged into time ranges (minutes closer than proj_config.device_data_rollup_merge_gap end up in the same range) and, for each range, the 1m buckets are recomputed from the raw data and the 1h and 1d
+    buckets around it from the finer rollup. All in a single transaction.
+    It doesn't matter how old the records are (late arriving data gets its old buckets recomputed like any other) or if they were already in the database (their buckets are simply recomputed to the same values).
+    :param device_data_list: (list of dict) The records just written into the device data table, as built by mysql_telemetry_controller._build_device_data_records. Only the 'deviceId', 'ontologyId' and 'timestamp' keys are used
+    :raise utils.InputValidationException: If the input fails validation
+    :raise mysql_utils.MySQLDatabaseException: If any errors occur during the database accesses. Nothing is committed in that case
+    :return range_count: (int) The number of time ranges refreshed
+    """
+    log = ambi_logger.get_logger(__name__)
+
+    utils.validate_input_type(device_data_list, list)
+
+    # Collect the affected minutes per device/ontologyId pair. Records without any of these can't be aggregated anyway
+    bucket_set_dict = {}
+    for device_data in device_data_list:
+        utils.validate_input_type(device_data, dict)
+
+        if device_data.get('deviceId', None) is None or device_data.get('ontologyId', None) is None or device_data.get('timestamp', None) is None:
+            continue
+
+        bucket_set_dict.setdefault((device_data['deviceId'], device_data['ontologyId']), set()).add(floor_datetime(date=device_data['timestamp'], resolution='1m'))
+
+    # Merge the affected minutes into time ranges
+    range_list = []
+    bucket_length = rollup_definition_dict['1m']['bucket_length']
+
+    for (device_id, ontology_id), bucket_set in bucket_set_dict.items():
+        range_start = None
+        range_end = None
+
+        for bucket_start in sorted(bucket_set):
+            if range_start is not None and bucket_start - range_end < proj_config.device_data_rollup_merge_gap:
+                range_end = bucket_start + bucket_length
+                continue
+
+            if range_start is not None:
+                range_list.append((device_id, ontology_id, range_start, range_end))
+
+            range_start = bucket_start
+            range_end = bucket_start + bucket_length
+
+        if range_start is not None:
+            range_list.append((device_id, ontology_id, range_start, range_end))
+
+    if not range_list:
+        return 0
+
+    database_name = user_config.access_info['mysql_database']['database']
+
+    with mysql_utils.db_connection(database_name=database_name) as cnx:
+        change_cursor = cnx.cursor(buffered=True)
+
+        for device_id, ontology_id, range_start, range_end in range_list:
+            _refresh_rollup_range(cursor=change_cursor, range_start=range_start, range_end=range_end, device_id=device_id, ontology_id=ontology_id)
+
+        cnx.commit()
+        change_cursor.close()
+
+    log.info("Refreshed the device data rollups for {0} time ranges ({1} device/ontologyId pairs).".format(str(len(range_list)), str(len(bucket_set_dict))))
+
+    return len(range_list)
+
+
+def rebuild_rollups(start_date=None, end_date=None):
+    """
+    Recomputes all the rollups between two dates from the raw data, one day at a time (each day in its own transaction). Use it to compute the rollups for the data that was already in the device data table when the rollup tables were
+    created, or to repair them. As with update_rollups, it can be run over the same dates as many times as needed.
+    :param start_date: (datetime.datetime) The first day to recompute. Uses the oldest record in the device data table if omitted
+    :param end_date: (datetime.datetime) The last day to recompute. Uses the most recent record in the device data table if omitted
+    :raise utils.InputValidationException: If any of the inputs fails validation
+    :raise mysql_utils.MySQLDatabaseException: If any errors occur during the database accesses. The days committed before the error remain in the database
+    :return day_count: (int) The number of days recomputed
+    """
+    log = ambi_logger.get_logger(__name__)
+
+    if start_date is not None:
+        utils.validate_input_type(start_date, datetime.datetime)
+
+    if end_date is not None:
+        utils.validate_input_type(end_date, datetime.datetime)
+
+    database_name = user_config.access_info['mysql_database']['database']
+    data_table_name = proj_config.mysql_db_tables['device_data']
+
+    with mysql_utils.db_connection(database_name=database_name) as cnx:
+        change_cursor = cnx.cursor(buffered=True)
+
+        if start_date is None or end_date is None:
+            sql_select = """SELECT MIN(timestamp), MAX(timestamp) FROM """ + str(data_table_name) + """;"""
+            change_cursor = mysql_utils.run_sql_statement(cursor=change_cursor, sql_statement=sql_select, data_tuple=())
+            oldest_timestamp, newest_timestamp = change_cursor.fetchone()
+
+            if oldest_timestamp is None:
+                log.warning("{0}.{1} is empty. No rollups to rebuild...".format(str(database_name), str(data_table_name)))
+                change_cursor.close()
+                return 0
+
+            if start_date is None:
+                start_date = oldest_timestamp
+
+            if end_date is None:
+                end_date = newest_timestamp
+
+        if start_date > end_date:
+            error_msg = "Invalid time window provided: {0} -> {1}. Cannot continue until a start_date <= end_date is provided!".format(str(start_date), str(end_date))
+            log.error(error_msg)
+            change_cursor.close()
+            raise utils.InputValidationException(message=error_msg)
+
+        day_start = floor_datetime(date=start_date, resolution='1d')
+        last_day_start = floor_datetime(date=end_date, resolution='1d')
+        day_count = 0
+
+        while day_start <= last_day_start:
+            day_end = day_start + rollup_definition_dict['1d']['bucket_length']
+
+            _refresh_rollup_range(cursor=change_cursor, range_start=day_start, range_end=day_end)
+            cnx.commit()
+
+            day_count += 1
+            day_start = day_end
+
+        change_cursor.close()
+
+    log.info("Rebuilt the device data rollups for {0} days, from {1} to {2}.".format(str(day_count), str(floor_datetime(date=start_date, resolution='1d').date()), str(last_day_start.date())))
+
+    return day_count
+
+
+def select_rollup_resolution(start_date, end_date, bucket):
+    """
+    Finds the coarsest rollup able to answer a bucketed query over the time window provided exactly as the raw data would, which is the case when the bucket is a whole number of rollup buckets and both ends of the window fall on rollup bucket
+    boundaries. NOTE: A rollup covers the window up to, but not including, end_date, while the raw data queries include end_date itself.
+    :param start_date: (datetime.datetime) The beginning of the time window
+    :param end_date: (datetime.datetime) The end of the time window
+    :param bucket: (datetime.timedelta) The bucket length requested
+    :return resolution: (str) One of rollup_resolution_list, or None if the query has to be answered from the raw data (which includes the case where the rollups are disabled in proj_config.device_data_rollup_enabled)
+    """
+    if not proj_config.device_data_rollup_enabled or bucket is None:
+        return None
+
+    for resolution in reversed(rollup_resolution_list):
+        bucket_length = rollup_definition_dict[resolution]['bucket_length']
+
+        if bucket % bucket_length == datetime.timedelta(0) and floor_datetime(date=start_date, resolution=resolution) == start_date and floor_datetime(date=end_date, resolution=resolution) == end_date:
+            return resolution
+
+    return None
+
+
+def get_rollup_table_name(resolution):
+    """
+    Returns the name of the table of a rollup resolution.
+    :param resolution: (str) One of rollup_resolution_list
+    :raise utils.InputValidationException: If the resolution is not valid
+    :return table_name: (str) The name of the rollup table
+    """
+    if resolution not in rollup_definition_dict:
+        raise utils.InputValidationException(message="Invalid rollup resolution provided: {0}. Valid resolutions are {1}".format(str(resolution), str(rollup_resolution_list)))
+
+    return proj_config.mysql_db_tables[rollup_definition_dict[resolution]['table_key']]
+
+
+def _refresh_rollup_range(cursor, range_start, range_end, device_id=None, ontology_id=None):
+    """
+    Recomputes every rollup bucket that overlaps a time range, from the finest to the coarsest resolution (each one from the one before, after it's been refreshed itself). The time range is widened at each resolution to whole buckets, so
+    that a coarser bucket is always recomputed from all of its finer buckets. The caller takes care of the commit.
+    :param cursor: (mysql.connector.cursor.MySQLCursor) A cursor from an open database connection
+    :param range_start: (datetime.datetime) The beginning of the time range
+    :param range_end: (datetime.datetime) The end of the time range (exclusive)
+    :param device_id: (str) Restricts the refresh to a single device. All devices are refreshed if omitted
+    :param ontology_id: (str) Restricts the refresh to a single ontologyId. All ontologyIds are refreshed if omitted
+    :raise mysql_utils.MySQLDatabaseException: If any errors occur during the database accesses
+    """
+    for resolution in rollup_resolution_list:
+        rollup_definition = rollup_definition_dict[resolution]
+        range_start = floor_datetime(date=range_start, resolution=resolution)
+        range_end = ceil_datetime(date=range_end, resolution=resolution)
+
+        where_str = """ WHERE """ + rollup_definition['source_time_column'] + """ >= %s AND """ + rollup_definition['source_time_column'] + """ < %s AND deviceId IS NOT NULL AND ontologyId IS NOT NULL"""
+        data_list = [range_start, range_end]
+
+        if device_id is not None:
+            where_str += """ AND deviceId = %s"""
+            data_list.append(device_id)
+
+        if ontology_id is not None:
+            where_str += """ AND ontologyId = %s"""
+            data_list.append(ontology_id)
+
+        sql_refresh = """INSERT INTO """ + get_rollup_table_name(resolution=resolution) + """ (ontologyId, deviceId, bucketStart, """ + """, """.join(rollup_value_column_list) + """, updatedTime) SELECT ontologyId, deviceId, """ + \
+                      rollup_definition['bucket_expression'] + """ AS rollupBucket, """ + """, """.join(rollup_definition['aggregate_expression_list']) + """, NOW() FROM """ + \
+                      proj_config.mysql_db_tables[rollup_definition['source_table_key']] + where_str + """ GROUP BY ontologyId, deviceId, rollupBucket ON DUPLICATE KEY UPDATE """ + \
+                      """, """.join([column_name + """ = VALUES(""" + column_name + """)""" for column_name in rollup_value_column_list + ['updatedTime']]) + """;"""
+
+        mysql_utils.run_sql_statement(cursor=cursor, sql_statement=sql_refresh, data_tuple=tuple(data_list))
+
+
+def floor_datetime(date, resolution):
+    """
+    Returns the start of the rollup bucket that contains a given date.
+    :param date: (datetime.datetime) The date
+    :param resolution: (str) One of rollup_resolution_list
+    :return bucket_start: (datetime.datetime) The start of the bucket
+    """
+    if resolution == '1m':
+        return date.replace(second=0, microsecond=0)
+    elif resolution == '1h':
+        return date.replace(minute=0, second=0, microsecond=0)
+    else:
+        return date.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def ceil_datetime(date, resolution):
+    """
+    Returns the first rollup bucket boundary at or after a given date.
+    :param date: (datetime.datetime) The date
+    :param resolution: (str) One of rollup_resolution_list
+    :return bucket_boundary: (datetime.datetime) The date itself if it falls on a bucket boundary, the start of the next bucket otherwise
+    """
+    bucket_start = floor_datetime(date=date, resolution=resolution)
+
+    if bucket_start == date:
+        return date
+
+    return bucket_start + rollup_definition_dict[resolution]['bucket_length']
+
+
+if __name__ == "__main__":
+    # Compute the rollups for all the data already in the device data table
+    rebuild_rollups()
@@ -3,13 +3,17 @@ import proj_config
 import user_config
 import utils
 import datetime
+import concurrent.futures
 import ambi_logger
 from mysql_database.python_database_modules import mysql_utils
 from mysql_database.python_database_modules import database_table_updater
+from mysql_database.python_database_modules import mysql_auth_controller
+from mysql_database.python_database_modules import mysql_rollup_manager
+from mysql_database.python_database_modules import mysql_env_data_cache
 from ThingsBoard_REST_API import tb_telemetry_controller
 
 
-def populate_device_data_table(collection_time_limit=None, device_name_list=None):
+def populate_device_data_table(collection_time_limit=None, device_name_list=None, batch_size=None, max_workers=None, incremental=False):
     """
     This method aggregates a whole bunch of methods developed so far in order to fill out the main data repository for devices in the MySQL database. This method scans the device table for all devices configured there and, from the information
     retrieved from it, populates this table. Given how complex and populated this table may become, only the data from the current time up to either the provided collection_time_limit or a default 24 hour period, which is also going to be the
@@ -18,10 +22,16 @@ def populate_device_data_table(collection_time_limit=None, device_name_list=None
     ) (if a datetime.timedelta is provided instead).
     :param device_name_list (list of str) - Use this argument to provide a list with the names of the devices whose data is to be updated. If no list is provided through this argument, the method updated all devices currently configured in the
     tb_devices table.
+    :param batch_size (int) - The number of records to write per statement when sending the device data to the database. Defaults to proj_config.mysql_batch_size if omitted.
+    :param max_workers (int) - If provided (and greater than 1), the devices are queried concurrently from the remote server using a pool of max_workers threads, while a single writer (the calling thread) sends the results to the database. If
+    omitted, the devices are processed one at a time. In either case, a device whose data cannot be retrieved or written (for whatever reason) is logged and skipped instead of aborting the whole run.
+    :param incremental (bool) - If True, the data is collected from the high-water marks kept in tb_device_watermarks instead, i.e., each device/timeseriesKey pair only gets the data points from proj_config.device_data_watermark_overlap
+    before the last one already stored in the database onwards (to pick up the points that arrived late). The time window set by collection_time_limit is then used only for the pairs without a high-water mark yet (the first run for that
+    device, basically). The high-water marks are moved forward after each device's data is written.
     :raise utils.InputValidationException - If the input fails initial validation.
     :raise mysql_utils.MySQLDatabaseException - If problems occur when accessing the database.
     :raise utils.ServiceEndpointException - If the remote server cannot be accessed/returns access errors
-    :return:
+    :return result_dict (dict) - The overall outcome of the database writes, in the format {'inserted': int, 'updated': int, 'unchanged': int, 'failed': list of str}, where 'failed' has the names of the devices that could not be retrieved or written
     """
     log = ambi_logger.get_logger(__name__)
 
@@ -41,14 +51,355 @@ def populate_device_data_table(collection_time_limit=None, device_name_list=None
         for device_name in device_name_list:
             utils.validate_input_type(device_name, str)
 
+    if batch_size is not None:
+        utils.validate_input_type(batch_size, int)
+
+    utils.validate_input_type(incremental, bool)
+
+    if max_workers is not None:
+        utils.validate_input_type(max_workers, int)
+
+        if max_workers <= 0:
+            error_msg = "Invalid number of workers provided: {0}. Please provide a greater than zero integer for this argument.".format(str(max_workers))
+            log.error(error_msg)
+            raise utils.InputValidationException(message=error_msg)
+
     # Finally, check if an empty list was provided and replace the variable by a None if so. Otherwise it may break this method later on
-    if len(device_name_list) == 0:
+    if device_name_list is not None and len(device_name_list) == 0:
         device_name_list = None
 
     # Validation done. Start by creating the usual database access objects
     database_name = user_config.access_info['mysql_database']['database']
-    device_table_name = proj_config.mysql_db_tables['devices']
     data_table_name = proj_config.mysql_db_tables['device_data']
+
+    # Grab all the device records at once. The database connection is not kept open after this, so there's no point in holding it while the remote API is being queried (which can take a while)
+    device_columns, device_record_list = _select_device_records(device_name_list=device_name_list)
+
+    # Define the time window before going into the main loop
+    end_date = datetime.datetime.now().replace(microsecond=0)
+    # end_date = datetime.datetime(year=2020, month=7, day=10, hour=0, minute=0, second=0)
+    if type(collection_time_limit) == datetime.datetime:
+        start_date = collection_time_limit
+    else:
+        start_date = end_date - collection_time_limit
+
+    # In incremental mode, load all the current high-water marks at once, before querying anything from the remote server
+    if incremental:
+        watermark_dict = get_device_watermarks()
+    else:
+        watermark_dict = None
+
+    # Overall outcome of the database writes. The 'failed' entry keeps the names of the devices whose data could not be retrieved from the remote server
+    result_dict = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'failed': []}
+
+    if max_workers is None or max_workers == 1:
+        # Sequential mode: fetch and write the data of one device at a time, as usual
+        for device_record in device_record_list:
+            device_name = device_record[device_columns.index('name')]
+
+            # Whatever goes wrong with a device (remote API, expired credentials, malformed data points or the database write itself) is isolated to that device, so that a single bad device doesn't bring down the whole collection run
+            try:
+                fetch_result = _fetch_device_data(device_record=device_record, device_columns=device_columns, start_date=start_date, end_date=end_date, watermark_dict=watermark_dict)
+                _write_device_data(device_record=device_record, device_columns=device_columns, fetch_result=fetch_result, data_table_name=data_table_name, batch_size=batch_size, result_dict=result_dict,
+                                   update_watermarks=incremental)
+            except Exception:
+                log.exception("Unable to collect the data from device '{0}'. Skipping it...".format(str(device_name)))
+                result_dict['failed'].append(device_name)
+    else:
+        # Concurrent mode: the remote API calls (which is where most of the time goes) are spread among a pool of max_workers threads while this (main) thread acts as the single writer into the database, processing the results as they
+        # become available. This way the number of simultaneous requests sent to the ThingsBoard server is bounded and the database writes remain sequential
+        log.info("Retrieving data from {0} devices using {1} concurrent workers...".format(str(len(device_record_list)), str(max_workers)))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            future_dict = {}
+            for device_record in device_record_list:
+                future = executor.submit(_fetch_device_data, device_record=device_record, device_columns=device_columns, start_date=start_date, end_date=end_date, watermark_dict=watermark_dict)
+                future_dict[future] = device_record
+
+            for future in concurrent.futures.as_completed(future_dict):
+                device_record = future_dict[future]
+                device_name = device_record[device_columns.index('name')]
+
+                # Any Exception raised by the worker is re-raised here by the result() call. Isolate it (and any error writing the device's data) to the device in question so that a single bad device doesn't bring down the whole collection run
+                try:
+                    fetch_result = future.result()
+                    _write_device_data(device_record=device_record, device_columns=device_columns, fetch_result=fetch_result, data_table_name=data_table_name, batch_size=batch_size, result_dict=result_dict,
+                                       update_watermarks=incremental)
+                except Exception:
+                    log.exception("Unable to collect the data from device '{0}'. Skipping it...".format(str(device_name)))
+                    result_dict['failed'].append(device_name)
+
+    log.info("Device data collection finished: {0} records inserted, {1} updated and {2} unchanged in {3}.{4}".format(str(result_dict['inserted']), str(result_dict['updated']), str(result_dict['unchanged']), str(database_name),
+                                                                                                                  str(data_table_name)))
+
+    if result_dict['failed']:
+        log.warning("Unable to collect data from {0} devices: {1}".format(str(len(result_dict['failed'])), str(result_dict['failed'])))
+
+    return result_dict
+
+
+def backfill_device_data(start_date, end_date=None, device_name_list=None, slice_size=None, max_workers=None, batch_size=None):
+    """
+    Use this method to load long historical periods of device data into the database (when a new building is onboarded, for instance). The period between start_date and end_date is split into consecutive slices of slice_size for each device
+    and each of these device/slice pairs becomes an independent unit of work. All these units, across all devices and time, are retrieved concurrently from the remote server by a pool of at most max_workers threads (a global cap on the number of
+    simultaneous requests), while the calling thread writes the results into the database in bulk as they arrive. Each slice written is registered as completed in tb_backfill_slices: running the same backfill again (after an interruption, for
+    example) skips all the slices that were already completed and retrieves only the remaining ones. Slices that fail are registered as such, logged and retried on the next run, without stopping the remaining ones.
+    NOTE: The slices are aligned to start_date, so a backfill can only be resumed as such if it is run again with the same start_date and slice_size.
+    :param start_date (datetime.datetime) - The start of the period to backfill
+    :param end_date (datetime.datetime) - The end of the period to backfill. Defaults to the current date and time
+    :param device_name_list (list of str) - The names of the devices to backfill. All devices in tb_devices are backfilled if this one is omitted
+    :param slice_size (datetime.timedelta) - The size of the time slices. Defaults to proj_config.backfill_slice_size
+    :param max_workers (int) - The maximum number of slices retrieved simultaneously. Defaults to proj_config.backfill_max_workers
+    :param batch_size (int) - The number of records to write per statement. Defaults to proj_config.mysql_batch_size
+    :raise utils.InputValidationException - If the input fails initial validation.
+    :raise mysql_utils.MySQLDatabaseException - If problems occur when accessing the database.
+    :return result_dict (dict) - The outcome of the backfill in the format {'inserted': int, 'updated': int, 'unchanged': int, 'slices_completed': int, 'slices_skipped': int, 'failed': list of str}, where 'failed' describes the device/slice
+    pairs (or whole devices) that could not be retrieved
+    """
+    log = ambi_logger.get_logger(__name__)
+
+    # Validate inputs
+    utils.validate_input_type(start_date, datetime.datetime)
+
+    if end_date is None:
+        end_date = datetime.datetime.now()
+    else:
+        utils.validate_input_type(end_date, datetime.datetime)
+
+    if device_name_list:
+        utils.validate_input_type(device_name_list, list)
+        for device_name in device_name_list:
+            utils.validate_input_type(device_name, str)
+    else:
+        device_name_list = None
+
+    if slice_size is None:
+        slice_size = proj_config.backfill_slice_size
+    else:
+        utils.validate_input_type(slice_size, datetime.timedelta)
+
+    if max_workers is None:
+        max_workers = proj_config.backfill_max_workers
+    else:
+        utils.validate_input_type(max_workers, int)
+
+    if batch_size is not None:
+        utils.validate_input_type(batch_size, int)
+
+    # The slice limits are stored in DATETIME columns, which don't keep fractions of a second. Drop these from the period limits too, otherwise the completed slices wouldn't match anymore when read back
+    start_date = start_date.replace(microsecond=0)
+    end_date = end_date.replace(microsecond=0)
+
+    error_msg = None
+    if start_date >= end_date:
+        error_msg = "Invalid backfill period: the start_date provided ({0}) is newer/equal than/to the end_date ({1}).".format(str(start_date), str(end_date))
+    elif end_date > datetime.datetime.now():
+        error_msg = "Invalid end_date provided: {0}! The date hasn't happen yet (future date).".format(str(end_date))
+    elif slice_size < datetime.timedelta(seconds=1):
+        error_msg = "Invalid slice size provided: {0}. Please provide at least a 1 second slice.".format(str(slice_size))
+    elif max_workers <= 0:
+        error_msg = "Invalid number of workers provided: {0}. Please provide a greater than zero integer for this argument.".format(str(max_workers))
+
+    if error_msg:
+        log.error(error_msg)
+        raise utils.InputValidationException(message=error_msg)
+
+    data_table_name = proj_config.mysql_db_tables['device_data']
+    device_columns, device_record_list = _select_device_records(device_name_list=device_name_list)
+
+    # Split the period into slices, all aligned to the start_date
+    slice_list = []
+    slice_start = start_date
+    while slice_start < end_date:
+        slice_end = min(slice_start + slice_size, end_date)
+        slice_list.append((slice_start, slice_end))
+        slice_start = slice_end
+
+    # Find out which slices were already completed in previous runs
+    completed_slice_set = _get_completed_backfill_slices()
+
+    result_dict = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'slices_completed': 0, 'slices_skipped': 0, 'failed': []}
+
+    # Build the list of pending work units, i.e., the device/slice pairs that are not completed yet. The device attributes are needed for all of them, so get these now, once per device
+    work_list = []
+    for device_record in device_record_list:
+        device_id = device_record[device_columns.index('id')]
+        device_name = device_record[device_columns.index('name')]
+
+        pending_slice_list = [device_slice for device_slice in slice_list if (device_id, device_slice[0], device_slice[1]) not in completed_slice_set]
+        result_dict['slices_skipped'] += len(slice_list) - len(pending_slice_list)
+
+        if not pending_slice_list:
+            log.info("Device '{0}' is already backfilled between {1} and {2}. Skipping...".format(str(device_name), str(start_date), str(end_date)))
+            continue
+
+        try:
+            device_attributes = tb_telemetry_controller.getAttributes(entityType=device_record[device_columns.index('entityType')], entityId=device_id)
+        except Exception:
+            log.exception("Unable to retrieve the attributes of device '{0}'. Skipping it...".format(str(device_name)))
+            result_dict['failed'].append(device_name)
+            continue
+
+        if not device_attributes:
+            log.warning("Device '{0}' has no attributes configured yet! Skipping...".format(str(device_name)))
+            continue
+
+        for slice_start, slice_end in pending_slice_list:
+            work_list.append((device_record, device_attributes, slice_start, slice_end))
+
+    log.info("Backfilling {0} slices from {1} devices between {2} and {3} ({4} slices already completed) with {5} concurrent workers...".format(str(len(work_list)), str(len(device_record_list)), str(start_date), str(end_date),
+                                                                                                                                          str(result_dict['slices_skipped']), str(max_workers)))
+
+    # Backfills can take hours. Keep the authorization tokens fresh in the background for the duration (unless someone else already started the refresher, in which case it is theirs to stop)
+    refresher_started = not mysql_auth_controller.is_token_refresher_running()
+    if refresher_started:
+        mysql_auth_controller.start_token_refresher()
+
+    # Keep only a limited number of slices in flight at any time. Submitting all of them at once would pile up the results in memory whenever the remote server is faster than the database writes
+    max_in_flight = 2 * max_workers
+    work_iterator = iter(work_list)
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            future_dict = {}
+
+            while True:
+                # Top up the pool
+                while len(future_dict) < max_in_flight:
+                    work_unit = next(work_iterator, None)
+                    if work_unit is None:
+                        break
+
+                    future = executor.submit(_fetch_backfill_slice, device_record=work_unit[0], device_columns=device_columns, device_attributes=work_unit[1], slice_start=work_unit[2], slice_end=work_unit[3])
+                    future_dict[future] = work_unit
+
+                if not future_dict:
+                    break
+
+                done_set, pending_set = concurrent.futures.wait(list(future_dict.keys()), return_when=concurrent.futures.FIRST_COMPLETED)
+
+                for future in done_set:
+                    device_record, device_attributes, slice_start, slice_end = future_dict.pop(future)
+                    device_name = device_record[device_columns.index('name')]
+
+                    # Whatever goes wrong with a slice, be it retrieving it, converting its data points or writing them, is isolated to that slice: it is registered as failed (to be retried in the next run) and the backfill carries on
+                    try:
+                        ts_data_dict = future.result()
+
+                        # Single writer: the data first and only then the slice completion, so that a slice is never flagged as completed without its data being safely stored
+                        device_data_list = _build_device_data_records(device_record=device_record, device_columns=device_columns, device_attributes=device_attributes, ts_data_dict=ts_data_dict)
+                        batch_result = database_table_updater.add_table_data_batch(data_dict_list=device_data_list, table_name=data_table_name, batch_size=batch_size)
+
+                        for result_key in ['inserted', 'updated', 'unchanged']:
+                            result_dict[result_key] += batch_result[result_key]
+
+                        # Backfilled data is late arriving data, as far as the rollups are concerned
+                        if proj_config.device_data_rollup_enabled:
+                            mysql_rollup_manager.update_rollups(device_data_list=device_data_list)
+
+                        mysql_env_data_cache.invalidate_device_data(device_data_list=device_data_list)
+
+                        _register_backfill_slice(device_record=device_record, device_columns=device_columns, slice_start=slice_start, slice_end=slice_end, status='completed', rows_written=len(device_data_list))
+                    except Exception:
+                        log.exception("Unable to backfill slice {0} -> {1} from device '{2}'. It is going to be retried in the next run.".format(str(slice_start), str(slice_end), str(device_name)))
+                        result_dict['failed'].append("{0} ({1} -> {2})".format(str(device_name), str(slice_start), str(slice_end)))
+
+                        # The slice is retried in the next run anyway (only the completed ones are skipped), so failing to register it as failed is not a reason to stop either
+                        try:
+                            _register_backfill_slice(device_record=device_record, device_columns=device_columns, slice_start=slice_start, slice_end=slice_end, status='failed', rows_written=0)
+                        except Exception:
+                            log.exception("Unable to register slice {0} -> {1} from device '{2}' as failed.".format(str(slice_start), str(slice_end), str(device_name)))
+
+                        continue
+
+                    result_dict['slices_completed'] += 1
+    finally:
+        if refresher_started:
+            mysql_auth_controller.stop_token_refresher()
+
+    log.info("Backfill finished: {0} slices completed ({1} records inserted, {2} updated and {3} unchanged), {4} skipped and {5} failed.".format(str(result_dict['slices_completed']), str(result_dict['inserted']), str(result_dict['updated']),
+                                                                                                                                           str(result_dict['unchanged']), str(result_dict['slices_skipped']),
+                                                                                                                                           str(len(result_dict['failed']))))
+
+    return result_dict
+
+
+def _fetch_backfill_slice(device_record, device_columns, device_attributes, slice_start, slice_end):
+    """
+    This method retrieves all the data of a device within a single backfill slice. Just like _fetch_device_data, it doesn't touch any shared state and can run from multiple threads at once.
+    :param device_record (tuple) - The record of the device, as returned from tb_devices, whose data is to be retrieved
+    :param device_columns (list of str) - The list of column names of tb_devices, in order, to be able to index the device_record elements
+    :param device_attributes (dict) - The device attributes dictionary, as returned from tb_telemetry_controller.getAttributes
+    :param slice_start (datetime.datetime) - The start of the slice
+    :param slice_end (datetime.datetime) - The end of the slice
+    :raise utils.ServiceEndpointException - If the remote server cannot be accessed/returns access errors
+    :return ts_data_dict (dict) - The timeseries data within the slice, in the same format returned by tb_telemetry_controller.getTimeseries
+    """
+    ts_data_dict = {}
+    for window_start, window_end, window_data_dict in tb_telemetry_controller.getTimeseriesStream(device_name=device_record[device_columns.index('name')], end_date=slice_end, start_date=slice_start,
+                                                                                                 timeseries_keys_filter=list(device_attributes.keys())):
+        for timeseries_key in window_data_dict:
+            ts_data_dict.setdefault(timeseries_key, []).extend(window_data_dict[timeseries_key])
+
+    return ts_data_dict
+
+
+def _get_completed_backfill_slices():
+    """
+    This method retrieves the backfill slices already completed from the tb_backfill_slices table.
+    :raise mysql_utils.MySQLDatabaseException - If problems occur when accessing the database.
+    :return completed_slice_set (set of tuple) - A set with a (deviceId, sliceStart, sliceEnd) tuple per completed slice
+    """
+    database_name = user_config.access_info['mysql_database']['database']
+    slice_table_name = proj_config.mysql_db_tables['backfill_slices']
+    cnx = mysql_utils.connect_db(database_name=database_name)
+    select_cursor = cnx.cursor(buffered=True)
+
+    sql_select = """SELECT deviceId, sliceStart, sliceEnd FROM """ + str(slice_table_name) + """ WHERE status = %s;"""
+    select_cursor = mysql_utils.run_sql_statement(cursor=select_cursor, sql_statement=sql_select, data_tuple=('completed',))
+
+    completed_slice_set = set(select_cursor.fetchall())
+
+    select_cursor.close()
+    cnx.close()
+
+    return completed_slice_set
+
+
+def _register_backfill_slice(device_record, device_columns, slice_start, slice_end, status, rows_written):
+    """
+    This method writes (or updates) the status of a backfill slice in the tb_backfill_slices table.
+    :param device_record (tuple) - The record of the device, as returned from tb_devices, to which the slice belongs
+    :param device_columns (list of str) - The list of column names of tb_devices, in order, to be able to index the device_record elements
+    :param slice_start (datetime.datetime) - The start of the slice
+    :param slice_end (datetime.datetime) - The end of the slice
+    :param status (str) - The status of the slice: 'completed' or 'failed'
+    :param rows_written (int) - The number of data points written from this slice
+    :raise mysql_utils.MySQLDatabaseException - If problems occur when accessing the database.
+    """
+    slice_dict = {
+        'deviceId': device_record[device_columns.index('id')],
+        'deviceName': device_record[device_columns.index('name')],
+        'sliceStart': slice_start,
+        'sliceEnd': slice_end,
+        'status': status,
+        'rowsWritten': rows_written,
+        'completedTime': datetime.datetime.now().replace(microsecond=0)
+    }
+
+    database_table_updater.add_table_data_batch(data_dict_list=[slice_dict], table_name=proj_config.mysql_db_tables['backfill_slices'])
+
+
+def _select_device_records(device_name_list=None):
+    """
+    This method retrieves the records of the devices whose data is to be collected from the tb_devices table.
+    :param device_name_list (list of str) - The names of the devices to retrieve. All devices in tb_devices are returned if this one is None.
+    :raise mysql_utils.MySQLDatabaseException - If problems occur when accessing the database or if no device records are found.
+    :return (device_columns, device_record_list) (tuple) - The list of column names of tb_devices, in order, and the list of device records (tuples) found
+    """
+    log = ambi_logger.get_logger(__name__)
+
+    database_name = user_config.access_info['mysql_database']['database']
+    device_table_name = proj_config.mysql_db_tables['devices']
     cnx = mysql_utils.connect_db(database_name=database_name)
     select_cursor = cnx.cursor(buffered=True)
 
@@ -81,93 +432,205 @@ def populate_device_data_table(collection_time_limit=None, device_name_list=None
     select_cursor = mysql_utils.run_sql_statement(cursor=select_cursor, sql_statement=sql_select, data_tuple=data_tuple)
 
     # Cannot do anything if no device data comes back, there's nothing more to do in this case...
-    if select_cursor.rowcount is 0:
+    if select_cursor.rowcount == 0:
         error_msg = "{0}.{1} wasn't populated with device data yet. Cannot continue...".format(str(database_name), str(device_table_name))
         log.error(error_msg)
+        select_cursor.close()
+        cnx.close()
         raise mysql_utils.MySQLDatabaseException(message=error_msg)
 
-    # Define the time window before going into the main while loop
-    end_date = datetime.datetime.now().replace(microsecond=0)
-    # end_date = datetime.datetime(year=2020, month=7, day=10, hour=0, minute=0, second=0)
-    if type(collection_time_limit) == datetime.datetime:
-        start_date = collection_time_limit
-    else:
-        start_date = end_date - collection_time_limit
+    device_record_list = select_cursor.fetchall()
+    select_cursor.close()
+    cnx.close()
 
-    # Use the data from the previous SELECT data to retrieve the next piece of important data - the attribute list - and proceed to populate the table with timeseries data only if both element were obtained
-    device_record = select_cursor.fetchone()
+    return device_columns, device_record_list
 
-    # Establish a limit of records so that it can be possible to retrieve multiple pages of results, if needed
-    limit = 1000000
 
-    while device_record:
-        # Start by fetching the device's attributes, if any exist
-        device_attributes = tb_telemetry_controller.getAttributes(
-            entityType=device_record[device_columns.index('entityType')],
-            entityId=device_record[device_columns.index('id')]
-        )
+def _fetch_device_data(device_record, device_columns, start_date, end_date, watermark_dict=None):
+    """
+    This method does the remote part of the device data collection for a single device, i.e., it fetches the device's attributes and then the device's timeseries data within the time window provided. Since it doesn't touch any shared state,
+    it is safe to run it from multiple threads at once.
+    :param device_record (tuple) - The record of the device, as returned from tb_devices, whose data is to be retrieved
+    :param device_columns (list of str) - The list of column names of tb_devices, in order, to be able to index the device_record elements
+    :param start_date (datetime.datetime) - The start of the time window to retrieve data from
+    :param end_date (datetime.datetime) - The end of the time window to retrieve data from
+    :param watermark_dict (dict) - The high-water marks dictionary, as returned by get_device_watermarks. If provided, the data is only requested from proj_config.device_data_watermark_overlap before the oldest high-water mark of the device
+    keys onwards (or from start_date for the keys without one). The data points already collected within that overlap are returned again, which is harmless, since writing them again doesn't change the records
+    :raise utils.ServiceEndpointException - If the remote server cannot be accessed/returns access errors
+    :return (device_attributes, ts_data_dict) (tuple) - The device attributes dictionary (timeseriesKey: ontology name) and the timeseries dictionary returned by the remote API, or None if the device has no attributes configured yet or if
+    there's nothing new to collect from it
+    """
+    log = ambi_logger.get_logger(__name__)
 
-        # If the last call returned a None, it means no attributes are currently defined for the device in question
-        if not device_attributes:
-            log.warning("Device '{0}' has no attributes configured yet! Skipping...".format(str(device_record[device_columns.index('name')])))
+    # Start by fetching the device's attributes, if any exist
+    device_attributes = tb_telemetry_controller.getAttributes(
+        entityType=device_record[device_columns.index('entityType')],
+        entityId=device_record[device_columns.index('id')]
+    )
+
+    # If the last call returned a None, it means no attributes are currently defined for the device in question
+    if not device_attributes:
+        log.warning("Device '{0}' has no attributes configured yet! Skipping...".format(str(device_record[device_columns.index('name')])))
+        return None
+
+    # The results from the last call provide me with a key element for the next call - the timeseriesKeys that are being used by the device to send data to the ThingsBoard database. Right now, the device timeseriesKeys are the keys of the
+    # dictionary returned previously, so grab them to a list. Since the only results returned from the last call are the ones with an ontology term associated to them and I'm only interested in these, might as well use the key list returned as
+    # a filter for the timeseries retrieval too
+    device_ts = list(device_attributes.keys())
 
-            # Grab the next record at hand in this case
-            device_record = select_cursor.fetchone()
+    if watermark_dict is not None:
+        # Get the high-water marks for this device only
+        device_watermarks = watermark_dict.get(device_record[device_columns.index('id')], {})
 
-            # Skip the rest of this cycle
+        # Each timeseriesKey needs data from its high-water mark minus the overlap (late arriving data points can show up with timestamps older than the high-water mark) or, if it doesn't have one yet, from the default start_date. Since all
+        # keys are requested in the same call, the device's time window has to start at the oldest of these
+        key_start_list = []
+        for timeseries_key in device_ts:
+            if timeseries_key in device_watermarks:
+                key_start_list.append(datetime.datetime.fromtimestamp(device_watermarks[timeseries_key] / 1000) - proj_config.device_data_watermark_overlap)
+            else:
+                key_start_list.append(start_date)
+
+        start_date = min(key_start_list)
+
+        # The device may have been collected just now. Nothing to do in that case
+        if start_date >= end_date:
+            log.info("Device '{0}' is already up to date. Skipping...".format(str(device_record[device_columns.index('name')])))
+            return None
+
+    # Grab the data produced by the device within the time window established. The window is retrieved in adaptive sub-windows, which ensures that no data is lost to the remote API's limit, and the results are gathered back together. The data
+    # points already in the database (from the overlap, or from keys with a more recent high-water mark than the device's start_date) are kept: the device data writes are upserts, so these end up as 'unchanged' records
+    ts_data_dict = {}
+    for window_start, window_end, window_data_dict in tb_telemetry_controller.getTimeseriesStream(device_name=device_record[device_columns.index('name')], end_date=end_date, start_date=start_date, timeseries_keys_filter=device_ts):
+        for timeseries_key in window_data_dict:
+            ts_data_dict.setdefault(timeseries_key, []).extend(window_data_dict[timeseries_key])
+
+    return device_attributes, ts_data_dict
+
+
+def _write_device_data(device_record, device_columns, fetch_result, data_table_name, batch_size, result_dict, update_watermarks=False):
+    """
+    This method does the database part of the device data collection for a single device: it converts the results of a _fetch_device_data call into database records, writes them in batches, refreshes the rollups they touch (see mysql_rollup_manager.update_rollups) and adds the outcome to the result_dict provided.
+    :param device_record (tuple) - The record of the device, as returned from tb_devices, that produced the data
+    :param device_columns (list of str) - The list of column names of tb_devices, in order, to be able to index the device_record elements
+    :param fetch_result (tuple) - The (device_attributes, ts_data_dict) tuple returned by _fetch_device_data. Nothing is written if this one is None
+    :param data_table_name (str) - The name of the database table where the data is to be written into
+    :param batch_size (int) - The number of records to write per statement
+    :param result_dict (dict) - The overall results dictionary, whose 'inserted', 'updated' and 'unchanged' counts are updated in place
+    :param update_watermarks (bool) - Set this one to True to move the device's high-water marks in tb_device_watermarks to the most recent data points written. This only happens after the data is safely in the database
+    :raise mysql_utils.MySQLDatabaseException - If problems occur when writing into the database.
+    """
+    if fetch_result is None:
+        return
+
+    device_attributes, ts_data_dict = fetch_result
+
+    # Convert the whole set of data points into database records and write them all at once, in batches, instead of one record at a time
+    device_data_list = _build_device_data_records(device_record=device_record, device_columns=device_columns, device_attributes=device_attributes, ts_data_dict=ts_data_dict)
+
+    batch_result = database_table_updater.add_table_data_batch(data_dict_list=device_data_list, table_name=data_table_name, batch_size=batch_size)
+
+    # Keep a tally of the overall results too
+    for result_key in ['inserted', 'updated', 'unchanged']:
+        result_dict[result_key] += batch_result[result_key]
+
+    # Recompute the rollup buckets touched by the data just written and drop any cached query results that overlap it
+    if proj_config.device_data_rollup_enabled:
+        mysql_rollup_manager.update_rollups(device_data_list=device_data_list)
+
+    mysql_env_data_cache.invalidate_device_data(device_data_list=device_data_list)
+
+    if update_watermarks:
+        _update_device_watermarks(device_id=device_record[device_columns.index('id')], ts_data_dict=ts_data_dict)
+
+
+def get_device_watermarks():
+    """
+    This method retrieves all the high-water marks of the device data collection currently stored in the tb_device_watermarks table.
+    :raise mysql_utils.MySQLDatabaseException - If problems occur when accessing the database.
+    :return watermark_dict (dict) - A dictionary of dictionaries in the format {deviceId: {timeseriesKey: lastTimestamp}}, where lastTimestamp is the ThingsBoard timestamp (13 digit int) of the most recent data point already collected
+    """
+    database_name = user_config.access_info['mysql_database']['database']
+    watermark_table_name = proj_config.mysql_db_tables['device_watermarks']
+    cnx = mysql_utils.connect_db(database_name=database_name)
+    select_cursor = cnx.cursor(buffered=True)
+
+    sql_select = """SELECT deviceId, timeseriesKey, lastTimestamp FROM """ + str(watermark_table_name) + """;"""
+    select_cursor = mysql_utils.run_sql_statement(cursor=select_cursor, sql_statement=sql_select, data_tuple=())
+
+    watermark_dict = {}
+    for result in select_cursor.fetchall():
+        if result[2] is None:
             continue
 
-        # The results from the last call provide me with a key element for the next call - the timeseriesKeys that are being used by the device to send data to the ThingsBoard database. Right now, the device timeseriesKeys are the keys of the
-        # dictionary returned previously, so grab them to a list. Since the only results returned from the last call are the ones with an ontology term associated to them and I'm only interested in these, might as well use the key list returned as
-        # a filter for the timeseries retrieval too
-        device_ts = list(device_attributes.keys())
-
-        # Grab the data produced by the device within the time window established
-        ts_data_dict = tb_telemetry_controller.getTimeseries(
-            device_name=device_record[device_columns.index('name')],
-            start_date=start_date,
-            end_date=end_date,
-            limit=limit,
-            timeseries_keys_filter=device_ts
-        )
-
-        # Create the database update dictionary template
-        device_data_dict = {
-            'ontologyId': None,
-            'timeseriesKey': None,
-            'timestamp': None,
-            'value': None,
-            'deviceName': device_record[device_columns.index('name')],
-            'deviceType': device_record[device_columns.index('type')],
-            'deviceId': device_record[device_columns.index('id')],
-            'tenantId': device_record[device_columns.index('tenantId')],
-            'customerId': device_record[device_columns.index('customerId')]
-        }
-
-        # I'm now ready to send data to the device_data table. Prepare the dictionary with the values to write then
-        for timeseriesKey in ts_data_dict:
-            # At this point I can fulfill the ontologyId and timeseriesKeys for this measurement alone
-            device_data_dict['timeseriesKey'] = timeseriesKey
-            device_data_dict['ontologyId'] = device_attributes[timeseriesKey]
-
-            # Onwards with the actual data then
-            for data_point in ts_data_dict[timeseriesKey]:
-                # Fill out the remaining of the database updater dictionary and write it in the database before going for another record
-                device_data_dict['timestamp'] = mysql_utils.convert_timestamp_tb_to_datetime(timestamp=data_point['ts'])
-
-                # Before dealing with the associated value, take heed that sometimes there are sensors that, either due to malfunction or other reasons, do not produce a valid value, i.e., one that can be directly cast into a float value. When
-                # that happens, the sensor sends back a 'NaN' (Not a Number), which is actually a valid numeric type, so much so that Python is able to cast a 'NaN' string into the rare but valid nan float! Unfortunately the database is not that
-                # flexible too and when a 'nan' goes into a DOUBLE field, nothing good comes out... The best approach in this case is to see if the value that comes back is indeed a 'NaN' and immediately set it as a None, since the mysql-python
-                # connector has no problems in converting these to NULL types when writing to the MySQL database.
-                if data_point['value'] == 'NaN':
-                    # If a NaN' came back, replace it immediately by a None
-                    device_data_dict['value'] = None
-                else:
-                    # Cast the value to float since it is always returned as a string
-                    device_data_dict['value'] = float(data_point['value'])
-
-                # The updater is complete. Write the data into the database
-                database_table_updater.add_table_data(data_dict=device_data_dict, table_name=data_table_name)
-
-        # This is the end of the previous for cycles. Grab another device record and go for another round of the outer while
-        device_record = select_cursor.fetchone()
+        if result[0] not in watermark_dict:
+            watermark_dict[result[0]] = {}
+
+        watermark_dict[result[0]][result[1]] = int(result[2])
+
+    select_cursor.close()
+    cnx.close()
+
+    return watermark_dict
+
+
+def _update_device_watermarks(device_id, ts_data_dict):
+    """
+    This method moves the high-water marks of a device forward, i.e., it sets the lastTimestamp of each device/timeseriesKey pair in the tb_device_watermarks table to the most recent timestamp among the data points provided. Keys without any data
+    points keep their current high-water mark.
+    :param device_id (str) - The id of the device whose high-water marks are to be updated
+    :param ts_data_dict (dict) - The timeseries dictionary, as returned from tb_telemetry_controller.getTimeseries, with the data that was just written into the database
+    :raise mysql_utils.MySQLDatabaseException - If problems occur when accessing the database.
+    """
+    watermark_list = []
+    for timeseries_key in ts_data_dict:
+        if not ts_data_dict[timeseries_key]:
+            continue
+
+        watermark_list.append({
+            'deviceId': device_id,
+            'timeseriesKey': timeseries_key,
+            'lastTimestamp': max([int(data_point['ts']) for data_point in ts_data_dict[timeseries_key]]),
+            'updatedTime': datetime.datetime.now().replace(microsecond=0)
+        })
+
+    if watermark_list:
+        database_table_updater.add_table_data_batch(data_dict_list=watermark_list, table_name=proj_config.mysql_db_tables['device_watermarks'])
+
+
+def _build_device_data_records(device_record, device_columns, device_attributes, ts_data_dict):
+    """
+    This method converts the data returned from a tb_telemetry_controller.getTimeseries call into the list of data dictionaries, one per data point, that the tb_device_data table expects.
+    :param device_record (tuple) - The record of the device, as returned from tb_devices, that produced the data
+    :param device_columns (list of str) - The list of column names of tb_devices, in order, to be able to index the device_record elements
+    :param device_attributes (dict) - The device attributes dictionary, as returned from tb_telemetry_controller.getAttributes, mapping timeseriesKeys to ontology names
+    :param ts_data_dict (dict) - The timeseries dictionary returned from tb_telemetry_controller.getTimeseries
+    :return device_data_list (list of dict) - A list with a data dictionary for each data point in ts_data_dict, with keys matching the tb_device_data columns
+    """
+    device_data_list = []
+
+    for timeseriesKey in ts_data_dict:
+        for data_point in ts_data_dict[timeseriesKey]:
+            # Before dealing with the associated value, take heed that sometimes there are sensors that, either due to malfunction or other reasons, do not produce a valid value, i.e., one that can be directly cast into a float value. When
+            # that happens, the sensor sends back a 'NaN' (Not a Number), which is actually a valid numeric type, so much so that Python is able to cast a 'NaN' string into the rare but valid nan float! Unfortunately the database is not that
+            # flexible too and when a 'nan' goes into a DOUBLE field, nothing good comes out... The best approach in this case is to see if the value that comes back is indeed a 'NaN' and immediately set it as a None, since the mysql-python
+            # connector has no problems in converting these to NULL types when writing to the MySQL database.
+            if data_point['value'] == 'NaN':
+                value = None
+            else:
+                # Cast the value to float since it is always returned as a string
+                value = float(data_point['value'])
+
+            device_data_list.append({
+                'ontologyId': device_attributes[timeseriesKey],
+                'timeseriesKey': timeseriesKey,
+                'timestamp': mysql_utils.convert_timestamp_tb_to_datetime(timestamp=data_point['ts']),
+                'value': value,
+                'deviceName': device_record[device_columns.index('name')],
+                'deviceType': device_record[device_columns.index('type')],
+                'deviceId': device_record[device_columns.index('id')],
+                'tenantId': device_record[device_columns.index('tenantId')],
+                'customerId': device_record[device_columns.index('customerId')]
+            })
+
+    return device_data_list
@@ -5,11 +5,26 @@ import ambi_logger
 import traceback
 import user_config, proj_config
 import mysql.connector as mysqlc
-from mysql.connector.errors import Error
+from mysql.connector import pooling
+from mysql.connector.errors import Error, PoolError
+from mysql.connector.constants import ClientFlag
 import datetime
 import os
+import time
+import threading
+import contextlib
 from ThingsBoard_REST_API import tb_telemetry_controller
 
+# Process-wide cache of the database schema metadata (see the SCHEMA CATALOG methods below): table names, ordered column lists, trigger (unique key) columns and the SQL statements generated from them. All of these are loaded from the
+# database only once per process and kept until invalidate_schema_catalog is called
+_schema_catalog = {'tables': None, 'columns': {}, 'trigger_columns': {}, 'statements': {}}
+_schema_catalog_lock = threading.RLock()
+
+# Process-wide MySQL connection pool used by connect_db (see the CONNECTION POOL methods below). The pool is only created with the first connection request. The 'opened_at' dictionary keeps the time at which each pooled connection was (re)opened,
+# indexed by the id of the connection object, in order to recycle the old ones
+_connection_pool = {'pool': None, 'created_at': None, 'opened_at': {}}
+_connection_pool_lock = threading.Lock()
+
 
 # ---------------------------------------------- DATABASE RELATED CUSTOM EXCEPTION ----------------------------------------------------------------------------------------------------------------------------------------------------
 class MySQLDatabaseException(Exception):
@@ -54,7 +69,8 @@ def connect_db(database_name):
     :param database_name: (str) The name of the database to connect to.
     :raise util.InputValidationException: If the input arguments provided are invalid
     :raise Exception: For any other occurring errors
-    :return cnx: (mysql.connector.connection.MySQLConnection) An active connection to the database"""
+    :return cnx: (mysql.connector.connection.MySQLConnection) An active connection to the database. If the connection pool is enabled (proj_config.mysql_pool_enabled), this is a mysql.connector.pooling.PooledMySQLConnection instead, which
+    behaves exactly as a regular connection except that its close() method returns it to the pool"""
     connect_log = ambi_logger.get_logger(__name__)
 
     try:
@@ -68,11 +84,18 @@ def connect_db(database_name):
         connect_log.error(error_msg)
         raise ke
 
+    # Borrow the connection from the pool if it is enabled. Closing it returns it to the pool, so the callers don't need to do anything differently
+    if proj_config.mysql_pool_enabled:
+        return _checkout_pooled_connection(connection_dict=connection_dict)
+
     try:
+        # NOTE: The FOUND_ROWS client flag is explicitly switched off. Every INSERT/UPDATE outcome analysis in this project relies on cursor.rowcount reporting the number of rows actually changed (0 for an UPDATE that matched an identical record,
+        # 2 for an INSERT ... ON DUPLICATE KEY UPDATE that modified an existing one) rather than the number of rows matched
         cnx = mysqlc.connect(user=connection_dict['username'],
                              password=connection_dict['password'],
                              host=connection_dict['host'],
-                             database=connection_dict['database'])
+                             database=connection_dict['database'],
+                             client_flags=[-ClientFlag.FOUND_ROWS])
     except Error as err:
         connect_log.error(err.msg)
         # Catch any errors under a generic 'Error' exception and pass it upwards under a more specific MySQLDatabaseException
@@ -88,7 +111,164 @@ def connect_db(database_name):
         raise MySQLDatabaseException(message=error_msg)
 
 
+@contextlib.contextmanager
+def db_connection(database_name=None):
+    """
+    Context manager version of connect_db, to check out a single connection for a whole unit of work and to make sure that it is always given back, regardless of how that unit of work ends. Any transaction left open by an exception is rolled back
+    before the connection is closed (returned to the pool). Committing is still up to the caller. Use it as:
+        with mysql_utils.db_connection() as cnx:
+            cursor = cnx.cursor(buffered=True)
+            ...
+    :param database_name: (str) The name of the database to connect to. The default database from user_config is used if omitted
+    :raise utils.InputValidationException: If the input arguments provided are invalid
+    :raise MySQLDatabaseException: If unable to get a connection to the database
+    :yield cnx: (mysql.connector.connection.MySQLConnection) An active connection to the database
+    """
+    if database_name is None:
+        database_name = user_config.access_info['mysql_database']['database']
+
+    cnx = connect_db(database_name=database_name)
+
+    try:
+        yield cnx
+    except Exception:
+        try:
+            cnx.rollback()
+        except Error:
+            # The connection is probably gone if the rollback failed too. Either way, the original exception is the one that matters
+            pass
+        raise
+    finally:
+        cnx.close()
+
+
+# ---------------------------------------------- CONNECTION POOL ----------------------------------------------------------------------------------------------------------------------------------------------------
+def _get_connection_pool(connection_dict):
+    """
+    This method returns the process-wide connection pool, creating it first if this is the first time it is requested. The pool is created with proj_config.mysql_pool_size connections and the same connection settings (including the client flags)
+    used by connect_db for its non-pooled connections.
+    :param connection_dict: (dict) The MySQL database access dictionary from user_config
+    :raise MySQLDatabaseException: If the pool cannot be created
+    :return connection_pool: (mysql.connector.pooling.MySQLConnectionPool) The connection pool
+    """
+    log = ambi_logger.get_logger(__name__)
+
+    if _connection_pool['pool'] is not None:
+        return _connection_pool['pool']
+
+    with _connection_pool_lock:
+        # Check again: some other thread may have created the pool while this one was waiting for the lock
+        if _connection_pool['pool'] is None:
+            try:
+                _connection_pool['pool'] = pooling.MySQLConnectionPool(pool_name=proj_config.mysql_pool_name,
+                                                                       pool_size=proj_config.mysql_pool_size,
+                                                                       pool_reset_session=True,
+                                                                       user=connection_dict['username'],
+                                                                       password=connection_dict['password'],
+                                                                       host=connection_dict['host'],
+                                                                       database=connection_dict['database'],
+                                                                       client_flags=[-ClientFlag.FOUND_ROWS])
+            except Error as err:
+                log.error(err.msg)
+                raise MySQLDatabaseException(message=err.msg, error_code=err.errno, sqlstate=err.sqlstate)
+
+            _connection_pool['created_at'] = time.time()
+            _connection_pool['opened_at'] = {}
+
+            log.info("Created the MySQL connection pool '{0}' with {1} connections.".format(str(proj_config.mysql_pool_name), str(proj_config.mysql_pool_size)))
+
+    return _connection_pool['pool']
+
+
+def _checkout_pooled_connection(connection_dict):
+    """
+    This method borrows a connection from the connection pool. mysql.connector checks that the connection is still alive (and reconnects it if not) when handing it out. If the pool is exhausted or that reconnection fails, this method waits a bit
+    and tries again, until proj_config.mysql_pool_checkout_timeout seconds have elapsed. Connections older than proj_config.mysql_pool_recycle seconds are re-opened before being returned.
+    :param connection_dict: (dict) The MySQL database access dictionary from user_config
+    :raise MySQLDatabaseException: If no connection could be obtained from the pool within the checkout timeout
+    :return cnx: (mysql.connector.pooling.PooledMySQLConnection) An active connection to the database
+    """
+    log = ambi_logger.get_logger(__name__)
+
+    connection_pool = _get_connection_pool(connection_dict=connection_dict)
+    checkout_deadline = time.time() + proj_config.mysql_pool_checkout_timeout
+
+    while True:
+        try:
+            cnx = connection_pool.get_connection()
+            break
+        except PoolError as pe:
+            # The pool is exhausted. Wait for some other thread to give a connection back
+            last_error = pe
+        except Error as err:
+            # The pooled connection was dead and could not be reconnected. It went back to the pool anyway, so it is retried later
+            log.warning("Unable to reconnect a pooled MySQL connection: {0}. Retrying...".format(str(err.msg)))
+            last_error = err
+
+        if time.time() >= checkout_deadline:
+            error_msg = "Unable to get a connection from the '{0}' pool after {1} seconds: {2}".format(str(proj_config.mysql_pool_name), str(proj_config.mysql_pool_checkout_timeout), str(last_error.msg))
+            log.error(error_msg)
+            raise MySQLDatabaseException(message=error_msg, error_code=last_error.errno, sqlstate=last_error.sqlstate)
+
+        time.sleep(proj_config.mysql_pool_retry_delay)
+
+    if proj_config.mysql_pool_recycle is not None:
+        _recycle_pooled_connection(cnx=cnx)
+
+    return cnx
+
+
+def _recycle_pooled_connection(cnx):
+    """
+    This method re-opens a pooled connection if it was opened more than proj_config.mysql_pool_recycle seconds ago. Connections that were never recycled are assumed to be as old as the pool itself.
+    :param cnx: (mysql.connector.pooling.PooledMySQLConnection) A connection just borrowed from the pool
+    :raise MySQLDatabaseException: If the connection cannot be re-opened. The connection is returned to the pool in this case
+    """
+    log = ambi_logger.get_logger(__name__)
+
+    # The pooled connection is a thin wrapper around the actual connection object, which is the one that stays in the pool
+    pooled_cnx = cnx._cnx
+    current_time = time.time()
+
+    with _connection_pool_lock:
+        opened_at = _connection_pool['opened_at'].get(id(pooled_cnx), _connection_pool['created_at'])
+
+    if current_time - opened_at < proj_config.mysql_pool_recycle:
+        return
+
+    try:
+        pooled_cnx.reconnect(attempts=proj_config.mysql_pool_reconnect_attempts, delay=1)
+    except Error as err:
+        log.error("Unable to recycle a pooled MySQL connection: {0}".format(str(err.msg)))
+        cnx.close()
+        raise MySQLDatabaseException(message=err.msg, error_code=err.errno, sqlstate=err.sqlstate)
+
+    with _connection_pool_lock:
+        _connection_pool['opened_at'][id(pooled_cnx)] = current_time
+
+
 def get_table_columns(database_name, table_name):
+    """This method returns the names of the columns in a given table, in order. This is particular useful for building INSERT and UPDATE statements that require a specification of these elements on the statements. The column list is only retrieved
+    from the database the first time that it is requested: after that it comes from the schema catalog
+    :param database_name: (str) The name of the database to connect to
+    :param table_name: (str) The name of the table from the database to connect to
+    :raise utils.InputValidationException: If any of the inputs is not valid
+    :raise MySQLDatabaseException: For database related exceptions
+    :return column_list: (list of str) A list with all the names of the columns, in order, extracted from the database.table_name. This is a copy of the cached list, so the caller is free to change it
+    """
+    utils.validate_input_type(database_name, str)
+    utils.validate_input_type(table_name, str)
+
+    catalog_key = (database_name, table_name)
+
+    with _schema_catalog_lock:
+        if catalog_key not in _schema_catalog['columns']:
+            _schema_catalog['columns'][catalog_key] = _load_table_columns(database_name=database_name, table_name=table_name)
+
+        return list(_schema_catalog['columns'][catalog_key])
+
+
+def _load_table_columns(database_name, table_name):
     """This method does a simple SELECT query to the database for just the columns names in a given table. This is particular useful for building INSERT and UPDATE statements that require a specification of these elements on the statements
     :param database_name: (str) The name of the database to connect to
     :param table_name: (str) The name of the table from the database to connect to
@@ -103,15 +283,16 @@ def get_table_columns(database_name, table_name):
         utils.validate_input_type(database_name, str)
         utils.validate_input_type(table_name, str)
 
-        cnx = connect_db(database_name=database_name)
-        select_cursor = cnx.cursor(buffered=True)
+        with db_connection(database_name=database_name) as cnx:
+            select_cursor = cnx.cursor(buffered=True)
 
-        sql_select = """SHOW COLUMNS FROM """ + str(table_name) + """;"""
-        select_cursor.execute(sql_select)
-        # Executing a SQL statement using the cursor object yields all sorts of useful information. For this particular case I'm interested in the cursor.column_names parameter, which is a n member tuple, n = number of columns in the
-        # table targeted by the statement, in which each tuple element is the name of the column in position i. From there is just a matter of casting that parameter into a list (its a direct operation and, overall,
-        # I find lists way more friendly to operate than tuples, but that's subjective) and return it back to the caller
-        result_list = list(select_cursor.fetchall())
+            sql_select = """SHOW COLUMNS FROM """ + str(table_name) + """;"""
+            select_cursor.execute(sql_select)
+            # Executing a SQL statement using the cursor object yields all sorts of useful information. For this particular case I'm interested in the cursor.column_names parameter, which is a n member tuple, n = number of columns in the
+            # table targeted by the statement, in which each tuple element is the name of the column in position i. From there is just a matter of casting that parameter into a list (its a direct operation and, overall,
+            # I find lists way more friendly to operate than tuples, but that's subjective) and return it back to the caller
+            result_list = list(select_cursor.fetchall())
+            select_cursor.close()
 
         # The result list is a list of tuples containing the following details: (column_name, data_type, accepts_NULL_values, default_value). Obviously I'm only interested in the column names. So retrieve all the index 0 elements of the tuple list
         # to the return list
@@ -208,6 +389,82 @@ def create_insert_sql_statement(column_list, table_name):
     return sql_insert
 
 
+def create_upsert_sql_statement(column_list, table_name, trigger_column_list, row_count=1):
+    """
+    Method to automatize the building of INSERT ... ON DUPLICATE KEY UPDATE statements, i.e., statements that either add a new record or update the existing one in a single go, without the usual INSERT -> 'Duplicate entry' -> UPDATE dance:
+    INSERT INTO table_name (column_list) VALUES (%s, ..., %s), ..., (%s, ..., %s) ON DUPLICATE KEY UPDATE column = VALUES(column), ...;
+    The statement can carry more than one record at once (row_count sets how many groups of '%s' are to be written in the VALUES part), which means that the data tuple to provide when executing it has to have all the records values flattened
+    and in the same order as the column_list. Only the columns that are not part of the unique key (the trigger columns) are set in the UPDATE part: those ones are the ones that detected the duplicate in the first place, so they are the same
+    by definition.
+    NOTE: The cursor.rowcount after executing one of these statements is the sum of 1 for each new record inserted, 2 for each existing record that was updated and 0 for each existing record that was already identical to the one provided
+    (as long as the FOUND_ROWS client flag is off, which is how connect_db sets up its connections)
+    :param column_list: (list of str) A list with the names of the MySQL database columns
+    :param table_name: (str) The name of the table where the statement is going to take effect
+    :param trigger_column_list: (list of str) The columns that make up the unique key of the table (as returned by get_trigger_columns)
+    :param row_count: (int) The number of records that the statement is going to write at once. Defaults to a single record
+    :return sql_upsert: (str) The statement string to be executed with '%s' instead of actual values.
+    :raise utils.InputValidationException: If any errors occur during the input validation
+    """
+    utils.validate_input_type(column_list, list)
+    for column_name in column_list:
+        utils.validate_input_type(column_name, str)
+
+    utils.validate_input_type(table_name, str)
+
+    utils.validate_input_type(trigger_column_list, list)
+    for trigger_column_name in trigger_column_list:
+        utils.validate_input_type(trigger_column_name, str)
+
+        if trigger_column_name not in column_list:
+            error_msg = "The trigger column provided: {0} does not exist among the list of columns for {1}.{2}" \
+                .format(str(trigger_column_name), str(user_config.access_info['mysql_database']['database']), str(table_name))
+            raise utils.InputValidationException(message=error_msg)
+
+    utils.validate_input_type(row_count, int)
+
+    if row_count <= 0:
+        raise utils.InputValidationException(message="Invalid row count provided: {0}. Please provide a greater than zero number of records to write.".format(str(row_count)))
+
+    # Build a single group of '%s' first and repeat it as many times as the number of records to write
+    values_group = """(""" + """, """.join(['%s'] * len(column_list)) + """)"""
+
+    sql_upsert = """INSERT INTO """ + str(table_name) + """ ("""
+    sql_upsert += """,""".join(column_list)
+    sql_upsert += """) VALUES """
+    sql_upsert += """, """.join([values_group] * row_count)
+
+    # The UPDATE part only needs the non-key columns. If, for some reason, all the columns are part of the unique key, there's nothing to update and the (silly) 'column = column' assignment turns the duplicate into a no-op
+    update_column_list = [column_name for column_name in column_list if column_name not in trigger_column_list]
+
+    if update_column_list:
+        sql_upsert += """ ON DUPLICATE KEY UPDATE """ + """, """.join([str(column_name) + """ = VALUES(""" + str(column_name) + """)""" for column_name in update_column_list])
+    else:
+        sql_upsert += """ ON DUPLICATE KEY UPDATE """ + str(column_list[0]) + """ = """ + str(column_list[0])
+
+    sql_upsert += """;"""
+
+    # Done. Send it back for execution
+    return sql_upsert
+
+
+def classify_upsert_outcome(rowcount):
+    """
+    Simple method to translate the affected-rows count of a single record INSERT ... ON DUPLICATE KEY UPDATE execution (see create_upsert_sql_statement) into what actually happened to that record in the database.
+    :param rowcount: (int) The cursor.rowcount after executing the single record upsert statement
+    :raise utils.InputValidationException: If the input fails initial validation
+    :raise MySQLDatabaseException: If the row count doesn't match any of the outcomes possible for a single record upsert
+    :return outcome: (str) 'inserted' if the record was added (rowcount = 1), 'updated' if an existing record was modified (rowcount = 2) or 'unchanged' if the existing record was already identical to the one provided (rowcount = 0)
+    """
+    utils.validate_input_type(rowcount, int)
+
+    upsert_outcomes = {0: 'unchanged', 1: 'inserted', 2: 'updated'}
+
+    try:
+        return upsert_outcomes[rowcount]
+    except KeyError:
+        raise MySQLDatabaseException(message="A single record upsert reported {0} affected rows. Only 0, 1 or 2 were expected. Please check the data integrity of the table involved.".format(str(rowcount)))
+
+
 def create_delete_sql_statement(table_name, trigger_column_list):
     """
     Method to automatize the building of SQL DELETE statements. These are generally simpler than UPDATE or INSERT ones
@@ -240,6 +497,24 @@ def create_delete_sql_statement(table_name, trigger_column_list):
 
 
 def get_trigger_columns(table_name):
+    """
+    This method returns the names of the columns used in the provided table to establish its primary key/unique constraint. The list is only retrieved from the database the first time that it is requested: after that it comes from the schema
+    catalog (see _load_trigger_columns for the details).
+    :param table_name (str) - The name of the database table whose list of trigger columns needs to be returned.
+    :raise utils.InputValidationException - If the input provided fails initial validation.
+    :raise MySQLDatabaseException - For any issue detected regarding the access to the database or if the table has no primary key columns.
+    :return trigger_column_list (list of str) - A list with the names of the columns configured as primary key in the provided database table. This is a copy of the cached list, so the caller is free to change it
+    """
+    utils.validate_input_type(table_name, str)
+
+    with _schema_catalog_lock:
+        if table_name not in _schema_catalog['trigger_columns']:
+            _schema_catalog['trigger_columns'][table_name] = _load_trigger_columns(table_name=table_name)
+
+        return list(_schema_catalog['trigger_columns'][table_name])
+
+
+def _load_trigger_columns(table_name):
     """
     This method checks a table for its associated information schema  to determine the columns that were used in that same table to establish the primary key. This is particularly useful to construct UPDATE statements as a response from a
     triggered 'Duplicate entry' Exception, since its the violation of the primary key rule that triggers this Exception in the first place.
@@ -381,54 +656,20 @@ def run_sql_statement(cursor, sql_statement, data_tuple=()):
 
 
 def validate_database_table_name(table_name):
-    """This simple method receives a name of a table and validates it by executing a SQL statement in the default database to retrieve all of its tables and then checks if the table name in the input does match any of the returned values.
+    """This simple method receives a name of a table and validates it by checking if the table name in the input does match any of the tables in the default database (as listed by the schema catalog).
     :param table_name: (str) The name of the database table whose existence is to be verified
     :raise utils.InputValidationException: If the inputs fail initial validation
     :raise MySQLDatabaseException: If any error occur while executing database bounded operations or if the table name was not found among the list of database tables retrieved
     :return True: (bool) If table_name is among the database tables list"""
 
-    validate_db_table_log = ambi_logger.get_logger(__name__)
-
     # Validate the input
     utils.validate_input_type(table_name, str)
 
-    # Get the default database name
-    database_name = user_config.mysql_db_access['database']
-    # Create the database interface elements
-    cnx = connect_db(database_name=database_name)
-    select_cursor = cnx.cursor(buffered=True)
+    if table_exists(table_name=table_name):
+        return True
 
-    # Prepare the SQL statement
-    sql_select = """SHOW TABLES FROM """ + str(database_name) + """;"""
-
-    # And execute it
-    select_cursor = run_sql_statement(select_cursor, sql_select, ())
-
-    # Check the data integrity first
-    if not select_cursor.rowcount:
-        error_msg = "The SQL statement '{0}' didn't return any results! Exiting...".format(str(select_cursor.statement))
-        validate_db_table_log.error(error_msg)
-        select_cursor.close()
-        cnx.close()
-        raise MySQLDatabaseException(message=error_msg)
-    # If results were gotten
-    else:
-        # Grab the first one
-        result = select_cursor.fetchone()
-
-        # And run the next loop until all results were checked (result would be set to None once all the data retrieved from the database is exhausted)
-        while result:
-            # If a match is found
-            if result[0] == table_name:
-                # Return the response immediately
-                return True
-            # Otherwise
-            else:
-                # Grab the next one and run another iteration of this
-                result = select_cursor.fetchone()
-
-        # If I got here it means none of the results matched the table_name provided. Nothing more to do than to inform that the table name is not valid
-        raise MySQLDatabaseException(message="The table provided '{0}' is not among the current database tables!".format(str(table_name)))
+    # If I got here it means none of the database tables matched the table_name provided. Nothing more to do than to inform that the table name is not valid
+    raise MySQLDatabaseException(message="The table provided '{0}' is not among the current database tables!".format(str(table_name)))
 
 
 def create_device_database_table(device_name, execute_script=True):
@@ -508,6 +749,9 @@ def create_device_database_table(device_name, execute_script=True):
             str(user_config.access_info['mysql_database']['password']),
             str(sql_script_path)))
 
+        # The database has a new table now. Make sure the schema catalog picks it up
+        invalidate_schema_catalog(table_name=table_to_create)
+
         # Done. Inform the user of the success of this operation and return the name of the database table just created
         log.info("Created the table {0} in {1} database successfully!".format(str(table_to_create), str(database_name)))
 
@@ -530,43 +774,15 @@ def get_official_device_table_name(device_name):
 
 def validate_table_name(table_name):
     """
-    This method receives the name of a database table and checks the database for its existence. That's it.
+    This method receives the name of a database table and checks the database (through the schema catalog) for its existence. That's it.
     :param table_name: (str) The name of the table whose existence is to be verified in the database
     :return exists: (bool) True if the table is already created in the database, False otherwise
     :raise utils.InputValidationException: If the input fails initial validation
     :raise MySQLDatabaseException: If errors occur during the database accesses
     """
-    log = ambi_logger.get_logger(__name__)
     utils.validate_input_type(table_name, str)
 
-    # Need to access the database. Create the usual objects
-    database_name = user_config.access_info['mysql_database']['database']
-    cnx = connect_db(database_name=database_name)
-    select_cursor = cnx.cursor(buffered=True)
-
-    sql_select = """SHOW TABLES FROM """ + database_name + """;"""
-
-    select_cursor = run_sql_statement(cursor=select_cursor, sql_statement=sql_select, data_tuple=())
-
-    if select_cursor.rowcount is 0:
-        log.warning("The current database ({0}) has no tables configured yet!".format(str(database_name)))
-        select_cursor.close()
-        cnx.close()
-        return False
-
-    else:
-        results = select_cursor.fetchall()
-
-        for i in range(0, len(results)):
-            if table_name == results[i][0]:
-                select_cursor.close()
-                cnx.close()
-                return True
-
-        # If the code reached this point, then I've verified all existing tables currently in the database and didn't find any matches
-        select_cursor.close()
-        cnx.close()
-        return False
+    return table_exists(table_name=table_name)
 
 
 def reset_table(table_name):
@@ -693,7 +909,7 @@ def reset_table(table_name):
         cnx.close()
 
 
-def add_data_to_table(table_name, data_dict):
+def add_data_to_table(table_name, data_dict, upsert=False):
     """
     This method effectively abstracts the usual INSERT/UPDATE SQL operation sequence, very usual in any database supported operations. The logic behind it is quite simple: the method receives the name of a database table and a dictionary with data to
     insert/update in the aforementioned table. As such, it is expected that the keys in this dictionary match exactly the column names under which the data (values) is to be inserted under. A simple match operation is performed at the head of it
@@ -701,16 +917,21 @@ def add_data_to_table(table_name, data_dict):
     table column. Once this is cleared, the method tries to perform an INSERT with the data while looking after 'Duplicate entry' MySQLDatabaseException. If one of these gets captured, the method defaults to an UPDATE execution instead,
     using the same data provided. If the UPDATE operation also returns a 'Duplicate entry' exception, than the whole operation becomes moot since the data already exists u«in the supplied form in the database. A warning is issued and the method
     simply finishes without making any database modifications whatsoever.
+    In upsert mode, the INSERT/UPDATE sequence is replaced by a single INSERT ... ON DUPLICATE KEY UPDATE execution (built from the table's trigger columns), i.e., one round trip and no exceptions regardless of the record being new or not.
+    What happened to the record is inferred from the affected rows count of that execution instead (see classify_upsert_outcome). Use this mode for re-syncs, where most of the records already exist.
     :param table_name: (str) The name of the database table for where the data in the provided dictionary needs to be written to
     :param data_dict: (dict) A dictionary with the data to be written into the database.
+    :param upsert: (bool) Set this flag to write the record with a single upsert statement instead
     :raise utils.InputValidationException: If any of the inputs fails initial validation
     :raise db_methods.MySQLDatabaseException: If any errors occur when accessing the database.
+    :return result: (bool or str) In the default mode, True if the record was added or updated and False if it already existed. In upsert mode, 'inserted', 'updated' or 'unchanged' instead
     """
     log = ambi_logger.get_logger(__name__)
 
     # Validate inputs and check the database dictionary's integrity
     validate_database_table_name(table_name=table_name)
     utils.validate_input_type(data_dict, dict)
+    utils.validate_input_type(upsert, bool)
 
     database_name = user_config.access_info['mysql_database']['database']
     column_list = get_table_columns(database_name=database_name, table_name=table_name)
@@ -740,9 +961,33 @@ def add_data_to_table(table_name, data_dict):
             # If a missing column name is detected among the dictionary elements provided, put a NULL element into it instead
             data_list.append(None)
 
+    if upsert:
+        # Single statement mode. Whatever happens to the record, it happens in this one execution
+        sql_upsert = get_sql_statement(table_name=table_name, statement_type='upsert')
+
+        try:
+            change_cursor = run_sql_statement(cursor=change_cursor, sql_statement=sql_upsert, data_tuple=tuple(data_list))
+            outcome = classify_upsert_outcome(rowcount=change_cursor.rowcount)
+        except MySQLDatabaseException as mse:
+            log.error("Unable to execute SQL statement:\n{0}\nin {1}.{2}. Got this Exception instead:".format(str(change_cursor.statement), str(database_name), str(table_name)))
+            change_cursor.close()
+            cnx.close()
+            raise mse
+
+        cnx.commit()
+        change_cursor.close()
+        cnx.close()
+
+        if outcome == 'unchanged':
+            log.debug("{0}.{1} already has a record with data:\n{2}\nNothing more to do then...".format(str(database_name), str(table_name), str(data_dict)))
+        else:
+            log.info("Record {0} in {1}.{2} successfully!".format(outcome, str(database_name), str(table_name)))
+
+        return outcome
+
     # All good. Lets try an INSERT then
 
-    sql_insert = create_insert_sql_statement(column_list=column_list, table_name=table_name)
+    sql_insert = get_sql_statement(table_name=table_name, statement_type='insert')
 
     # Run it and check for duplicate entries then
     try:
@@ -784,7 +1029,7 @@ def add_data_to_table(table_name, data_dict):
             trigger_column_list = get_trigger_columns(table_name=table_name)
 
             # Create and execute the UPDATE statement now that everything's ready
-            sql_update = create_update_sql_statement(column_list=column_list, table_name=table_name, trigger_column_list=trigger_column_list)
+            sql_update = get_sql_statement(table_name=table_name, statement_type='update')
 
             # Before executing this statement, append the necessary trigger values to the existing list of values, using the same logic as before
             for trigger_column in trigger_column_list:
@@ -852,4 +1097,114 @@ def add_data_to_table(table_name, data_dict):
             ))
             change_cursor.close()
             cnx.close()
-            raise mse
\ No newline at end of file
+            raise mse
+
+
+# ---------------------------------------------- SCHEMA CATALOG ----------------------------------------------------------------------------------------------------------------------------------------------------
+def table_exists(table_name):
+    """
+    This method checks if a table exists in the default database, using the list of tables in the schema catalog. The list is loaded from the database the first time it is needed and, since tables can be created by external means (SQL scripts,
+    for instance), it is also reloaded whenever a table is not found in it. This means that only the first check and the 'not found' ones hit the database.
+    :param table_name: (str) The name of the table whose existence is to be verified
+    :raise utils.InputValidationException: If the input fails initial validation
+    :raise MySQLDatabaseException: If errors occur during the database accesses
+    :return exists: (bool) True if the table exists in the database, False otherwise
+    """
+    utils.validate_input_type(table_name, str)
+
+    with _schema_catalog_lock:
+        if _schema_catalog['tables'] is not None and table_name in _schema_catalog['tables']:
+            return True
+
+        _schema_catalog['tables'] = _load_table_names()
+
+        return table_name in _schema_catalog['tables']
+
+
+def get_sql_statement(table_name, statement_type, row_count=1):
+    """
+    This method returns the standard SQL statements for the table provided, built with the create_*_sql_statement methods from the table's columns (and trigger columns, where needed). Each statement is only built once: after that it comes from
+    the schema catalog, so getting one of these requires no database accesses at all after the first time.
+    :param table_name: (str) The name of the table for which the statement is to be returned
+    :param statement_type: (str) One of 'insert', 'update' (with the trigger columns as the WHERE condition) or 'upsert' (INSERT ... ON DUPLICATE KEY UPDATE ...)
+    :param row_count: (int) For 'upsert' statements only: the number of records that the statement writes at once
+    :raise utils.InputValidationException: If any of the inputs fails initial validation
+    :raise MySQLDatabaseException: If errors occur during the database accesses
+    :return sql_statement: (str) The statement string to be executed with '%s' instead of actual values.
+    """
+    utils.validate_input_type(table_name, str)
+    utils.validate_input_type(statement_type, str)
+    utils.validate_input_type(row_count, int)
+
+    valid_statement_types = ['insert', 'update', 'upsert']
+    if statement_type not in valid_statement_types:
+        raise utils.InputValidationException(message="Invalid statement type provided: '{0}'. Please provide one of these: {1}".format(str(statement_type), str(valid_statement_types)))
+
+    # The row count only matters for upserts
+    if statement_type != 'upsert':
+        row_count = 1
+
+    catalog_key = (table_name, statement_type, row_count)
+
+    with _schema_catalog_lock:
+        if catalog_key not in _schema_catalog['statements']:
+            database_name = user_config.access_info['mysql_database']['database']
+            column_list = get_table_columns(database_name=database_name, table_name=table_name)
+
+            if statement_type == 'insert':
+                sql_statement = create_insert_sql_statement(column_list=column_list, table_name=table_name)
+            elif statement_type == 'update':
+                sql_statement = create_update_sql_statement(column_list=column_list, table_name=table_name, trigger_column_list=get_trigger_columns(table_name=table_name))
+            else:
+                sql_statement = create_upsert_sql_statement(column_list=column_list, table_name=table_name, trigger_column_list=get_trigger_columns(table_name=table_name), row_count=row_count)
+
+            _schema_catalog['statements'][catalog_key] = sql_statement
+
+        return _schema_catalog['statements'][catalog_key]
+
+
+def invalidate_schema_catalog(table_name=None):
+    """
+    Use this method to drop cached schema metadata whenever the database schema changes (new tables, altered columns or keys, etc.), so that the next requests load it fresh from the database. Call it from any method or script that creates or
+    alters database tables.
+    :param table_name: (str) The name of the table whose metadata is to be dropped. The whole catalog is dropped if this one is omitted. In either case the list of database tables is also reloaded on the next request
+    :raise utils.InputValidationException: If the input fails initial validation
+    """
+    with _schema_catalog_lock:
+        _schema_catalog['tables'] = None
+
+        if table_name is None:
+            _schema_catalog['columns'] = {}
+            _schema_catalog['trigger_columns'] = {}
+            _schema_catalog['statements'] = {}
+        else:
+            utils.validate_input_type(table_name, str)
+
+            for catalog_key in [catalog_key for catalog_key in _schema_catalog['columns'] if catalog_key[1] == table_name]:
+                _schema_catalog['columns'].pop(catalog_key)
+
+            _schema_catalog['trigger_columns'].pop(table_name, None)
+
+            for catalog_key in [catalog_key for catalog_key in _schema_catalog['statements'] if catalog_key[0] == table_name]:
+                _schema_catalog['statements'].pop(catalog_key)
+
+
+def _load_table_names():
+    """
+    Simple method to retrieve the names of all the tables in the default database.
+    :raise MySQLDatabaseException: If errors occur during the database accesses
+    :return table_name_set: (set of str) The names of the database tables
+    """
+    database_name = user_config.access_info['mysql_database']['database']
+
+    with db_connection(database_name=database_name) as cnx:
+        select_cursor = cnx.cursor(buffered=True)
+
+        sql_select = """SHOW TABLES FROM """ + str(database_name) + """;"""
+        select_cursor = run_sql_statement(cursor=select_cursor, sql_statement=sql_select, data_tuple=())
+
+        table_name_set = set([result[0] for result in select_cursor.fetchall()])
+
+        select_cursor.close()
+
+    return table_name_set
@@ -0,0 +1,7 @@
+/*
+Migration for existing tb_device_data tables (the create script already includes this index). Adds a covering index for the environmental data queries from mysql_asset_controller.get_asset_env_data, which filter on ontologyId and deviceId
+and on a timestamp range and only read the value column. With all four columns in the index, these queries are answered from the index alone, without touching the table rows.
+The index is built in place, without locking the table for writes, so the data collection can keep running while it is created.
+*/
+CREATE INDEX tb_device_data_env_idx ON ambiosensing_thingsboard.tb_device_data (ontologyId, deviceId, timestamp, value) ALGORITHM = INPLACE LOCK = NONE;
+COMMIT;
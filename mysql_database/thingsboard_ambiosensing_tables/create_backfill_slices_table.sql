@@ -0,0 +1,14 @@
+DROP TABLE IF EXISTS ambiosensing_thingsboard.tb_backfill_slices;
+
+CREATE TABLE IF NOT EXISTS ambiosensing_thingsboard.tb_backfill_slices(
+    deviceId                    VARCHAR(100)    DEFAULT NULL NULL,
+    deviceName                  VARCHAR(150)    DEFAULT NULL NULL,
+    sliceStart                  DATETIME        DEFAULT NULL NULL,  -- Start of the time slice retrieved from the ThingsBoard remote API
+    sliceEnd                    DATETIME        DEFAULT NULL NULL,  -- And its end
+    status                      VARCHAR(20)     DEFAULT NULL NULL,  -- Either 'completed' or 'failed'
+    rowsWritten                 INT             DEFAULT 0 NULL,     -- Number of data points written into tb_device_data from this slice
+    completedTime               DATETIME        DEFAULT NULL NULL,
+    CONSTRAINT tb_backfill_slices_pk UNIQUE (deviceId, sliceStart, sliceEnd)
+)
+COMMENT 'Progress log for the historical data backfills (mysql_telemetry_controller.backfill_device_data). Each record flags a device/time slice pair as done (or not), so that an interrupted backfill resumes from where it stopped';
+COMMIT;
@@ -0,0 +1,54 @@
+DROP TABLE IF EXISTS ambiosensing_thingsboard.tb_device_data_rollup_1m;
+DROP TABLE IF EXISTS ambiosensing_thingsboard.tb_device_data_rollup_1h;
+DROP TABLE IF EXISTS ambiosensing_thingsboard.tb_device_data_rollup_1d;
+
+CREATE TABLE IF NOT EXISTS ambiosensing_thingsboard.tb_device_data_rollup_1m(
+    ontologyId                  VARCHAR(100)    DEFAULT NULL NULL,
+    deviceId                    VARCHAR(100)    DEFAULT NULL NULL,
+    bucketStart                 DATETIME        DEFAULT NULL NULL,  -- Start of the minute aggregated in this record
+    valueCount                  BIGINT          DEFAULT 0 NULL,     -- Number of non NULL values in the bucket
+    valueSum                    DOUBLE          DEFAULT NULL NULL,
+    valueMin                    DOUBLE          DEFAULT NULL NULL,
+    valueMax                    DOUBLE          DEFAULT NULL NULL,
+    lastValue                   DOUBLE          DEFAULT NULL NULL,  -- Most recent non NULL value in the bucket
+    lastTimestamp               DATETIME        DEFAULT NULL NULL,  -- Timestamp of lastValue
+    updatedTime                 DATETIME        DEFAULT NULL NULL,
+    CONSTRAINT tb_device_data_rollup_1m_pk UNIQUE (ontologyId, deviceId, bucketStart)
+)
+COMMENT 'Per minute aggregates of tb_device_data, per device and ontologyId. Maintained by mysql_rollup_manager';
+
+CREATE TABLE IF NOT EXISTS ambiosensing_thingsboard.tb_device_data_rollup_1h(
+    ontologyId                  VARCHAR(100)    DEFAULT NULL NULL,
+    deviceId                    VARCHAR(100)    DEFAULT NULL NULL,
+    bucketStart                 DATETIME        DEFAULT NULL NULL,  -- Start of the hour aggregated in this record
+    valueCount                  BIGINT          DEFAULT 0 NULL,
+    valueSum                    DOUBLE          DEFAULT NULL NULL,
+    valueMin                    DOUBLE          DEFAULT NULL NULL,
+    valueMax                    DOUBLE          DEFAULT NULL NULL,
+    lastValue                   DOUBLE          DEFAULT NULL NULL,
+    lastTimestamp               DATETIME        DEFAULT NULL NULL,
+    updatedTime                 DATETIME        DEFAULT NULL NULL,
+    CONSTRAINT tb_device_data_rollup_1h_pk UNIQUE (ontologyId, deviceId, bucketStart)
+)
+COMMENT 'Per hour aggregates of tb_device_data, per device and ontologyId, computed from tb_device_data_rollup_1m. Maintained by mysql_rollup_manager';
+
+CREATE TABLE IF NOT EXISTS ambiosensing_thingsboard.tb_device_data_rollup_1d(
+    ontologyId                  VARCHAR(100)    DEFAULT NULL NULL,
+    deviceId                    VARCHAR(100)    DEFAULT NULL NULL,
+    bucketStart                 DATETIME        DEFAULT NULL NULL,  -- Start (midnight) of the day aggregated in this record
+    valueCount                  BIGINT          DEFAULT 0 NULL,
+    valueSum                    DOUBLE          DEFAULT NULL NULL,
+    valueMin                    DOUBLE          DEFAULT NULL NULL,
+    valueMax                    DOUBLE          DEFAULT NULL NULL,
+    lastValue                   DOUBLE          DEFAULT NULL NULL,
+    lastTimestamp               DATETIME        DEFAULT NULL NULL,
+    updatedTime                 DATETIME        DEFAULT NULL NULL,
+    CONSTRAINT tb_device_data_rollup_1d_pk UNIQUE (ontologyId, deviceId, bucketStart)
+)
+COMMENT 'Per day aggregates of tb_device_data, per device and ontologyId, computed from tb_device_data_rollup_1h. Maintained by mysql_rollup_manager';
+COMMIT;
+
+/*
+NOTE: The rollups are only kept up to date for the data written after these tables are created. Run mysql_database/python_database_modules/mysql_rollup_manager.py (or its rebuild_rollups method) once to compute them for the data already in
+tb_device_data. Since they are not affected by the device data partition expiration, the rollups keep the aggregates of the expired months
+*/
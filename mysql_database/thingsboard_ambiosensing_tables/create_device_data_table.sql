@@ -10,7 +10,13 @@ CREATE TABLE IF NOT EXISTS ambiosensing_thingsboard.tb_device_data(
     deviceId                    VARCHAR(100)    DEFAULT NULL NULL,
     tenantId                    VARCHAR(100)    DEFAULT NULL NULL,
     customerId                  VARCHAR(100)    DEFAULT NULL NULL,
-    CONSTRAINT tb_device_data_pk UNIQUE (timestamp, timeseriesKey)
+    CONSTRAINT tb_device_data_pk UNIQUE (timestamp, timeseriesKey),
+    INDEX tb_device_data_env_idx (ontologyId, deviceId, timestamp, value)
 )
 COMMENT 'Main table to store environmental data from the ThingsBoard platform collection';
-COMMIT;
\ No newline at end of file
+COMMIT;
+
+/*
+NOTE: This table is meant to be partitioned by month on the 'timestamp' column. Run mysql_database/python_database_modules/mysql_partition_manager.py (or its partition_table method) once after creating it to do so. The partitions are then kept
+up to date by mysql_partition_manager.maintain_partitions
+*/
\ No newline at end of file
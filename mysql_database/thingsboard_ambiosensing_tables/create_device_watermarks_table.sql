@@ -0,0 +1,12 @@
+DROP TABLE IF EXISTS ambiosensing_thingsboard.tb_device_watermarks;
+
+CREATE TABLE IF NOT EXISTS ambiosensing_thingsboard.tb_device_watermarks(
+    deviceId                    VARCHAR(100)    DEFAULT NULL NULL,
+    timeseriesKey               VARCHAR(100)    DEFAULT NULL NULL,
+    lastTimestamp               BIGINT          DEFAULT NULL NULL,  -- ThingsBoard timestamp (13 digit, milliseconds) of the most recent data point collected for this device/timeseriesKey pair
+    updatedTime                 DATETIME        DEFAULT NULL NULL,  -- When was this high-water mark last moved forward
+    CONSTRAINT tb_device_watermarks_pk UNIQUE (deviceId, timeseriesKey)
+)
+COMMENT 'High-water marks of the device data collection. Each record keeps the timestamp of the last data point already stored in tb_device_data for a given device and timeseriesKey, so that incremental collections only request newer data from the
+ThingsBoard remote API';
+COMMIT;
@@ -19,6 +19,11 @@ mysql_db_tables = {
     'authentication': 'tb_authentication',
     'asset_devices': 'tb_asset_devices',
     'device_data': 'tb_device_data',
+    'device_watermarks': 'tb_device_watermarks',
+    'backfill_slices': 'tb_backfill_slices',
+    'device_data_rollup_1m': 'tb_device_data_rollup_1m',
+    'device_data_rollup_1h': 'tb_device_data_rollup_1h',
+    'device_data_rollup_1d': 'tb_device_data_rollup_1d',
 }
 # --------------------------------------------- TYPE VALIDATION ----------------------------------------------------------------------------------
 # Allowed entityTypes in the ThingsBoard platform
@@ -55,15 +60,118 @@ if 'ambiosensing_logs' in base_path:
 else:
     LOG_FILE_LOCATION = os.path.join(base_path, 'ambiosensing_logs', LOG_FILENAME)
 
+# --------------------------------------------- AUTHENTICATION ----------------------------------------------------------------------------------
+# Authorization tokens are cached in memory (see mysql_auth_controller.get_auth_token) and renewed this long before their expiry date, so that a token never expires halfway through a request
+auth_token_refresh_margin = datetime.timedelta(minutes=5)
+# The optional background token refresher (mysql_auth_controller.start_token_refresher) checks the tokens every auth_token_refresher_interval seconds and renews the ones that are within auth_token_refresher_lead of their expiry date. This
+# lead has to be larger than the margin above, so that the renewal always happens in the background before any request needs it
+auth_token_refresher_interval = 60
+auth_token_refresher_lead = datetime.timedelta(minutes=10)
+
+# --------------------------------------------- HTTP CLIENT ----------------------------------------------------------------------------------
+# All the requests to the ThingsBoard REST API go through a single session with a pool of persistent connections (see ThingsBoard_REST_API.tb_http_client). The pool maxsize is the number of simultaneous connections to the server that can be
+# kept open for reuse, so it should not be lower than the number of concurrent workers used in the data collection (device_data_max_workers and backfill_max_workers)
+tb_http_pool_connections = 4
+tb_http_pool_maxsize = 16
+# Timeouts, in seconds, to establish a connection with the ThingsBoard server and to wait for a response
+tb_http_connect_timeout = 5
+tb_http_read_timeout = 60
+# Keep the connections open between requests (set it to False to close the connection after every response)
+tb_http_keep_alive = True
+# Number of records requested per page when going through the list services of the remote API (see ThingsBoard_REST_API.tb_pagination)
+tb_page_size = 100
+
 # --------------------------------------------- MySQL DATABASE ----------------------------------------------------------------------------------
 # String used to detect if a mysql_utils.MySQLDatabaseException was raised by the existence of that record already in the database.
 double_record_msg = "Duplicate entry"
 
+# Number of records to pack into each multi-row INSERT ... ON DUPLICATE KEY UPDATE statement executed by the batched table writer (database_table_updater.add_table_data_batch). Each batch is written in a single statement and committed in its
+# own transaction, so larger values mean fewer round trips but bigger statements (watch out for the server's max_allowed_packet when raising this one)
+mysql_batch_size = 500
+
+# Connection pool behind mysql_utils.connect_db. Every connection handed out by connect_db is borrowed from this pool and closing it (cnx.close()) returns it to the pool instead of tearing down the connection, which saves a full handshake and
+# authentication round trip per database access. Set mysql_pool_enabled to False to go back to one brand new connection per connect_db call.
+mysql_pool_enabled = True
+mysql_pool_name = 'ambiosensing_pool'
+# Number of connections kept in the pool. mysql.connector caps this at 32. Keep it above the number of concurrent workers that write into the database (device_data_max_workers, backfill_max_workers) plus a couple for the main thread
+mysql_pool_size = 16
+# Health checks: every pooled connection is tested (and reconnected if needed) by mysql.connector when it is checked out. If the pool is exhausted or the reconnection fails, the checkout is retried every mysql_pool_retry_delay seconds until
+# mysql_pool_checkout_timeout seconds have elapsed, at which point the error is raised to the caller
+mysql_pool_checkout_timeout = 30
+mysql_pool_retry_delay = 0.1
+# Pooled connections older than this (in seconds) are closed and re-opened when checked out, before the server's wait_timeout or any intermediate network equipment drops them. Use None to never recycle connections
+mysql_pool_recycle = 3600
+# Number of attempts to re-open a connection when recycling it
+mysql_pool_reconnect_attempts = 3
+
+# Monthly partitioning of the device data table (see mysql_partition_manager). The partition maintenance keeps partitions created for this many months past the current one
+device_data_partition_months_ahead = 3
+# Number of months of device data to keep, besides the current one. Older monthly partitions are removed by the partition maintenance. Use None to keep everything
+device_data_retention_months = None
+# Move the records of the expired partitions into archive tables (one per partition) instead of just dropping them
+device_data_archive_expired = True
+
+# Rollups of the device data (see mysql_rollup_manager): per minute, hour and day aggregates of each device/ontologyId pair, kept up to date by the device data collection and used by mysql_asset_controller.get_asset_env_data to serve bucketed
+# queries whenever the bucket allows it. Set this one to False to stop maintaining (and using) them
+device_data_rollup_enabled = True
+# When refreshing the rollups after a write, the affected minutes of the same device/ontologyId that are closer than this are refreshed as a single time range (a few more minutes recomputed in exchange for a lot less statements)
+device_data_rollup_merge_gap = datetime.timedelta(hours=1)
+
+# In-process cache of the environmental data queries (see mysql_env_data_cache). Closed time buckets (and chunks of raw data) are cached per asset and variable and only the still open ones at the end of the time window are retrieved again
+env_data_cache_enabled = True
+# Memory bound of the cached data, in bytes (estimated). The least recently used data is evicted past this
+env_data_cache_max_bytes = 64 * 1024 * 1024
+# Length of the time chunks in which the raw data points (queries without buckets) are cached
+env_data_cache_raw_chunk = datetime.timedelta(hours=1)
+# Time (in seconds) to keep the asset metadata (asset names/ids and their devices) cached
+env_data_cache_metadata_ttl = 300
+# Time after its end before a time bucket (or raw data chunk) is considered closed and can be cached. The device data is collected every few minutes and ThingsBoard itself receives some of it late, so the most recent buckets are usually still
+# incomplete: this needs to be, at least, the device data collection interval plus the ingestion lag of the platform
+env_data_cache_settle_delay = datetime.timedelta(minutes=30)
+# Maximum time (in seconds) to keep cached data. The cache is invalidated by the device data collection running in the same process only, so this bounds the time stale data can be served when the data is collected (or the asset/device
+# relations are updated) by another process. Set it to None to keep the data until evicted, but only if everything runs in the same process
+env_data_cache_max_age = 3600
+
+# --------------------------------------------- JOB EXECUTOR ----------------------------------------------------------------------------------
+# Maximum number of jobs (table synchronizations, mostly) that the job graph executor (see job_executor.run_job_graph) runs at the same time
+job_executor_max_workers = 4
+
 # --------------------------------------------- DATA MODEL ----------------------------------------------------------------------------------
 # This list contains the 'official' names for every measurement category being watched as a way to establish an
 # ontology around this. This list is needed to filter out device attributes that are returned but are not relevant
 # for this case
 ontology_names = ['temperature', 'humidity', 'carbon_dioxide', 'volatile_organic_compounds', 'lux', 'power']
 
+# Aggregation functions supported by mysql_asset_controller.get_asset_env_data when the environmental data is requested in time buckets (downsampled by the database) instead of as raw data points
+env_data_aggregations = ['avg', 'min', 'max', 'count', 'last']
+
 # Use this parameter as default time window to retrieve environmental data from the remote server
 default_collection_time_limit = datetime.timedelta(hours=24)
+
+# Incremental collections (see mysql_telemetry_controller.populate_device_data_table) request each device's data from this long before its high-water marks. ThingsBoard accepts data points with past timestamps (buffered gateways, late uploads),
+# so the points that arrive late, up to this much older than the last point collected, are still picked up by the next run. The points already collected are simply written again (to the same values)
+device_data_watermark_overlap = datetime.timedelta(hours=1)
+
+# Time-sliced retrieval of device data (see tb_telemetry_controller.getTimeseriesStream). The requested time window is split into sub-windows, each one requested separately with the limit below. A sub-window that comes back with as many data points
+# as the limit (for any of the timeseries keys) was truncated by the remote API, so it gets halved and requested again, down to the minimum sub-window. Sub-windows that come back with less than the sparse ratio of the limit double the next
+# sub-window, up to the maximum one.
+timeseries_stream_limit = 10000
+timeseries_stream_initial_window = datetime.timedelta(hours=6)
+timeseries_stream_min_window = datetime.timedelta(minutes=1)
+timeseries_stream_max_window = datetime.timedelta(days=7)
+timeseries_stream_sparse_ratio = 0.25
+
+# Number of devices whose data is retrieved simultaneously from the ThingsBoard server when populating the device data table in concurrent mode (see mysql_telemetry_controller.populate_device_data_table). Keep it modest: every worker
+# is an open request against the remote server
+device_data_max_workers = 8
+
+# Number of simultaneous timeseries keys requests placed to the remote server while synchronizing the devices table (see mysql_device_controller.update_devices_table)
+device_sync_max_workers = 8
+
+# Maximum number of relation queries (one per asset) in flight at the same time while synchronizing the asset devices table (see mysql_entity_relation_controller.update_asset_devices_table)
+relation_sync_max_workers = 8
+
+# Historical backfills (see mysql_telemetry_controller.backfill_device_data) split the requested period into slices of this size per device. Each slice is an independent unit of work, whose completion is registered in the database so that an
+# interrupted backfill can resume from where it stopped. The slices are retrieved concurrently, across all devices, with at most backfill_max_workers simultaneous requests to the remote server
+backfill_slice_size = datetime.timedelta(days=1)
+backfill_max_workers = 8
@@ -0,0 +1,117 @@
+""" Checks of the query plans built by mysql_query_planner.plan_env_data_query for the edge cases of the time window: budgets too small to honour, windows shorter than the bucket and partial buckets at both ends of the window. The planner
+doesn't access the database, but it imports the modules that do, so these only run where the project dependencies (mysql-connector-python and requests) are installed. Run them from the project folder with:
+    python -m unittest discover -s tests """
+
+import os
+import datetime
+import importlib.util
+import unittest
+import unittest.mock
+
+dependencies_installed = importlib.util.find_spec('requests') is not None and importlib.util.find_spec('mysql') is not None and importlib.util.find_spec('mysql.connector') is not None
+
+if dependencies_installed:
+    import utils
+    import proj_config
+    from mysql_database.python_database_modules import mysql_query_planner
+
+
+@unittest.skipUnless(dependencies_installed, "mysql-connector-python and/or requests are not installed")
+class PlanEnvDataQueryTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # The planner logs through ambi_logger, which writes into the project logs folder
+        os.makedirs(os.path.dirname(proj_config.LOG_FILE_LOCATION), exist_ok=True)
+
+    def assert_segments(self, plan, expected_segment_list):
+        """
+        Compares the segments of a plan with the (kind, start, end, end_inclusive, bucket, source) tuples expected.
+        """
+        self.assertEqual([(segment['kind'], segment['start'], segment['end'], segment['end_inclusive'], segment['bucket'], segment['source']) for segment in plan['segment_list']], expected_segment_list)
+
+    def count_points(self, plan):
+        """
+        Returns the maximum number of data points per variable that the plan can return: one per bucket in each segment, plus one for the data at the end of the last segment if it falls on a bucket boundary of that segment.
+        """
+        point_count = 0
+
+        for segment in plan['segment_list']:
+            point_count += ((segment['end'] - segment['start']) + segment['bucket'] - datetime.timedelta(seconds=1)) // segment['bucket']
+
+            if segment['end_inclusive'] and (segment['end'] - segment['start']) % segment['bucket'] == datetime.timedelta(0):
+                point_count += 1
+
+        return point_count
+
+    def test_raw_plan(self):
+        plan = mysql_query_planner.plan_env_data_query(start_date=datetime.datetime(2024, 1, 1, 0, 10), end_date=datetime.datetime(2024, 1, 1, 5, 30))
+
+        self.assertIsNone(plan['bucket'])
+        self.assert_segments(plan, [('single', datetime.datetime(2024, 1, 1, 0, 10), datetime.datetime(2024, 1, 1, 5, 30), True, None, 'raw')])
+
+    def test_budget_below_three(self):
+        for max_points in [-1, 0, 1, 2]:
+            with self.assertRaises(utils.InputValidationException):
+                mysql_query_planner.plan_env_data_query(start_date=datetime.datetime(2024, 1, 1), end_date=datetime.datetime(2024, 1, 2), max_points=max_points)
+
+    def test_budget_is_respected(self):
+        start_date_list = [datetime.datetime(2024, 1, 1), datetime.datetime(2024, 1, 1, 0, 10, 5), datetime.datetime(2024, 1, 1, 7, 59)]
+        window_list = [datetime.timedelta(minutes=10), datetime.timedelta(hours=5, minutes=20), datetime.timedelta(days=1), datetime.timedelta(days=45, hours=3)]
+
+        for start_date in start_date_list:
+            for window in window_list:
+                for max_points in [3, 4, 10, 100]:
+                    plan = mysql_query_planner.plan_env_data_query(start_date=start_date, end_date=start_date + window, max_points=max_points)
+
+                    self.assertLessEqual(self.count_points(plan), max_points, msg="start_date = {0}, window = {1}, max_points = {2}".format(str(start_date), str(window), str(max_points)))
+
+    def test_window_shorter_than_bucket(self):
+        # Within a single bucket of the grid: a single partial bucket, identified by start_date
+        plan = mysql_query_planner.plan_env_data_query(start_date=datetime.datetime(2024, 1, 1, 0, 10), end_date=datetime.datetime(2024, 1, 1, 1, 30), bucket=datetime.timedelta(hours=2))
+
+        self.assert_segments(plan, [('head', datetime.datetime(2024, 1, 1, 0, 10), datetime.datetime(2024, 1, 1, 1, 30), True, datetime.timedelta(hours=1, minutes=50), '1m')])
+
+        # Across a bucket boundary: the two partial buckets, split at the boundary of the grid (and not at start_date + bucket)
+        plan = mysql_query_planner.plan_env_data_query(start_date=datetime.datetime(2024, 1, 1, 1, 30), end_date=datetime.datetime(2024, 1, 1, 2, 40), bucket=datetime.timedelta(hours=2))
+
+        self.assert_segments(plan, [('head', datetime.datetime(2024, 1, 1, 1, 30), datetime.datetime(2024, 1, 1, 2), False, datetime.timedelta(minutes=30), '1m'),
+                                    ('tail', datetime.datetime(2024, 1, 1, 2), datetime.datetime(2024, 1, 1, 2, 40), True, datetime.timedelta(hours=2), '1m')])
+
+    def test_grid_aligned_head_and_tail(self):
+        plan = mysql_query_planner.plan_env_data_query(start_date=datetime.datetime(2024, 1, 1, 0, 10), end_date=datetime.datetime(2024, 1, 1, 5, 30), bucket=datetime.timedelta(hours=2))
+
+        self.assert_segments(plan, [('head', datetime.datetime(2024, 1, 1, 0, 10), datetime.datetime(2024, 1, 1, 2), False, datetime.timedelta(hours=1, minutes=50), '1m'),
+                                    ('middle', datetime.datetime(2024, 1, 1, 2), datetime.datetime(2024, 1, 1, 4), False, datetime.timedelta(hours=2), '1h'),
+                                    ('tail', datetime.datetime(2024, 1, 1, 4), datetime.datetime(2024, 1, 1, 5, 30), True, datetime.timedelta(hours=2), '1m')])
+
+    def test_aligned_window(self):
+        # No head nor tail: the middle is the last segment, so it's the one including end_date
+        plan = mysql_query_planner.plan_env_data_query(start_date=datetime.datetime(2024, 1, 1, 2), end_date=datetime.datetime(2024, 1, 1, 6), bucket=datetime.timedelta(hours=2))
+
+        self.assert_segments(plan, [('middle', datetime.datetime(2024, 1, 1, 2), datetime.datetime(2024, 1, 1, 6), True, datetime.timedelta(hours=2), '1h')])
+
+    def test_sliding_window_keeps_the_grid(self):
+        bucket = datetime.timedelta(hours=2)
+        end_date = datetime.datetime(2024, 1, 3, 5, 30)
+
+        for window in [datetime.timedelta(minutes=20), datetime.timedelta(hours=3), datetime.timedelta(hours=30)]:
+            plan = mysql_query_planner.plan_env_data_query(start_date=end_date - window, end_date=end_date, bucket=bucket)
+
+            # Every segment but the head starts on the grid, whatever the window length
+            for segment in plan['segment_list']:
+                if segment['kind'] != 'head':
+                    self.assertEqual((segment['start'] - mysql_query_planner.bucket_grid_origin) % bucket, datetime.timedelta(0))
+
+            # And exactly one segment, the last one, includes its end
+            self.assertEqual([segment['end_inclusive'] for segment in plan['segment_list']], [False] * (len(plan['segment_list']) - 1) + [True])
+
+    def test_rollups_disabled(self):
+        with unittest.mock.patch.object(proj_config, 'device_data_rollup_enabled', False):
+            plan = mysql_query_planner.plan_env_data_query(start_date=datetime.datetime(2024, 1, 1, 0, 10), end_date=datetime.datetime(2024, 1, 1, 5, 30), bucket=datetime.timedelta(hours=2))
+
+        self.assertEqual([segment['source'] for segment in plan['segment_list']], ['raw', 'raw', 'raw'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,18 @@
 import requests
-import ast
+from ThingsBoard_REST_API import tb_http_client
+import json
 import user_config
 import traceback
 import ambi_logger
 import logging
 import proj_config
 
+# orjson is an optional (but much faster) JSON parser. Use it to decode the remote API responses if it is installed, otherwise the standard json module does the job just as well (only slower)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 # -------------------------------------------------------------------- CUSTOM EXCEPTIONS -----------------------------------------------------------------------
 class AuthenticationException(Exception):
@@ -139,8 +146,8 @@ def _get_new_session_token(connection_dict):
     # utility. The structure of the command is slightly different but in the end it yields to the same.
     new_session_log.info("Requesting {0}...".format(str(con_url)))
     try:
-        response = requests.post(url=con_url, data=con_data, headers=con_headers)
-    except (requests.exceptions.ConnectionError, requests.exceptions.ConnectTimeout):
+        response = tb_http_client.post(url=con_url, data=con_data, headers=con_headers)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
         error_msg = "Unable to establish a connection with {0}. Exiting...".format(str(str(user_config.thingsboard_host) + ":" + str(user_config.thingsboard_port)))
         new_session_log.error(error_msg)
         raise AuthenticationException(error_msg)
@@ -153,7 +160,7 @@ def _get_new_session_token(connection_dict):
 
     # The required token is returned initially in a text (string) form, but its actually a dictionary
     # casted into a string. So, for simplicity sake, return the returned string to its dictionary form and return it
-    return ast.literal_eval(response.text)
+    return decode_json_response(response.text)
 
 
 # DEPRECATED: use mysql_database.python_database_modules.mysql_auth_controller.get_auth_token() or ThingsBoard_REST_API.tb_auth_controller.refresh_session_tokens() instead
@@ -559,6 +566,36 @@ def translate_postgres_to_python(response_text):
     return response_text.replace('null', 'None').replace('true', 'True').replace('false', 'False')
 
 
+def decode_json_response(response_text):
+    """This method converts the body of a response from the remote API (which comes as a JSON str) into the equivalent Python structure (dict, list, etc.). This is the replacement for the eval(translate_postgres_to_python(response.text)) approach
+    used so far, which had a couple of serious problems: it went through the whole body three times (one per str.replace) and then ran the Python compiler on it, which is painfully slow for large telemetry responses, and the blind replacement of
+    'null', 'true' and 'false' corrupted any value that happened to contain one of these terms (device names and descriptions, for instance). A real JSON parser does the proper conversion (null -> None, true -> True and false -> False) without
+    any of these issues. The orjson parser is used if available, otherwise the method falls back to the standard json module.
+    @:param response_text (str) - The text parameter from the response obtained, as it, from the HTTP request to the remote API
+    @:return response (dict or list) - The decoded response body
+    @:raise InputValidationException - If the input fails validation
+    @:raise ServiceEndpointException - If the response body is not valid JSON
+    """
+    decode_log = ambi_logger.get_logger(__name__)
+
+    try:
+        validate_input_type(response_text, str)
+    except InputValidationException as ive:
+        decode_log.error(ive.message)
+        raise ive
+
+    try:
+        if orjson is not None:
+            return orjson.loads(response_text)
+        else:
+            return json.loads(response_text)
+    # Both json.JSONDecodeError and orjson.JSONDecodeError are ValueError sub classes
+    except ValueError as ve:
+        error_msg = "Unable to decode the response from the remote API: {0}. Response body (first 200 chars): {1}".format(str(ve), str(response_text[:200]))
+        decode_log.error(error_msg)
+        raise ServiceEndpointException(message=error_msg)
+
+
 def translate_mysql_to_python(data_tuple):
     """So, it seems that I also need to take care in converting whatever I read from the MySQL databases into Python-speak too. Interestingly enough, I don't need to worry about the inverse apparently: the mysql.connector already deals with it.
     Given that this module is a python to mysql interface of sorts, it seems only logic that it also concerns itself with the different nomenclatures used between the two platforms. I've been passing Nones, Trues and Falses in SQL strings to be